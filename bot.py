@@ -2,12 +2,21 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, CommandObject
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.types import (
+    Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, BufferedInputFile, InputMediaPhoto
+)
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from neuroapi import neuroapi_client
-from config import BOT_TOKEN, MODELS, DEFAULT_MODEL, YANDEX_VOICES
+from config import (
+    BOT_TOKEN, MODELS, DEFAULT_MODEL, YANDEX_VOICES, MEDIA_GROUP_COLLECT_DELAY,
+    DOCUMENT_MIME_TYPES, DOCUMENT_PROGRESS_INTERVAL, VOICE_STREAMING_MIN_DURATION,
+    TRANSCRIPTION_PROGRESS_INTERVAL, IMAGE_PRESETS, DEFAULT_IMAGE_PRESET, IMAGE_PREVIEW_INTERVAL,
+    IMAGE_OUTPUT_FORMAT, OCR_RECOGNIZERS
+)
+from typing import Dict, List, Set
+import html
 import io
 
 # Настраиваем логирование
@@ -22,6 +31,14 @@ bot = Bot(token=BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+# Буфер фото альбомов: media_group_id -> сообщения, пришедшие в окне сбора
+media_group_buffers: Dict[str, List[Message]] = {}
+# Задачи обработки альбомов: event loop хранит только слабые ссылки на задачи
+media_group_tasks: Set[asyncio.Task] = set()
+
+# Расширения файлов сгенерированных изображений по формату
+IMAGE_FILE_EXTENSIONS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
 # Определяем состояния для генерации изображений
 class ImageGenerationStates(StatesGroup):
     waiting_for_prompt = State()
@@ -48,6 +65,37 @@ def create_voice_keyboard() -> InlineKeyboardMarkup:
         keyboard.append([button])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def create_ocr_keyboard() -> InlineKeyboardMarkup:
+    """Создать клавиатуру с профилями распознавания текста"""
+    keyboard = []
+    for recognizer_id, recognizer_info in OCR_RECOGNIZERS.items():
+        button = InlineKeyboardButton(
+            text=f"{recognizer_info['name']}",
+            callback_data=f"ocr_{recognizer_id}"
+        )
+        keyboard.append([button])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def create_image_preset_keyboard() -> InlineKeyboardMarkup:
+    """Создать клавиатуру с пресетами качества изображения"""
+    keyboard = []
+    for preset_id, preset_info in IMAGE_PRESETS.items():
+        button = InlineKeyboardButton(
+            text=f"{preset_info['name']}",
+            callback_data=f"preset_{preset_id}"
+        )
+        keyboard.append([button])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def image_prompt_request_text(preset_id: str) -> str:
+    """Текст запроса описания изображения с выбранным пресетом"""
+    preset_info = IMAGE_PRESETS[preset_id]
+    return (
+        f"🎨 Опишите изображение для генерации:\n\n"
+        f"Качество: {preset_info['name']} ({preset_info['description']})\n"
+        f"Выбрать другое качество можно кнопками ниже"
+    )
+
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
     """Обработчик команды /start"""
@@ -169,6 +217,7 @@ async def cmd_help(message: Message):
 /model - выбрать модель
 /current - показать текущую модель
 /generate_image - сгенерировать изображение
+/ocr - выбрать профиль распознавания текста на фото и в документах
 
 Голосовые команды:
 /voice_mode_on - включить голосовые ответы
@@ -283,8 +332,19 @@ async def cmd_voice_status(message: Message):
 @dp.message(Command("generate_image"))
 async def cmd_generate_image(message: Message, state: FSMContext):
     """Команда для генерации изображения"""
-    await message.answer("🎨 Опишите изображение для генерации:")
+    await message.answer(
+        image_prompt_request_text(DEFAULT_IMAGE_PRESET),
+        reply_markup=create_image_preset_keyboard()
+    )
     await state.set_state(ImageGenerationStates.waiting_for_prompt)
+    await state.update_data(image_preset=DEFAULT_IMAGE_PRESET)
+
+async def show_image_error(status_message: Message, text: str):
+    """Сообщение об ошибке генерации: в подписи превью или в тексте статусного сообщения"""
+    if status_message.photo:
+        await status_message.edit_caption(caption=text)
+    else:
+        await status_message.edit_text(text)
 
 @dp.message(ImageGenerationStates.waiting_for_prompt)
 async def process_image_prompt(message: Message, state: FSMContext):
@@ -296,40 +356,73 @@ async def process_image_prompt(message: Message, state: FSMContext):
         await message.answer("Пожалуйста, отправьте текстовое описание изображения.")
         return
     
+    data = await state.get_data()
+    preset = data.get("image_preset", DEFAULT_IMAGE_PRESET)
+    
     # Отправляем сообщение о начале генерации
     processing_message = await message.answer("🎨 Генерирую изображение, пожалуйста подождите...")
+    # Сообщение с превью: появляется с первым превью и обновляется до готового изображения
+    preview_message = None
+    last_preview = 0.0
+    loop = asyncio.get_event_loop()
+    
+    async def show_preview(preview: bytes, step: int, total: int):
+        nonlocal preview_message, last_preview
+        # Не чаще раза в IMAGE_PREVIEW_INTERVAL, чтобы не упираться в лимиты Telegram
+        if loop.time() - last_preview < IMAGE_PREVIEW_INTERVAL:
+            return
+        last_preview = loop.time()
+        preview_file = BufferedInputFile(file=preview, filename="preview.jpg")
+        caption = f"🎨 Генерирую изображение... шаг {step}/{total}"
+        try:
+            if preview_message is None:
+                preview_message = await bot.send_photo(
+                    chat_id=message.chat.id, photo=preview_file, caption=caption
+                )
+                await processing_message.delete()
+            else:
+                await preview_message.edit_media(InputMediaPhoto(media=preview_file, caption=caption))
+        except Exception as preview_error:
+            logger.debug(f"Не удалось обновить превью изображения: {preview_error}")
     
     try:
         await bot.send_chat_action(chat_id=message.chat.id, action="upload_photo")
         
         # Генерируем изображение
-        image_data = await neuroapi_client.generate_image(prompt)
+        image_data = await neuroapi_client.generate_image(prompt, preset, on_preview=show_preview)
         
         if image_data:
             # Отправляем изображение
-            from aiogram.types import BufferedInputFile
-            
             image_file = BufferedInputFile(
                 file=image_data,
-                filename="generated_image.png"
+                filename=f"generated_image.{IMAGE_FILE_EXTENSIONS.get(IMAGE_OUTPUT_FORMAT, 'png')}"
             )
+            caption = f"🎨 Сгенерированное изображение по запросу:\n<i>{html.escape(prompt)}</i>"
             
-            await processing_message.delete()
-            await bot.send_photo(
-                chat_id=message.chat.id,
-                photo=image_file,
-                caption=f"🎨 Сгенерированное изображение по запросу:\n<i>{prompt}</i>",
-                parse_mode="HTML"
-            )
+            if preview_message is not None:
+                # Готовое изображение заменяет превью в том же сообщении
+                await preview_message.edit_media(
+                    InputMediaPhoto(media=image_file, caption=caption, parse_mode="HTML")
+                )
+            else:
+                await processing_message.delete()
+                await bot.send_photo(
+                    chat_id=message.chat.id,
+                    photo=image_file,
+                    caption=caption,
+                    parse_mode="HTML"
+                )
         else:
-            await processing_message.edit_text(
+            await show_image_error(
+                preview_message or processing_message,
                 "❌ Произошла ошибка при генерации изображения. "
                 "Попробуйте еще раз или измените описание."
             )
     
     except Exception as e:
         logger.error(f"Ошибка при генерации изображения для пользователя {user_id}: {e}")
-        await processing_message.edit_text(
+        await show_image_error(
+            preview_message or processing_message,
             "❌ Произошла ошибка при генерации изображения. Попробуйте позже."
         )
     
@@ -364,6 +457,93 @@ async def process_voice_selection(callback_query: CallbackQuery):
         logger.error(f"Ошибка при выборе голоса: {e}")
         await callback_query.answer("❌ Произошла ошибка при выборе голоса")
 
+@dp.message(Command("ocr"))
+async def cmd_ocr(message: Message):
+    """Показать меню выбора профиля распознавания текста"""
+    user_id = message.from_user.id
+    current_recognizer = neuroapi_client.get_user_ocr_recognizer(user_id)
+    
+    recognizers_text = "<b>🔍 Профиль распознавания текста:</b>\n\n"
+    for recognizer_id, recognizer_info in OCR_RECOGNIZERS.items():
+        current_mark = "✅ " if recognizer_id == current_recognizer else ""
+        recognizers_text += f"{current_mark}<b>{recognizer_info['name']}</b>\n"
+        recognizers_text += f"└ {recognizer_info['description']}\n\n"
+    
+    await message.answer(recognizers_text, parse_mode="HTML", reply_markup=create_ocr_keyboard())
+
+@dp.callback_query(lambda c: c.data.startswith('ocr_'))
+async def process_ocr_selection(callback_query: CallbackQuery):
+    """Обработчик выбора профиля распознавания через инлайн-кнопки"""
+    try:
+        recognizer_id = callback_query.data.replace('ocr_', '', 1)
+        user_id = callback_query.from_user.id
+        
+        if not neuroapi_client.set_user_ocr_recognizer(user_id, recognizer_id):
+            await callback_query.answer("❌ Ошибка: профиль не найден")
+            return
+        
+        recognizer_info = OCR_RECOGNIZERS[recognizer_id]
+        await callback_query.message.edit_text(
+            f"✅ Профиль распознавания изменен на {recognizer_info['name']}.\n"
+            f"Описание: {recognizer_info['description']}"
+        )
+        await callback_query.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка при выборе профиля распознавания: {e}")
+        await callback_query.answer("❌ Произошла ошибка при выборе профиля")
+
+@dp.callback_query(lambda c: c.data.startswith('preset_'))
+async def process_image_preset_selection(callback_query: CallbackQuery, state: FSMContext):
+    """Обработчик выбора пресета качества изображения через инлайн-кнопки"""
+    try:
+        preset_id = callback_query.data.replace('preset_', '')
+        
+        if preset_id not in IMAGE_PRESETS:
+            await callback_query.answer("❌ Ошибка: пресет не найден")
+            return
+        
+        # Пресет применяется к описанию, которое пользователь отправит следующим
+        await state.set_state(ImageGenerationStates.waiting_for_prompt)
+        await state.update_data(image_preset=preset_id)
+        
+        await callback_query.message.edit_text(
+            image_prompt_request_text(preset_id),
+            reply_markup=create_image_preset_keyboard()
+        )
+        await callback_query.answer(f"Качество: {IMAGE_PRESETS[preset_id]['name']}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка при выборе пресета изображения: {e}")
+        await callback_query.answer("❌ Произошла ошибка при выборе качества")
+
+async def transcribe_voice_streaming(processing_message: Message, voice_data: bytes) -> str:
+    """Потоковая транскрибация с постепенным показом распознанного текста"""
+    segments: List[str] = []
+    last_edit = 0.0
+    loop = asyncio.get_event_loop()
+    
+    async for event in neuroapi_client.stream_transcription(voice_data):
+        if event["type"] == "error":
+            return event["error"]
+        if event["type"] == "done":
+            break
+        segments.append(event["text"])
+        
+        # Показываем уже распознанную часть, не чаще раза в TRANSCRIPTION_PROGRESS_INTERVAL
+        if loop.time() - last_edit >= TRANSCRIPTION_PROGRESS_INTERVAL:
+            last_edit = loop.time()
+            partial_text = html.escape(" ".join(segments))[-4000:]
+            try:
+                await processing_message.edit_text(
+                    f"<i>Распознанный текст:</i>\n{partial_text} ⏳", parse_mode="HTML"
+                )
+            except Exception as edit_error:
+                logger.debug(f"Не удалось обновить распознаваемый текст: {edit_error}")
+    
+    transcribed_text = " ".join(segments).strip()
+    return transcribed_text or "Ошибка: не удалось распознать речь в аудио."
+
 @dp.message(F.voice)
 async def handle_voice_message(message: Message):
     """Обработчик голосовых сообщений"""
@@ -373,19 +553,31 @@ async def handle_voice_message(message: Message):
     processing_message = await message.answer("🎤 Аудио получено, обрабатываю...")
     
     try:
-        # Скачиваем аудиофайл
-        voice_file = await bot.get_file(message.voice.file_id)
-        voice_io = await bot.download_file(voice_file.file_path)
-        
-        # Распознаем речь
-        transcribed_text = await neuroapi_client.transcribe_audio(voice_io.read())
+        # Пересланное сообщение уже могло быть распознано - тогда не скачиваем его
+        transcribed_text = neuroapi_client.get_cached_transcription(message.voice.file_unique_id)
         
-        if transcribed_text.startswith("Ошибка:"):
-            await processing_message.edit_text(transcribed_text)
-            return
+        if transcribed_text is None:
+            # Скачиваем аудиофайл
+            voice_file = await bot.get_file(message.voice.file_id)
+            voice_io = await bot.download_file(voice_file.file_path)
+            voice_data = voice_io.read()
+            
+            # Распознаем речь: длинные сообщения - потоково, с показом текста по мере готовности
+            if (message.voice.duration or 0) >= VOICE_STREAMING_MIN_DURATION:
+                transcribed_text = await transcribe_voice_streaming(processing_message, voice_data)
+            else:
+                transcribed_text = await neuroapi_client.transcribe_audio(voice_data)
+            
+            if transcribed_text.startswith("Ошибка:"):
+                await processing_message.edit_text(transcribed_text)
+                return
+            
+            neuroapi_client.cache_transcription(message.voice.file_unique_id, transcribed_text)
             
         # Показываем распознанный текст
-        await processing_message.edit_text(f"<i>Распознанный текст:</i>\n{transcribed_text}", parse_mode="HTML")
+        await processing_message.edit_text(
+            f"<i>Распознанный текст:</i>\n{html.escape(transcribed_text)}", parse_mode="HTML"
+        )
         
         # Отправляем "печатает..."
         typing_message = await message.answer("...")
@@ -394,85 +586,168 @@ async def handle_voice_message(message: Message):
         # Генерируем ответ
         response = await neuroapi_client.generate_response(user_id, transcribed_text)
         
-        # Проверяем, включен ли голосовой режим
-        if neuroapi_client.is_voice_mode_enabled(user_id):
-            # Удаляем сообщение с точками
-            await typing_message.delete()
+        await send_ai_response(message, user_id, response, typing_message)
+
+    except Exception as e:
+        logger.error(f"Ошибка при обработке голосового сообщения от {user_id}: {e}")
+        await processing_message.edit_text("Произошла ошибка при обработке вашего голосового сообщения.")
+
+async def send_ai_response(message: Message, user_id: int, response: str, typing_message: Message):
+    """Отправить ответ ИИ текстом или голосом в зависимости от режима пользователя"""
+    # Проверяем, включен ли голосовой режим
+    if neuroapi_client.is_voice_mode_enabled(user_id):
+        # Удаляем сообщение с точками
+        await typing_message.delete()
+        
+        # Отправляем сообщение о генерации голоса
+        voice_message = await message.answer("🎤 Генерирую голосовое сообщение...")
+        
+        # Получаем голос пользователя
+        user_voice = neuroapi_client.get_user_voice(user_id)
+        
+        # Синтезируем речь
+        audio_data = await neuroapi_client.synthesize_speech(response, user_voice)
+        
+        if audio_data:
+            # Отправляем голосовое сообщение
+            from aiogram.types import BufferedInputFile
             
-            # Отправляем сообщение о генерации голоса
-            voice_message = await message.answer("🎤 Генерирую голосовое сообщение...")
+            audio_file = BufferedInputFile(
+                file=audio_data,
+                filename="voice_response.ogg"
+            )
             
-            # Получаем голос пользователя
-            user_voice = neuroapi_client.get_user_voice(user_id)
+            await voice_message.delete()
+            await bot.send_voice(
+                chat_id=message.chat.id,
+                voice=audio_file
+            )
             
-            # Синтезируем речь
-            audio_data = await neuroapi_client.synthesize_speech(response, user_voice)
+            # Также отправляем текстовую версию для удобства
+            text_prefix = "<i>Текст:</i> "
+            max_length = 4096 - len(text_prefix)
             
-            if audio_data:
-                # Отправляем голосовое сообщение
-                from aiogram.types import BufferedInputFile
-                
-                audio_file = BufferedInputFile(
-                    file=audio_data,
-                    filename="voice_response.ogg"
-                )
-                
-                await voice_message.delete()
-                await bot.send_voice(
-                    chat_id=message.chat.id,
-                    voice=audio_file
-                )
-                
-                # Также отправляем текстовую версию для удобства
-                text_prefix = "<i>Текст:</i> "
-                max_length = 4096 - len(text_prefix)
-                
-                if len(response) > max_length:
-                    # Разбиваем на части
-                    for i in range(0, len(response), max_length):
-                        chunk = response[i:i+max_length]
-                        if i == 0:
-                            await message.answer(f"{text_prefix}{chunk}", parse_mode="HTML")
-                        else:
-                            await message.answer(chunk)
-                else:
-                    await message.answer(f"{text_prefix}{response}", parse_mode="HTML")
+            if len(response) > max_length:
+                # Разбиваем на части
+                for i in range(0, len(response), max_length):
+                    chunk = response[i:i+max_length]
+                    if i == 0:
+                        await message.answer(f"{text_prefix}{chunk}", parse_mode="HTML")
+                    else:
+                        await message.answer(chunk)
             else:
-                # Если не удалось синтезировать речь, отправляем текстом
-                await voice_message.edit_text(
-                    f"❌ Не удалось синтезировать речь. Отправляю текстом:\n\n{response}"
-                )
+                await message.answer(f"{text_prefix}{response}", parse_mode="HTML")
         else:
-            # Обычный текстовый режим
-            if len(response) > 4096:
-                await typing_message.delete()
-                for i in range(0, len(response), 4096):
-                    await message.answer(response[i:i+4096])
-            else:
-                await typing_message.edit_text(response)
-
+            # Если не удалось синтезировать речь, отправляем текстом
+            await voice_message.edit_text(
+                f"❌ Не удалось синтезировать речь. Отправляю текстом:\n\n{response}"
+            )
+    else:
+        # Обычный текстовый режим
+        if len(response) > 4096:
+            await typing_message.delete()
+            for i in range(0, len(response), 4096):
+                await message.answer(response[i:i+4096])
+        else:
+            await typing_message.edit_text(response)
+
+async def download_photo(message: Message) -> bytes:
+    """Скачать самое большое изображение из сообщения"""
+    photo_file = await bot.get_file(message.photo[-1].file_id)
+    photo_io = await bot.download_file(photo_file.file_path)
+    return photo_io.read()
+
+def collect_media_group_photo(message: Message):
+    """Добавить фото альбома в буфер; первое фото запускает отложенную обработку альбома"""
+    group = media_group_buffers.setdefault(message.media_group_id, [])
+    group.append(message)
+    if len(group) == 1:
+        task = asyncio.create_task(process_media_group(message.media_group_id))
+        media_group_tasks.add(task)
+        task.add_done_callback(media_group_tasks.discard)
+
+async def process_media_group(media_group_id: str):
+    """Обработка альбома: один пакетный OCR и один запрос к ИИ на все изображения"""
+    # Ждем, пока Telegram доставит остальные фото альбома
+    await asyncio.sleep(MEDIA_GROUP_COLLECT_DELAY)
+    messages = sorted(media_group_buffers.pop(media_group_id, []), key=lambda m: m.message_id)
+    if not messages:
+        return
+    
+    message = messages[0]
+    user_id = message.from_user.id
+    processing_message = await message.answer(f"🖼️ Получено изображений: {len(messages)}, распознаю текст...")
+    
+    try:
+        # Скачиваем все изображения параллельно
+        images = await asyncio.gather(*(download_photo(m) for m in messages))
+        
+        # Распознаем текст одним пакетным запросом
+        extracted_texts = await neuroapi_client.extract_text_from_images(
+            list(images), neuroapi_client.get_user_ocr_recognizer(user_id)
+        )
+        
+        if extracted_texts and all(text.startswith("Ошибка:") for text in extracted_texts):
+            await processing_message.edit_text(extracted_texts[0])
+            return
+        
+        recognized = [
+            (number, text.strip())
+            for number, text in enumerate(extracted_texts, start=1)
+            if not text.startswith("Ошибка:") and text.strip()
+        ]
+        
+        if not recognized:
+            await processing_message.edit_text("На изображениях не найден текст для распознавания.")
+            return
+        
+        # Показываем распознанный текст
+        recognized_text = "\n\n".join(f"Изображение {number}:\n{text}" for number, text in recognized)
+        display_text = f"📝 Распознанный текст:\n\n{recognized_text}"
+        await processing_message.edit_text(display_text[:4096])
+        for i in range(4096, len(display_text), 4096):
+            await message.answer(display_text[i:i+4096])
+        
+        # Генерируем один ответ на весь альбом
+        typing_message = await message.answer("💭 Анализирую текст...")
+        await bot.send_chat_action(chat_id=message.chat.id, action="typing")
+        
+        texts_for_prompt = "\n\n".join(f"Изображение {number}: '{text}'" for number, text in recognized)
+        ai_prompt = (
+            f"Пользователь прислал альбом из {len(messages)} изображений с текстом. "
+            f"Распознанный текст:\n\n{texts_for_prompt}\n\n"
+            "Проанализируй этот текст и дай полезный ответ или комментарий."
+        )
+        
+        response = await neuroapi_client.generate_response(user_id, ai_prompt)
+        
+        await send_ai_response(message, user_id, response, typing_message)
+    
     except Exception as e:
-        logger.error(f"Ошибка при обработке голосового сообщения от {user_id}: {e}")
-        await processing_message.edit_text("Произошла ошибка при обработке вашего голосового сообщения.")
+        logger.error(f"Ошибка при обработке альбома от пользователя {user_id}: {e}")
+        await processing_message.edit_text("Произошла ошибка при обработке изображений.")
 
 @dp.message(F.photo)
 async def handle_photo_message(message: Message):
     """Обработчик изображений с OCR"""
     user_id = message.from_user.id
     
+    # Фото из альбома обрабатываются вместе после сбора всей группы
+    if message.media_group_id:
+        collect_media_group_photo(message)
+        return
+    
     # Отправляем сообщение о том, что изображение получено
     processing_message = await message.answer("🖼️ Изображение получено, распознаю текст...")
     
     try:
-        # Получаем самое большое изображение
-        photo = message.photo[-1]
-        
-        # Скачиваем изображение
-        photo_file = await bot.get_file(photo.file_id)
-        photo_io = await bot.download_file(photo_file.file_path)
+        # Скачиваем самое большое изображение
+        image_data = await download_photo(message)
         
         # Распознаем текст
-        extracted_text = await neuroapi_client.extract_text_from_image(photo_io.read())
+        extracted_text = await neuroapi_client.extract_text_from_image(
+            image_data, neuroapi_client.get_user_ocr_recognizer(user_id)
+        )
         
         if extracted_text.startswith("Ошибка:"):
             await processing_message.edit_text(extracted_text)
@@ -497,68 +772,101 @@ async def handle_photo_message(message: Message):
         
         response = await neuroapi_client.generate_response(user_id, ai_prompt)
         
-        # Проверяем, включен ли голосовой режим
-        if neuroapi_client.is_voice_mode_enabled(user_id):
-            # Удаляем сообщение с точками
-            await typing_message.delete()
-            
-            # Отправляем сообщение о генерации голоса
-            voice_message = await message.answer("🎤 Генерирую голосовое сообщение...")
-            
-            # Получаем голос пользователя
-            user_voice = neuroapi_client.get_user_voice(user_id)
-            
-            # Синтезируем речь
-            audio_data = await neuroapi_client.synthesize_speech(response, user_voice)
-            
-            if audio_data:
-                # Отправляем голосовое сообщение
-                from aiogram.types import BufferedInputFile
-                
-                audio_file = BufferedInputFile(
-                    file=audio_data,
-                    filename="voice_response.ogg"
-                )
-                
-                await voice_message.delete()
-                await bot.send_voice(
-                    chat_id=message.chat.id,
-                    voice=audio_file
-                )
-                
-                # Также отправляем текстовую версию для удобства
-                text_prefix = "<i>Текст:</i> "
-                max_length = 4096 - len(text_prefix)
-                
-                if len(response) > max_length:
-                    # Разбиваем на части
-                    for i in range(0, len(response), max_length):
-                        chunk = response[i:i+max_length]
-                        if i == 0:
-                            await message.answer(f"{text_prefix}{chunk}", parse_mode="HTML")
-                        else:
-                            await message.answer(chunk)
-                else:
-                    await message.answer(f"{text_prefix}{response}", parse_mode="HTML")
-            else:
-                # Если не удалось синтезировать речь, отправляем текстом
-                await voice_message.edit_text(
-                    f"❌ Не удалось синтезировать речь. Отправляю текстом:\n\n{response}"
-                )
-        else:
-            # Обычный текстовый режим
-            if len(response) > 4096:
-                await typing_message.delete()
-                for i in range(0, len(response), 4096):
-                    await message.answer(response[i:i+4096])
-            else:
-                await typing_message.edit_text(response)
+        await send_ai_response(message, user_id, response, typing_message)
 
     except Exception as e:
         logger.error(f"Ошибка при обработке изображения от пользователя {user_id}: {e}")
         await processing_message.edit_text("Произошла ошибка при обработке изображения.")
 
 
+def format_document_pages(pages: Dict[int, str], total_pages: int) -> str:
+    """Текст распознанных страниц подряд с первой, пока нет пропуска в нумерации"""
+    parts = []
+    for number in range(1, total_pages + 1):
+        if number not in pages:
+            break
+        if pages[number]:
+            parts.append(f"Страница {number}:\n{pages[number]}")
+    return "\n\n".join(parts)
+
+@dp.message(F.document)
+async def handle_document_message(message: Message):
+    """Обработчик документов PDF/TIFF с потоковым OCR по страницам"""
+    user_id = message.from_user.id
+    document = message.document
+    mime_type = document.mime_type or ""
+    
+    if mime_type not in DOCUMENT_MIME_TYPES and not mime_type.startswith("image/"):
+        await message.answer("Поддерживаются документы PDF, TIFF и изображения.")
+        return
+    
+    processing_message = await message.answer("📄 Документ получен, распознаю страницы...")
+    
+    try:
+        # Скачиваем документ
+        document_file = await bot.get_file(document.file_id)
+        document_io = await bot.download_file(document_file.file_path)
+        
+        pages: Dict[int, str] = {}
+        total_pages = 0
+        last_edit = 0.0
+        loop = asyncio.get_event_loop()
+        
+        async for event in neuroapi_client.stream_document_text(
+            document_io.read(), document.file_name or "document", mime_type,
+            neuroapi_client.get_user_ocr_recognizer(user_id, document=True)
+        ):
+            if event["type"] == "error":
+                await processing_message.edit_text(event["error"])
+                return
+            if event["type"] == "document":
+                total_pages = event["pages"]
+            elif event["type"] == "page":
+                pages[event["page"]] = event.get("text", "").strip() if event.get("success") else ""
+                
+                # Показываем уже готовые страницы, не чаще раза в DOCUMENT_PROGRESS_INTERVAL
+                if loop.time() - last_edit >= DOCUMENT_PROGRESS_INTERVAL and len(pages) < total_pages:
+                    last_edit = loop.time()
+                    progress_text = (
+                        f"📄 Распознано страниц: {len(pages)}/{total_pages}\n\n"
+                        f"{format_document_pages(pages, total_pages)}"
+                    )
+                    try:
+                        await processing_message.edit_text(progress_text[:4096])
+                    except Exception as edit_error:
+                        # Текст мог не измениться, если новая страница не первая по порядку
+                        logger.debug(f"Не удалось обновить прогресс документа: {edit_error}")
+        
+        document_text = format_document_pages(pages, total_pages)
+        if not document_text.strip():
+            await processing_message.edit_text("В документе не найден текст для распознавания.")
+            return
+        
+        # Показываем весь распознанный текст
+        display_text = f"📝 Распознанный текст ({total_pages} стр.):\n\n{document_text}"
+        await processing_message.edit_text(display_text[:4096])
+        for i in range(4096, len(display_text), 4096):
+            await message.answer(display_text[i:i+4096])
+        
+        # Генерируем ответ на основе распознанного текста
+        typing_message = await message.answer("💭 Анализирую текст...")
+        await bot.send_chat_action(chat_id=message.chat.id, action="typing")
+        
+        ai_prompt = (
+            f"Пользователь прислал документ из {total_pages} страниц. "
+            f"Распознанный текст:\n\n'{document_text}'\n\n"
+            "Проанализируй этот текст и дай полезный ответ или комментарий."
+        )
+        
+        response = await neuroapi_client.generate_response(user_id, ai_prompt)
+        
+        await send_ai_response(message, user_id, response, typing_message)
+    
+    except Exception as e:
+        logger.error(f"Ошибка при обработке документа от пользователя {user_id}: {e}")
+        await processing_message.edit_text("Произошла ошибка при обработке документа.")
+
+
 @dp.message(F.text)
 async def handle_text_message(message: Message):
     """Обработчик всех текстовых сообщений"""
@@ -578,70 +886,7 @@ async def handle_text_message(message: Message):
         # Получаем ответ от выбранной модели
         response = await neuroapi_client.generate_response(user_id, user_text)
         
-        # Проверяем, включен ли голосовой режим
-        if neuroapi_client.is_voice_mode_enabled(user_id):
-            # Удаляем сообщение с точками
-            await typing_message.delete()
-            
-            # Отправляем сообщение о генерации голоса
-            voice_message = await message.answer("🎤 Генерирую голосовое сообщение...")
-            
-            # Получаем голос пользователя
-            user_voice = neuroapi_client.get_user_voice(user_id)
-            
-            # Синтезируем речь
-            audio_data = await neuroapi_client.synthesize_speech(response, user_voice)
-            
-            if audio_data:
-                # Отправляем голосовое сообщение
-                from aiogram.types import BufferedInputFile
-                
-                audio_file = BufferedInputFile(
-                    file=audio_data,
-                    filename="voice_response.ogg"
-                )
-                
-                await voice_message.delete()
-                await bot.send_voice(
-                    chat_id=message.chat.id,
-                    voice=audio_file
-                )
-                
-                # Также отправляем текстовую версию для удобства
-                text_prefix = "<i>Текст:</i> "
-                max_length = 4096 - len(text_prefix)
-                
-                if len(response) > max_length:
-                    # Разбиваем на части
-                    for i in range(0, len(response), max_length):
-                        chunk = response[i:i+max_length]
-                        if i == 0:
-                            await message.answer(f"{text_prefix}{chunk}", parse_mode="HTML")
-                        else:
-                            await message.answer(chunk)
-                else:
-                    await message.answer(f"{text_prefix}{response}", parse_mode="HTML")
-            else:
-                # Если не удалось синтезировать речь, отправляем текстом
-                await voice_message.edit_text(
-                    f"❌ Не удалось синтезировать речь. Отправляю текстом:\n\n{response}"
-                )
-        else:
-            # Обычный текстовый режим
-            current_model = neuroapi_client._get_user_model(user_id)
-            if current_model in ['gpt-4.1', 'gpt-4.1-mini', 'gpt-4.1-nano']:
-                parse_mode = "Markdown"
-            else:
-                parse_mode = None
-            
-            # Заменяем сообщение с точками на финальный ответ
-            if len(response) > 4096:
-                # Если сообщение слишком длинное, удаляем сообщение с точками и отправляем по частям
-                await typing_message.delete()
-                for i in range(0, len(response), 4096):
-                    await message.answer(response[i:i+4096])
-            else:
-                await typing_message.edit_text(response)
+        await send_ai_response(message, user_id, response, typing_message)
 
     except Exception as e:
         logger.error(f"Ошибка при обработке сообщения от пользователя {user_id}: {e}")
@@ -14,12 +14,62 @@ YANDEX_FOLDER_ID = os.getenv('YANDEX_FOLDER_ID')
 # Конфигурация OCR сервиса
 OCR_SERVICE_URL = os.getenv('OCR_SERVICE_URL', 'http://localhost:8001')
 
+# Профили распознавания Tesseract: best, fast, single-language
+# (для многостраничных документов по умолчанию быстрый профиль)
+OCR_RECOGNIZER_PROFILE = os.getenv('OCR_RECOGNIZER_PROFILE', 'best')
+OCR_DOCUMENT_RECOGNIZER_PROFILE = os.getenv('OCR_DOCUMENT_RECOGNIZER_PROFILE', 'fast')
+
+# Профили распознавания, которые пользователь выбирает командой /ocr
+# (пока профиль не выбран, используются значения по умолчанию выше)
+OCR_RECOGNIZERS = {
+    "best": {
+        "name": "🎯 Точный",
+        "description": "Модели tessdata, русский и английский - лучшее качество"
+    },
+    "fast": {
+        "name": "⚡ Быстрый",
+        "description": "Облегченные модели tessdata_fast - быстрее, немного хуже на сложных снимках"
+    },
+    "single-language": {
+        "name": "🔤 Один язык",
+        "description": "Определение письменности и одна языковая модель - для текста на одном языке"
+    }
+}
+
+# Время ожидания остальных фото альбома (media group) перед пакетным OCR, секунды
+MEDIA_GROUP_COLLECT_DELAY = float(os.getenv('MEDIA_GROUP_COLLECT_DELAY', '1.0'))
+
+# Документы, распознаваемые постранично через потоковый OCR
+DOCUMENT_MIME_TYPES = ("application/pdf", "image/tiff")
+
+# Минимальный интервал между обновлениями сообщения с прогрессом распознавания, секунды
+DOCUMENT_PROGRESS_INTERVAL = float(os.getenv('DOCUMENT_PROGRESS_INTERVAL', '1.5'))
+
 # Конфигурация Kandinsky сервиса
 KANDINSKY_SERVICE_URL = os.getenv('KANDINSKY_SERVICE_URL', 'http://localhost:8002')
 
 # Конфигурация Whisper сервиса
 WHISPER_SERVICE_URL = os.getenv('WHISPER_SERVICE_URL', 'http://localhost:8003')
 
+# Голосовые сообщения не короче этой длительности (секунды) распознаются потоково,
+# с постепенным показом текста; короткие - одним запросом
+VOICE_STREAMING_MIN_DURATION = int(os.getenv('VOICE_STREAMING_MIN_DURATION', '30'))
+
+# Число распознанных голосовых сообщений, запоминаемых по file_unique_id
+# (пересланное сообщение не скачивается и не распознается повторно)
+TRANSCRIPTION_CACHE_SIZE = int(os.getenv('TRANSCRIPTION_CACHE_SIZE', '500'))
+
+# Минимальный интервал между обновлениями сообщения с распознаваемым текстом, секунды
+TRANSCRIPTION_PROGRESS_INTERVAL = float(os.getenv('TRANSCRIPTION_PROGRESS_INTERVAL', '1.5'))
+
+# Минимальный интервал между обновлениями превью генерируемого изображения, секунды
+IMAGE_PREVIEW_INTERVAL = float(os.getenv('IMAGE_PREVIEW_INTERVAL', '3'))
+
+# Долгие задачи (транскрибация, генерация изображений) выполняются через очередь сервисов:
+# общее время ожидания результата и длительность одного long-poll запроса, секунды
+JOB_MAX_WAIT = float(os.getenv('JOB_MAX_WAIT', '900'))
+JOB_POLL_WAIT = float(os.getenv('JOB_POLL_WAIT', '25'))
+
 # Проверяем наличие необходимых токенов
 if not BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
@@ -206,3 +256,27 @@ YANDEX_VOICES = {
 
 # Голос по умолчанию
 DEFAULT_VOICE = "alena"
+
+# Пресеты качества генерации изображений (параметры пресетов задаются в Kandinsky сервисе)
+IMAGE_PRESETS = {
+    "draft": {
+        "name": "⚡ Черновик",
+        "description": "512×512, 12 шагов - быстро, для проверки идеи"
+    },
+    "standard": {
+        "name": "🖼 Стандарт",
+        "description": "768×768, 25 шагов - баланс скорости и качества"
+    },
+    "high": {
+        "name": "💎 Высокое качество",
+        "description": "768×768, 50 шагов - максимальная детализация, долго"
+    }
+}
+
+# Пресет по умолчанию
+DEFAULT_IMAGE_PRESET = "standard"
+
+# Формат сгенерированных изображений: Telegram все равно пережимает фото в JPEG,
+# поэтому JPEG 90 передается в несколько раз быстрее PNG без видимой разницы
+IMAGE_OUTPUT_FORMAT = os.getenv('IMAGE_OUTPUT_FORMAT', 'jpeg')  # png | jpeg | webp
+IMAGE_OUTPUT_QUALITY = int(os.getenv('IMAGE_OUTPUT_QUALITY', '90'))
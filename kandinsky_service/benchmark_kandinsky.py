@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк Kandinsky сервиса
+
+Запускается локально рядом с main.py (нужны модели и зависимости сервиса):
+    python benchmark_kandinsky.py --size 512 --steps 20
+
+С --tiny вместо Kandinsky 2.2 используются крошечные пайплайны со случайными весами
+той же архитектуры: они быстро считаются на CPU и подходят для замеров накладных расходов.
+"""
+
+import argparse
+import asyncio
+import io
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+
+import main
+from tiny_pipelines import build_tiny_pipelines
+
+PROMPTS = [
+    "красивый закат над горами",
+    "котенок играет с мячиком",
+    "футуристический город ночью",
+    "цветочное поле весной",
+]
+
+
+def make_request(args, prompt: str, **overrides) -> main.ImageGenerationRequest:
+    """Запрос генерации с размером и числом шагов из аргументов"""
+    fields = {
+        "prompt": prompt,
+        "negative_prompt": "low quality, bad quality, blurry, pixelated",
+        "width": args.size,
+        "height": args.size,
+        "num_inference_steps": args.steps,
+    }
+    fields.update(overrides)
+    return main.ImageGenerationRequest(**fields)
+
+
+def generate_one(request: main.ImageGenerationRequest) -> dict:
+    """Генерация одного изображения в формате запроса (батч из одного запроса)"""
+    return main.generate_batch([request])[0]
+
+
+def ensure_models_loaded(args):
+    """Загрузка моделей сервиса (или крошечных пайплайнов с --tiny), если они еще не загружены"""
+    if main.prior_pipeline is None or main.decoder_pipeline is None:
+        start = time.perf_counter()
+        if args.tiny:
+            main.device = "cpu"
+            main.prior_pipeline, main.decoder_pipeline = build_tiny_pipelines()
+        elif not main.load_models():
+            raise RuntimeError("Не удалось загрузить модели")
+        print(f"   Модели загружены за {time.perf_counter() - start:.1f} с")
+
+
+def benchmark_prior_cache(args):
+    """Время запроса без кэша эмбеддингов prior и с ним на потоке повторяющихся промптов"""
+    print("🧠 Кэш эмбеддингов prior")
+    print("-" * 50)
+    ensure_models_loaded(args)
+    # Каждый промпт повторяется несколько раз, как в реальном трафике бота
+    prompts = [PROMPTS[index % len(PROMPTS)] for index in range(args.requests)]
+    print(f"   Запросов: {len(prompts)}, уникальных промптов: {len(set(prompts))}")
+
+    for label, size in (("без кэша", 0), ("с кэшем", main.PRIOR_CACHE_SIZE or 256)):
+        main.prior_cache = main.PriorEmbeddingCache(size)
+        latencies = []
+        saved = []
+        for prompt in prompts:
+            start = time.perf_counter()
+            result = generate_one(make_request(args, prompt, seed=0))
+            latencies.append(time.perf_counter() - start)
+            saved.append(result["prior_seconds_saved"])
+        print(f"   {label:9s}: {statistics.mean(latencies):6.2f} с/запрос, "
+              f"сэкономлено prior {statistics.mean(saved):5.2f} с/запрос")
+    print(f"   Метрики кэша: {main.prior_cache.metrics()}")
+
+
+def benchmark_batching(args):
+    """Изображений в минуту при разном числе одновременных клиентов: по одному и батчами"""
+    print("📦 Динамическое батчирование генерации")
+    print("-" * 50)
+    ensure_models_loaded(args)
+    # Без кэша prior: повторяющиеся промпты не должны влиять на сравнение
+    main.prior_cache = main.PriorEmbeddingCache(0)
+    if main.inference_worker.thread is None:
+        main.inference_worker.start()
+
+    async def run(clients: int, max_batch_size: int):
+        batcher = main.GenerationBatcher(max_batch_size=max_batch_size, max_pending=clients)
+        main.generation_batcher = batcher
+        requests = [make_request(args, PROMPTS[index % len(PROMPTS)], seed=index)
+                    for index in range(max(args.requests, clients))]
+
+        async def client(index: int):
+            # Каждый клиент отправляет следующий запрос после получения ответа
+            for request in requests[index::clients]:
+                await batcher.submit(request)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(index) for index in range(clients)))
+        elapsed = time.perf_counter() - start
+        batcher.stop()
+        return len(requests) / elapsed * 60, batcher.average_batch_size
+
+    for clients in (1, 2, 4, 8):
+        single, _ = asyncio.run(run(clients, 1))
+        batched, average_batch = asyncio.run(run(clients, main.MAX_BATCH_SIZE))
+        print(f"   {clients} клиент(ов): по одному {single:6.1f} изобр./мин, "
+              f"батчами {batched:6.1f} изобр./мин (x{batched / single:.2f}, средний батч {average_batch:.1f})")
+
+
+def clip_score(image: Image.Image, prompt: str) -> float:
+    """Соответствие изображения промпту: косинус эмбеддингов CLIP из prior pipeline, x100"""
+    prior = main.prior_pipeline
+    pixel_values = prior.image_processor(image, return_tensors="pt").pixel_values
+    tokens = prior.tokenizer(prompt, padding="max_length", max_length=prior.tokenizer.model_max_length,
+                             truncation=True, return_tensors="pt")
+    with torch.no_grad():
+        image_embeds = prior.image_encoder(pixel_values.to(main.device, prior.image_encoder.dtype)).image_embeds
+        text_embeds = prior.text_encoder(tokens.input_ids.to(main.device)).text_embeds
+    return torch.nn.functional.cosine_similarity(image_embeds, text_embeds).item() * 100
+
+
+def psnr(image: Image.Image, reference: Image.Image) -> float:
+    """PSNR относительно эталона (изображение приводится к размеру эталона), дБ"""
+    image = np.asarray(image.convert("RGB").resize(reference.size), dtype=np.float64)
+    mse = np.mean((image - np.asarray(reference.convert("RGB"), dtype=np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def benchmark_presets(args):
+    """Время генерации и качество для каждого пресета с одинаковыми seed"""
+    print("🎚 Пресеты качества и планировщики")
+    print("-" * 50)
+    ensure_models_loaded(args)
+    # Без кэша prior: время пресета включает полный проход prior
+    main.prior_cache = main.PriorEmbeddingCache(0)
+    prompts = PROMPTS[:max(1, min(args.requests, len(PROMPTS)))]
+    # Эталон - пресет high (штатный планировщик, 50 шагов); он считается первым
+    presets = sorted(main.GENERATION_PRESETS, key=lambda name: name != "high")
+    references = {}
+    print(f"   Промптов: {len(prompts)}; качество - CLIP score и PSNR относительно high с тем же seed")
+
+    for preset in presets:
+        latencies = []
+        scores = []
+        distances = []
+        for index, prompt in enumerate(prompts):
+            request = main.ImageGenerationRequest(prompt=prompt, preset=preset, seed=index)
+            start = time.perf_counter()
+            result = generate_one(request)
+            latencies.append(time.perf_counter() - start)
+            image = Image.open(io.BytesIO(result["image"]))
+            scores.append(clip_score(image, prompt))
+            if preset == "high":
+                references[prompt] = image
+            else:
+                distances.append(psnr(image, references[prompt]))
+        settings = main.GENERATION_PRESETS[preset]
+        quality = f"PSNR {statistics.mean(distances):5.1f} дБ" if distances else "эталон"
+        print(f"   {preset:8s} ({settings['scheduler']}, {settings['num_inference_steps']} шагов, "
+              f"{settings['width']}x{settings['height']}): {statistics.mean(latencies):6.2f} с/изобр., "
+              f"CLIP {statistics.mean(scores):5.1f}, {quality}")
+
+
+def benchmark_previews(args):
+    """Накладные расходы превью и время до первого превью при разной частоте"""
+    print("🖼 Превью во время генерации")
+    print("-" * 50)
+    ensure_models_loaded(args)
+    main.prior_cache = main.PriorEmbeddingCache(0)
+    prompts = [PROMPTS[index % len(PROMPTS)] for index in range(args.requests)]
+    print(f"   Запросов: {len(prompts)}, шагов: {args.steps}, размер превью: {main.PREVIEW_SIZE}px")
+
+    baseline = None
+    for every in (0, 10, 5, 2):
+        main.PREVIEW_EVERY = every
+        latencies = []
+        first_previews = []
+        for index, prompt in enumerate(prompts):
+            start = time.perf_counter()
+            first = []
+
+            def on_step(step, total, preview):
+                if not first:
+                    first.append(time.perf_counter() - start)
+
+            main.generate_batch([make_request(args, prompt, seed=index)], [on_step])
+            latencies.append(time.perf_counter() - start)
+            first_previews.extend(first)
+        latency = statistics.mean(latencies)
+        if baseline is None:
+            baseline = latency
+            print(f"   без превью        : {latency:6.2f} с/изобр.")
+            continue
+        first_preview = f"{statistics.mean(first_previews):6.2f} с" if first_previews else "   нет"
+        print(f"   каждые {every:2d} шагов   : {latency:6.2f} с/изобр. (+{(latency / baseline - 1) * 100:4.1f}%), "
+              f"первое превью через {first_preview}")
+
+
+# Варианты профиля CPU: каждый сравнивается с fp32 без оптимизаций
+CPU_PROFILES = {
+    "fp32": {},
+    "channels_last": {"channels_last": True},
+    "bf16": {"bf16": "true"},
+    "attention_slicing": {"attention_slicing": True},
+    "vae_slicing": {"vae_slicing": True},
+    "vae_tiling": {"vae_tiling": True},
+    "compile": {"compile": True},
+    "bf16+channels_last+vae_slicing": {"bf16": "true", "channels_last": True, "vae_slicing": True},
+}
+
+
+def reset_peak_rss():
+    """Сброс пикового RSS процесса (Linux: запись 5 в /proc/self/clear_refs)"""
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+
+
+def read_peak_rss_mb() -> float:
+    """Пиковый RSS процесса в МБ (VmHWM из /proc/self/status)"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_cpu_profile(args, options: dict) -> dict:
+    """Генерация с профилем CPU в отдельном процессе: время на изображение и пиковый RSS"""
+    # load_models не должен применять профиль из переменных окружения
+    main.CPU_OPTIMIZATIONS = {}
+    ensure_models_loaded(args)
+    main.prior_cache = main.PriorEmbeddingCache(0)
+    main.cpu_optimizations = main.apply_cpu_optimizations(main.prior_pipeline, main.decoder_pipeline, options)
+    # Прогрев: компиляция torch.compile и первичные выделения памяти не входят в замер
+    generate_one(make_request(args, PROMPTS[0], seed=0))
+    reset_peak_rss()
+    batch = [make_request(args, PROMPTS[index % len(PROMPTS)], seed=index) for index in range(args.batch)]
+    start = time.perf_counter()
+    for _ in range(max(1, args.requests // args.batch)):
+        main.generate_batch(batch)
+    images = max(1, args.requests // args.batch) * args.batch
+    return {
+        "applied": main.cpu_optimizations,
+        "seconds": (time.perf_counter() - start) / images,
+        "peak_rss_mb": read_peak_rss_mb(),
+    }
+
+
+def benchmark_cpu_profile(args):
+    """Время на изображение и пиковый RSS для каждой оптимизации профиля CPU"""
+    print("🧮 Профиль производительности CPU")
+    print("-" * 50)
+    print(f"   Размер {args.size}x{args.size}, шагов {args.steps}, батч {args.batch}, "
+          f"bf16 на этом процессоре: {'да' if main.bf16_supported() else 'нет'}")
+    baseline = None
+    for name, options in CPU_PROFILES.items():
+        # Новый процесс на каждый вариант: оптимизации необратимы, а пик RSS - на процесс
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                result = executor.submit(run_cpu_profile, args, options).result()
+            except Exception as e:
+                print(f"   {name:32s} ❌ {e}")
+                continue
+        baseline = baseline or result["seconds"]
+        skipped = [option for option in options if not result["applied"].get(option)]
+        note = f" (не применено: {', '.join(skipped)})" if skipped else ""
+        print(f"   {name:32s} {result['seconds']:6.2f} с/изобр. (x{baseline / result['seconds']:.2f}), "
+              f"пик RSS {result['peak_rss_mb']:6.0f} МБ{note}")
+
+
+def benchmark_onnx(args):
+    """Бэкенды torch и ONNX Runtime (fp32 и int8 UNet) на одинаковых промптах и seed"""
+    print("🧩 ONNX Runtime против torch")
+    print("-" * 50)
+    # Эталон считается на torch, даже если в окружении выбран бэкенд onnx
+    main.KANDINSKY_BACKEND = "torch"
+    ensure_models_loaded(args)
+    main.prior_cache = main.PriorEmbeddingCache(0)
+    requests = [make_request(args, PROMPTS[index % len(PROMPTS)], seed=index) for index in range(args.requests)]
+
+    def run():
+        # Первая генерация - прогрев (инициализация сессий и выделение памяти)
+        generate_one(requests[0])
+        images = []
+        start = time.perf_counter()
+        for request in requests:
+            images.append(Image.open(io.BytesIO(generate_one(request)["image"])))
+        return (time.perf_counter() - start) / len(requests), images
+
+    torch_seconds, references = run()
+    print(f"   torch          : {torch_seconds:6.2f} с/изобр.")
+
+    directory = args.onnx_dir
+    if args.tiny:
+        # Крошечные пайплайны экспортируются заново во временный каталог
+        import export_onnx
+        directory = tempfile.mkdtemp(prefix="kandinsky_onnx_")
+        export_onnx.export_pipelines(main.prior_pipeline, main.decoder_pipeline, directory, args.size, int8_unet=True)
+
+    for int8_unet in (False, True):
+        label = "onnx int8 UNet" if int8_unet else "onnx fp32"
+        if int8_unet and not os.path.exists(os.path.join(directory, "unet", "model.int8.onnx")):
+            print(f"   {label:15s}: нет model.int8.onnx (export_onnx.py --int8-unet)")
+            continue
+        main.attach_onnx_backend(main.prior_pipeline, main.decoder_pipeline, directory, int8_unet)
+        seconds, images = run()
+        distance = statistics.mean(psnr(image, reference) for image, reference in zip(images, references))
+        print(f"   {label:15s}: {seconds:6.2f} с/изобр. (x{torch_seconds / seconds:.2f}), "
+              f"PSNR относительно torch {distance:5.1f} дБ")
+
+
+# Варианты кодирования: (подпись, output_format, quality, уровень сжатия PNG)
+ENCODINGS = [
+    ("PNG, сжатие 6 (прежний)", "png", 90, 6),
+    ("PNG, сжатие 1", "png", 90, 1),
+    ("JPEG 90", "jpeg", 90, None),
+    ("JPEG 80", "jpeg", 80, None),
+    ("WebP 90", "webp", 90, None),
+    ("WebP 80", "webp", 80, None),
+]
+
+
+def benchmark_encoding(args):
+    """Время кодирования и размер ответа для форматов и качества"""
+    print("🗜 Кодирование сгенерированных изображений")
+    print("-" * 50)
+    ensure_models_loaded(args)
+    requests = [make_request(args, PROMPTS[index % len(PROMPTS)], seed=index) for index in range(args.requests)]
+    images = [main.generate_batch([request], encode=False)[0]["pil_image"] for request in requests]
+    print(f"   Изображений: {len(images)}, размер {args.size}x{args.size}")
+
+    baseline = None
+    compress_level = main.PNG_COMPRESS_LEVEL
+    for label, output_format, quality, level in ENCODINGS:
+        if level is not None:
+            main.PNG_COMPRESS_LEVEL = level
+        timings = []
+        sizes = []
+        for image, request in zip(images, requests):
+            request = request.model_copy(update={"output_format": output_format, "quality": quality})
+            result = main.encode_image(image, request)
+            timings.append(result["encode_seconds"])
+            sizes.append(len(result["image"]))
+        encode_ms = statistics.mean(timings) * 1000
+        size_kb = statistics.mean(sizes) / 1024
+        baseline = baseline or (encode_ms, size_kb)
+        print(f"   {label:24s}: {encode_ms:7.1f} мс, {size_kb:7.1f} КБ "
+              f"(экономия {baseline[0] - encode_ms:6.1f} мс, {(1 - size_kb / baseline[1]) * 100:4.0f}% байт)")
+    main.PNG_COMPRESS_LEVEL = compress_level
+
+
+# Варианты загрузки: (подпись, каталог моделей или None для Hub, потоков загрузки)
+STARTUP_SOURCES = [
+    ("Hugging Face Hub", None, 1),
+    ("локальный каталог, 1 поток", "local", 1),
+    ("локальный каталог, параллельно", "local", main.MODEL_LOAD_WORKERS),
+]
+
+
+def run_startup(models_dir, workers: int) -> dict:
+    """Загрузка моделей в отдельном процессе: время по компонентам и пиковый RSS"""
+    main.MODELS_DIR = models_dir or ""
+    main.MODEL_LOAD_WORKERS = workers
+    main.CPU_OPTIMIZATIONS = {}
+    if not main.load_models():
+        raise RuntimeError("Не удалось загрузить модели")
+    return dict(main.load_stats, peak_rss_mb=read_peak_rss_mb())
+
+
+def benchmark_startup(args):
+    """Холодный старт: загрузка из Hugging Face Hub и из локального каталога safetensors"""
+    print("🚀 Холодный старт")
+    print("-" * 50)
+    models_dir = args.models_dir
+    sources = STARTUP_SOURCES
+    if args.tiny:
+        # Крошечные пайплайны сохраняются во временный каталог; Hub для них не проверяется
+        import save_models
+        models_dir = tempfile.mkdtemp(prefix="kandinsky_models_")
+        prior_pipeline, decoder_pipeline = build_tiny_pipelines()
+        save_models.save_pipeline(prior_pipeline, os.path.join(models_dir, "prior"))
+        save_models.save_pipeline(decoder_pipeline, os.path.join(models_dir, "decoder"))
+        sources = [source for source in sources if source[1]]
+    elif not models_dir:
+        print("   Локальный каталог не задан (--models-dir, save_models.py): только Hub")
+        sources = [source for source in sources if not source[1]]
+
+    baseline = None
+    for label, source, workers in sources:
+        # Новый процесс (spawn, без унаследованного импорта torch) на каждый вариант
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            try:
+                result = executor.submit(run_startup, source and models_dir, workers).result()
+            except Exception as e:
+                print(f"   {label:32s} ❌ {e}")
+                continue
+        baseline = baseline or result["seconds"]
+        print(f"   {label:32s} {result['seconds']:6.1f} с (x{baseline / result['seconds']:.2f}), "
+              f"холодный старт {result['cold_start_seconds']:6.1f} с, пик RSS {result['peak_rss_mb']:6.0f} МБ")
+        slowest = sorted(result["components"].items(), key=lambda item: -item[1])[:4]
+        print(f"   {'':32s} " + ", ".join(f"{name} {seconds:.1f} с" for name, seconds in slowest))
+
+
+BENCHMARKS = {
+    "prior": benchmark_prior_cache,
+    "batching": benchmark_batching,
+    "presets": benchmark_presets,
+    "previews": benchmark_previews,
+    "cpu": benchmark_cpu_profile,
+    "onnx": benchmark_onnx,
+    "encoding": benchmark_encoding,
+    "startup": benchmark_startup,
+}
+
+
+def main_cli():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description="Бенчмарк Kandinsky сервиса")
+    parser.add_argument("suites", nargs="*", default=list(BENCHMARKS), help=f"Набор тестов: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--size", type=int, default=512, help="Ширина и высота изображения")
+    parser.add_argument("--steps", type=int, default=20, help="Шаги декодера")
+    parser.add_argument("--requests", type=int, default=12, help="Запросов в наборе")
+    parser.add_argument("--batch", type=int, default=1, help="Размер батча в наборе cpu")
+    parser.add_argument("--onnx-dir", default=main.ONNX_DIR, help="Каталог моделей ONNX (export_onnx.py)")
+    parser.add_argument("--models-dir", default=main.MODELS_DIR, help="Локальный каталог моделей (save_models.py)")
+    parser.add_argument("--tiny", action="store_true", help="Крошечные пайплайны со случайными весами вместо моделей")
+    args = parser.parse_args()
+
+    for suite in args.suites:
+        if suite not in BENCHMARKS:
+            print(f"❌ Неизвестный набор: {suite}")
+            return 1
+        BENCHMARKS[suite](args)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Экспорт prior, UNet и декодера MoVQ Kandinsky 2.2 в ONNX для бэкенда ONNX Runtime
+
+Запускается рядом с main.py (нужны зависимости сервиса, onnx и onnxruntime):
+    python export_onnx.py --output onnx
+    python export_onnx.py --output onnx --int8-unet   # дополнительно int8 UNet
+
+Сервис использует экспортированные модели при KANDINSKY_BACKEND=onnx и KANDINSKY_ONNX_DIR=<output>.
+Текстовый и графический энкодеры CLIP и планировщики остаются в torch.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+PRIOR_MODEL = "kandinsky-community/kandinsky-2-2-prior"
+DECODER_MODEL = "kandinsky-community/kandinsky-2-2-decoder"
+OPSET = 17
+
+
+class PriorExport(torch.nn.Module):
+    """PriorTransformer с тензорными входами и одним выходом"""
+
+    def __init__(self, prior):
+        super().__init__()
+        self.prior = prior
+
+    def forward(self, hidden_states, timestep, proj_embedding, encoder_hidden_states, attention_mask):
+        return self.prior(
+            hidden_states,
+            timestep=timestep,
+            proj_embedding=proj_embedding,
+            encoder_hidden_states=encoder_hidden_states,
+            attention_mask=attention_mask
+        ).predicted_image_embedding
+
+
+class UNetExport(torch.nn.Module):
+    """UNet декодера: эмбеддинг изображения вместо added_cond_kwargs"""
+
+    def __init__(self, unet):
+        super().__init__()
+        self.unet = unet
+
+    def forward(self, sample, timestep, image_embeds):
+        return self.unet(
+            sample,
+            timestep,
+            encoder_hidden_states=None,
+            added_cond_kwargs={"image_embeds": image_embeds},
+            return_dict=False
+        )[0]
+
+
+class MoVQExport(torch.nn.Module):
+    """Декодирование латентов MoVQ без квантования (как в KandinskyV22Pipeline)"""
+
+    def __init__(self, movq):
+        super().__init__()
+        self.movq = movq
+
+    def forward(self, latents):
+        return self.movq.decode(latents, force_not_quantize=True).sample
+
+
+def save_config(module, directory: str):
+    """Конфигурация исходного модуля: ее читают пайплайны diffusers"""
+    with open(os.path.join(directory, "config.json"), "w") as config_file:
+        json.dump(dict(module.config), config_file, indent=2)
+
+
+def export_module(module, inputs: tuple, directory: str, input_names: list, dynamic_axes: dict):
+    """Экспорт модуля в directory/model.onnx (веса больше 2 ГБ torch сохраняет рядом)"""
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(
+            module,
+            inputs,
+            os.path.join(directory, "model.onnx"),
+            input_names=input_names,
+            output_names=["output"],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET,
+            do_constant_folding=True
+        )
+    print(f"   {directory}: {time.perf_counter() - start:.1f} с")
+
+
+def quantize_unet(directory: str):
+    """
+    Динамическое int8 квантование весов UNet: directory/model.int8.onnx
+
+    Квантуются только MatMul и Gemm (внимание и линейные слои): для ConvInteger с int8 весами
+    в CPU провайдере ONNX Runtime нет реализации, и такая модель не загрузилась бы.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    start = time.perf_counter()
+    quantize_dynamic(
+        os.path.join(directory, "model.onnx"),
+        os.path.join(directory, "model.int8.onnx"),
+        op_types_to_quantize=["MatMul", "Gemm"],
+        weight_type=QuantType.QInt8,
+        use_external_data_format=True
+    )
+    print(f"   {directory}: int8 за {time.perf_counter() - start:.1f} с")
+
+
+def export_pipelines(prior_pipeline, decoder_pipeline, output: str, size: int = 768, int8_unet: bool = False):
+    """Экспорт prior, UNet и MoVQ загруженных пайплайнов в каталоги output/prior, output/unet, output/movq"""
+    batch = 2  # Оси батча динамические; 2 - как при classifier-free guidance
+
+    # Prior: латенты и эмбеддинги текста CLIP
+    prior = prior_pipeline.prior.float().cpu().eval()
+    embedding_dim = prior.config.embedding_dim
+    text_config = prior_pipeline.text_encoder.config
+    sequence_length = prior_pipeline.tokenizer.model_max_length
+    directory = os.path.join(output, "prior")
+    export_module(
+        PriorExport(prior),
+        (
+            torch.randn(batch, embedding_dim),
+            torch.tensor([999.0]),
+            torch.randn(batch, text_config.projection_dim),
+            torch.randn(batch, sequence_length, text_config.hidden_size),
+            torch.ones(batch, sequence_length, dtype=torch.bool),
+        ),
+        directory,
+        ["hidden_states", "timestep", "proj_embedding", "encoder_hidden_states", "attention_mask"],
+        {
+            "hidden_states": {0: "batch"},
+            "proj_embedding": {0: "batch"},
+            "encoder_hidden_states": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "output": {0: "batch"},
+        }
+    )
+    save_config(prior, directory)
+    np.savez(
+        os.path.join(directory, "clip_stats.npz"),
+        clip_mean=prior.clip_mean.detach().float().cpu().numpy(),
+        clip_std=prior.clip_std.detach().float().cpu().numpy()
+    )
+
+    # UNet: латенты размером size / movq_scale_factor
+    unet = decoder_pipeline.unet.float().cpu().eval()
+    latent_size = size // decoder_pipeline.movq_scale_factor
+    directory = os.path.join(output, "unet")
+    export_module(
+        UNetExport(unet),
+        (
+            torch.randn(batch, unet.config.in_channels, latent_size, latent_size),
+            torch.tensor([999.0]),
+            torch.randn(batch, unet.config.encoder_hid_dim),
+        ),
+        directory,
+        ["sample", "timestep", "image_embeds"],
+        {
+            "sample": {0: "batch", 2: "height", 3: "width"},
+            "image_embeds": {0: "batch"},
+            "output": {0: "batch", 2: "height", 3: "width"},
+        }
+    )
+    save_config(unet, directory)
+    if int8_unet:
+        quantize_unet(directory)
+
+    # MoVQ: декодирование латентов в изображение
+    movq = decoder_pipeline.movq.float().cpu().eval()
+    directory = os.path.join(output, "movq")
+    export_module(
+        MoVQExport(movq),
+        (torch.randn(1, movq.config.latent_channels, latent_size, latent_size),),
+        directory,
+        ["latents"],
+        {
+            "latents": {0: "batch", 2: "height", 3: "width"},
+            "output": {0: "batch", 2: "height", 3: "width"},
+        }
+    )
+    save_config(movq, directory)
+
+
+def main_cli():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description="Экспорт Kandinsky 2.2 в ONNX")
+    parser.add_argument("--output", default="onnx", help="Каталог для моделей ONNX")
+    parser.add_argument("--size", type=int, default=768, help="Размер изображения для примера входа")
+    parser.add_argument("--int8-unet", action="store_true", help="Дополнительно квантовать UNet в int8")
+    parser.add_argument("--tiny", action="store_true", help="Крошечные пайплайны со случайными весами (для проверки)")
+    args = parser.parse_args()
+
+    print("📦 Загрузка пайплайнов...")
+    if args.tiny:
+        from tiny_pipelines import build_tiny_pipelines
+        prior_pipeline, decoder_pipeline = build_tiny_pipelines()
+    else:
+        from diffusers import KandinskyV22Pipeline, KandinskyV22PriorPipeline
+        prior_pipeline = KandinskyV22PriorPipeline.from_pretrained(PRIOR_MODEL, torch_dtype=torch.float32)
+        decoder_pipeline = KandinskyV22Pipeline.from_pretrained(DECODER_MODEL, torch_dtype=torch.float32)
+
+    print(f"🧩 Экспорт в {args.output}")
+    export_pipelines(prior_pipeline, decoder_pipeline, args.output, args.size, args.int8_unet)
+    print("✅ Готово")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,15 +1,35 @@
 import io
+import os
+import sys
+import gc
+import json
+import math
+import importlib
+import time
+import queue
 import asyncio
+import contextlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import numpy as np
 import torch
 import logging
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import Response
-from pydantic import BaseModel
-from diffusers import KandinskyV22PriorPipeline, KandinskyV22Pipeline
+from pydantic import BaseModel, field_validator, model_validator
+from diffusers import (KandinskyV22PriorPipeline, KandinskyV22Pipeline, DDPMScheduler, DDIMScheduler,
+                       DPMSolverMultistepScheduler, UniPCMultistepScheduler)
+from diffusers.configuration_utils import FrozenDict
 from diffusers.utils import logging as diffusers_logging
 from typing import Optional
 import uvicorn
 
+# Общая очередь задач лежит в корне репозитория (service_common), сервис запускается из своего каталога
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service_common import JobQueue, QueueFullError  # noqa: E402
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,10 +39,108 @@ diffusers_logging.set_verbosity_error()
 
 app = FastAPI(title="Kandinsky 2.2 Image Generation API", version="1.0.0")
 
+PROCESS_START = time.time()  # Начало холодного старта
+
 # Глобальные переменные для пайплайнов
 prior_pipeline = None
 decoder_pipeline = None
 device = None
+decoder_schedulers = {}  # Экземпляры планировщиков декодера по имени
+cpu_optimizations = {}  # Примененные оптимизации профиля CPU
+load_stats = {"cold_start_seconds": None}  # Время последней загрузки моделей по компонентам
+
+models_loading = False  # Идет загрузка или перезагрузка моделей
+
+# Выделенный поток инференса: генерации и загрузка моделей выполняются в нем по очереди.
+# Размер очереди ограничивает и число запросов, ожидающих генерации
+INFERENCE_QUEUE_SIZE = int(os.getenv("KANDINSKY_INFERENCE_QUEUE_SIZE", "8"))
+
+# Динамическое батчирование: запросы с одинаковыми размером, числом шагов и guidance,
+# пришедшие за окно, генерируются одним проходом prior и декодера (1 - без батчирования)
+BATCH_WINDOW = int(os.getenv("KANDINSKY_BATCH_WINDOW_MS", "200")) / 1000
+MAX_BATCH_SIZE = int(os.getenv("KANDINSKY_MAX_BATCH_SIZE", "4"))
+MODELS_LOADING_RETRY_AFTER = 30  # Retry-After для запросов во время загрузки моделей, секунды
+
+# Кэш эмбеддингов prior pipeline по (prompt, negative_prompt, prior_guidance_scale, seed)
+PRIOR_CACHE_SIZE = int(os.getenv("KANDINSKY_PRIOR_CACHE_SIZE", "256"))  # 0 - без кэша
+PRIOR_STEPS = 25
+
+# Асинхронные задачи: ограниченная очередь с опросом результата
+JOB_QUEUE_SIZE = int(os.getenv("KANDINSKY_JOB_QUEUE_SIZE", "8"))
+# Задач в работе одновременно: не меньше размера батча, чтобы задачи попадали в один батч
+JOB_WORKERS = int(os.getenv("KANDINSKY_JOB_WORKERS", "4"))
+JOB_RESULT_TTL = int(os.getenv("KANDINSKY_JOB_RESULT_TTL", "600"))  # Хранение результата, секунды
+JOB_MAX_WAIT = 30.0  # Максимальное время long-poll одного запроса статуса, секунды
+
+# Форматы ответа с изображением: формат запроса -> (формат Pillow, MIME-тип, расширение)
+OUTPUT_FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "webp": ("WEBP", "image/webp", "webp"),
+}
+# Уровень сжатия PNG: 1 заметно быстрее уровня 6 (по умолчанию в Pillow) при немного большем файле
+PNG_COMPRESS_LEVEL = int(os.getenv("KANDINSKY_PNG_COMPRESS_LEVEL", "1"))
+ENCODE_WORKERS = int(os.getenv("KANDINSKY_ENCODE_WORKERS", "2"))  # Потоки кодирования изображений
+
+# Модели: с Hugging Face Hub или из локального каталога (см. save_models.py) без обращения к сети
+PRIOR_MODEL = "kandinsky-community/kandinsky-2-2-prior"
+DECODER_MODEL = "kandinsky-community/kandinsky-2-2-decoder"
+MODELS_DIR = os.getenv("KANDINSKY_MODELS_DIR", "")  # Пусто - Hugging Face Hub
+MODEL_LOAD_WORKERS = int(os.getenv("KANDINSKY_MODEL_LOAD_WORKERS", "4"))  # Параллельная загрузка компонентов
+
+# Бэкенд prior, UNet и MoVQ: torch или onnx (ONNX Runtime, модели из export_onnx.py)
+KANDINSKY_BACKEND = os.getenv("KANDINSKY_BACKEND", "torch")
+ONNX_DIR = os.getenv("KANDINSKY_ONNX_DIR", "onnx")
+ONNX_INT8_UNET = os.getenv("KANDINSKY_ONNX_INT8_UNET", "false").lower() == "true"
+ONNX_THREADS = int(os.getenv("KANDINSKY_ONNX_THREADS", "0"))  # 0 - по числу ядер
+
+# Профиль производительности CPU (на GPU не применяется)
+CPU_OPTIMIZATIONS = {
+    # bf16 autocast: auto - только если процессор поддерживает bf16 (AVX512-BF16/AMX)
+    "bf16": os.getenv("KANDINSKY_CPU_BF16", "auto").lower(),
+    "channels_last": os.getenv("KANDINSKY_CHANNELS_LAST", "true").lower() == "true",
+    # Нарезка внимания и декодирования MoVQ снижают пиковую память ценой скорости
+    "attention_slicing": os.getenv("KANDINSKY_ATTENTION_SLICING", "false").lower() == "true",
+    "vae_slicing": os.getenv("KANDINSKY_VAE_SLICING", "true").lower() == "true",
+    "vae_tiling": os.getenv("KANDINSKY_VAE_TILING", "false").lower() == "true",
+    # torch.compile UNet: первая генерация каждого размера заметно дольше
+    "compile": os.getenv("KANDINSKY_TORCH_COMPILE", "false").lower() == "true",
+}
+
+# Превью во время генерации: каждые PREVIEW_EVERY шагов декодера латенты уменьшаются
+# до PREVIEW_SIZE пикселей по большей стороне и декодируются MoVQ (0 - без превью)
+PREVIEW_EVERY = int(os.getenv("KANDINSKY_PREVIEW_EVERY", "5"))
+PREVIEW_SIZE = int(os.getenv("KANDINSKY_PREVIEW_SIZE", "256"))
+PREVIEW_QUALITY = 70  # Качество JPEG превью
+
+class KandinskyUniPCScheduler(UniPCMultistepScheduler):
+    """
+    UniPC для пайплайна декодера Kandinsky 2.2
+    
+    KandinskyV22Pipeline передает в step аргумент generator, которого нет у UniPC;
+    солвер детерминированный и шум не добавляет, поэтому генератор не нужен.
+    """
+
+    def step(self, model_output, timestep, sample, generator=None, return_dict: bool = True):
+        return super().step(model_output, timestep, sample, return_dict=return_dict)
+
+
+# Планировщики декодера. ddpm - штатный планировщик модели; многошаговые солверы (dpm, unipc)
+# дают сопоставимое качество за 15-25 шагов вместо 50
+SCHEDULERS = {
+    "ddpm": DDPMScheduler,
+    "ddim": DDIMScheduler,
+    "dpm": DPMSolverMultistepScheduler,
+    "unipc": KandinskyUniPCScheduler,
+}
+DEFAULT_SCHEDULER = os.getenv("KANDINSKY_SCHEDULER", "ddpm")
+
+# Пресеты качества: значения подставляются в поля, не заданные в запросе явно
+GENERATION_PRESETS = {
+    "draft": {"scheduler": "dpm", "num_inference_steps": 12, "width": 512, "height": 512},
+    "standard": {"scheduler": "dpm", "num_inference_steps": 25, "width": 768, "height": 768},
+    "high": {"scheduler": "ddpm", "num_inference_steps": 50, "width": 768, "height": 768},
+}
 
 class ImageGenerationRequest(BaseModel):
     prompt: str
@@ -32,83 +150,530 @@ class ImageGenerationRequest(BaseModel):
     num_inference_steps: int = 50
     guidance_scale: float = 4.0
     prior_guidance_scale: float = 1.0
+    seed: Optional[int] = None
+    scheduler: Optional[str] = None  # None - KANDINSKY_SCHEDULER
+    preset: Optional[str] = None
+    output_format: Optional[str] = None  # png, jpeg, webp; None - по заголовку Accept, иначе png
+    quality: int = 90  # Качество JPEG и WebP
+
+    @model_validator(mode="before")
+    @classmethod
+    def apply_preset(cls, values):
+        """Подстановка значений пресета в поля, не заданные явно"""
+        if isinstance(values, dict) and values.get("preset") is not None:
+            preset = GENERATION_PRESETS.get(values["preset"])
+            if preset is None:
+                raise ValueError(
+                    f"Неизвестный пресет: {values['preset']}. Доступны: {', '.join(GENERATION_PRESETS)}"
+                )
+            values = {**preset, **{key: value for key, value in values.items() if value is not None}}
+        return values
+
+    @field_validator("output_format")
+    @classmethod
+    def check_output_format(cls, value):
+        if value is None:
+            return value
+        value = "jpeg" if value.lower() == "jpg" else value.lower()
+        if value not in OUTPUT_FORMATS:
+            raise ValueError(f"Неизвестный формат: {value}. Доступны: {', '.join(OUTPUT_FORMATS)}")
+        return value
+
+    @field_validator("quality")
+    @classmethod
+    def check_quality(cls, value):
+        if not 1 <= value <= 100:
+            raise ValueError("Качество должно быть от 1 до 100")
+        return value
+
+    @field_validator("scheduler")
+    @classmethod
+    def check_scheduler(cls, value):
+        if value is not None and value not in SCHEDULERS:
+            raise ValueError(f"Неизвестный планировщик: {value}. Доступны: {', '.join(SCHEDULERS)}")
+        return value
 
 class HealthResponse(BaseModel):
     status: str
     device: str
     models_loaded: bool
+    queue_depth: int = 0
+    inference_queue_depth: int = 0
+
+def _resolve_future(future: asyncio.Future, result=None, error: Exception = None):
+    """Передача результата из потока инференса в ожидающую корутину"""
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class InferenceWorker:
+    """
+    Выделенный поток инференса с ограниченной очередью
+    
+    Пайплайны не потокобезопасны, поэтому генерации и (пере)загрузка моделей выполняются
+    строго по одной в одном потоке, а event loop только ждет результат и остается отзывчивым.
+    Перезагрузка, поставленная в очередь, начнется после завершения текущей генерации.
+    """
+
+    def __init__(self, max_queued: int = INFERENCE_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.thread = None
+        self.durations = deque(maxlen=50)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="kandinsky-inference", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass  # Поток демонический и завершится вместе с процессом
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def retry_after(self) -> int:
+        """Оценка времени до освобождения потока по средней длительности генерации, секунды"""
+        average = sum(self.durations) / len(self.durations) if self.durations else 60.0
+        return max(1, math.ceil(average))
+
+    def submit(self, function, *args, timed: bool = True) -> asyncio.Future:
+        """
+        Постановка вызова в очередь; результат - через возвращаемый future
+        
+        timed=False - длительность вызова не учитывается в оценке Retry-After
+        (загрузка моделей в разы дольше генерации и завысила бы среднее).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            self.queue.put_nowait((function, args, timed, loop, future))
+        except queue.Full:
+            raise QueueFullError(self.retry_after())
+        return future
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            function, args, timed, loop, future = item
+            if future.cancelled():
+                continue
+            start = time.time()
+            try:
+                result = function(*args)
+            except Exception as e:
+                loop.call_soon_threadsafe(_resolve_future, future, None, e)
+            else:
+                loop.call_soon_threadsafe(_resolve_future, future, result)
+            finally:
+                if timed:
+                    self.durations.append(time.time() - start)
+
+
+inference_worker = InferenceWorker()
+
+
+class PriorEmbeddingCache:
+    """
+    LRU кэш выходов prior pipeline
+    
+    Эмбеддинги хранятся на CPU в float16 (1280 чисел на изображение) вместе со временем,
+    потраченным на их вычисление, - при попадании оно засчитывается как сэкономленное.
+    Используется только из потока инференса.
+    """
+
+    def __init__(self, max_entries: int = PRIOR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "seconds_saved": 0.0}
+
+    def get(self, key: tuple):
+        """Кортеж тензоров и время вычисления или None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        self.stats["seconds_saved"] += entry[1]
+        return entry
+
+    def put(self, key: tuple, tensors: tuple, seconds: float):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (tuple(tensor.to("cpu", torch.float16) for tensor in tensors), seconds)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "entries": len(self.entries),
+            "hits": self.stats["hits"],
+            "misses": self.stats["misses"],
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "seconds_saved": round(self.stats["seconds_saved"], 2),
+        }
+
+
+prior_cache = PriorEmbeddingCache()
 
 def load_models():
-    """Загрузка моделей Kandinsky 2.2 с повторными попытками"""
-    global prior_pipeline, decoder_pipeline, device
+    """
+    Загрузка моделей Kandinsky 2.2 с повторными попытками
+    
+    Выполняется в потоке инференса, поэтому ни одна генерация не видит пайплайны
+    в промежуточном состоянии.
+    """
+    global prior_pipeline, decoder_pipeline, device, decoder_schedulers, cpu_optimizations
+    
+    # Прежние модели освобождаются до загрузки новых: две копии не помещаются в память
+    prior_pipeline = decoder_pipeline = None
+    decoder_schedulers = {}
+    cpu_optimizations = {}
+    prior_cache.clear()
     
     try:
         # Определяем устройство
         device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Используется устройство: {device}")
+        dtype = torch.float16 if device == "cuda" else torch.float32
         
-        # Максимальное количество попыток загрузки
-        max_retries = 3
+        # Prior и decoder загружаются параллельно: из локального каталога - по компонентам
+        start = time.perf_counter()
+        timings = {}
+        if MODELS_DIR:
+            prior, decoder = load_local_pipelines(dtype, timings)
+        else:
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="kandinsky-load") as pool:
+                prior_future = pool.submit(load_hub_pipeline, KandinskyV22PriorPipeline,
+                                           PRIOR_MODEL, "Prior Pipeline", dtype, timings)
+                decoder_future = pool.submit(load_hub_pipeline, KandinskyV22Pipeline,
+                                             DECODER_MODEL, "Decoder Pipeline", dtype, timings)
+                prior, decoder = prior_future.result(), decoder_future.result()
+        prior.to(device)
+        decoder.to(device)
+        record_load_stats(timings, time.perf_counter() - start)
         
-        # Загружаем prior pipeline с повторными попытками
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"Загружаем Kandinsky 2.2 Prior Pipeline... (попытка {attempt + 1}/{max_retries})")
-                prior_pipeline = KandinskyV22PriorPipeline.from_pretrained(
-                    "kandinsky-community/kandinsky-2-2-prior",
-                    torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-                    resume_download=True,  # Возобновление загрузки при обрыве
-                    force_download=False   # Не перезагружать если уже есть
-                )
-                prior_pipeline.to(device)
-                logger.info("Prior Pipeline успешно загружен!")
-                break
-            except Exception as e:
-                logger.warning(f"Попытка {attempt + 1} загрузки Prior Pipeline не удалась: {e}")
-                if attempt == max_retries - 1:
-                    raise e
-                
-        # Загружаем decoder pipeline с повторными попытками
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"Загружаем Kandinsky 2.2 Decoder Pipeline... (попытка {attempt + 1}/{max_retries})")
-                decoder_pipeline = KandinskyV22Pipeline.from_pretrained(
-                    "kandinsky-community/kandinsky-2-2-decoder",
-                    torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-                    resume_download=True,  # Возобновление загрузки при обрыве
-                    force_download=False   # Не перезагружать если уже есть
-                )
-                decoder_pipeline.to(device)
-                logger.info("Decoder Pipeline успешно загружен!")
-                break
-            except Exception as e:
-                logger.warning(f"Попытка {attempt + 1} загрузки Decoder Pipeline не удалась: {e}")
-                if attempt == max_retries - 1:
-                    raise e
+        if KANDINSKY_BACKEND == "onnx":
+            attach_onnx_backend(prior, decoder)
+        elif KANDINSKY_BACKEND != "torch":
+            raise ValueError(f"Неизвестный бэкенд: {KANDINSKY_BACKEND}. Доступны: torch, onnx")
         
         # Оптимизации для экономии памяти
         if device == "cuda":
             try:
-                prior_pipeline.enable_model_cpu_offload()
-                decoder_pipeline.enable_model_cpu_offload()
+                prior.enable_model_cpu_offload()
+                decoder.enable_model_cpu_offload()
                 logger.info("CPU offloading включен для экономии VRAM")
             except Exception as e:
                 logger.warning(f"Не удалось включить CPU offloading: {e}")
+        else:
+            cpu_optimizations = apply_cpu_optimizations(prior, decoder, CPU_OPTIMIZATIONS)
             
+        decoder_schedulers = create_schedulers(decoder)
+        prior_pipeline, decoder_pipeline = prior, decoder
         logger.info("Все модели успешно загружены!")
         return True
         
     except Exception as e:
         logger.error(f"Ошибка при загрузке моделей: {e}")
-        logger.error("Возможные причины: проблемы с сетью, недостаток места на диске, проблемы с Hugging Face Hub")
+        if MODELS_DIR:
+            logger.error(f"Проверьте каталог моделей {MODELS_DIR} (его создает save_models.py)")
+        else:
+            logger.error("Возможные причины: проблемы с сетью, недостаток места на диске, проблемы с Hugging Face Hub")
         return False
 
+def bf16_supported() -> bool:
+    """Поддерживает ли процессор быстрые bf16 операции oneDNN"""
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        return False
+
+def slice_decode(movq):
+    """Декодирование MoVQ по одному изображению батча: пиковая память не растет с размером батча"""
+    decode = movq.decode
+    
+    def sliced_decode(latents, *args, **kwargs):
+        if latents.shape[0] == 1:
+            return decode(latents, *args, **kwargs)
+        samples = [decode(latents[index:index + 1], *args, **kwargs)["sample"]
+                   for index in range(latents.shape[0])]
+        return {"sample": torch.cat(samples)}
+    
+    movq.decode = sliced_decode
+
+def apply_cpu_optimizations(prior, decoder, options: dict) -> dict:
+    """
+    Оптимизации инференса на CPU по профилю options (см. CPU_OPTIMIZATIONS)
+    
+    Возвращает примененные оптимизации; bf16 autocast включается в inference_context.
+    Неподдерживаемая оптимизация пропускается с предупреждением.
+    """
+    applied = {}
+    bf16 = options.get("bf16", "false")
+    if bf16 == "auto":
+        applied["bf16"] = bf16_supported()
+    else:
+        applied["bf16"] = bf16 in ("true", True)
+    
+    # С бэкендом onnx UNet и MoVQ - сессии ONNX Runtime, к ним применимо только VAE slicing
+    torch_modules = isinstance(decoder.unet, torch.nn.Module)
+    
+    if options.get("channels_last") and torch_modules:
+        decoder.unet.to(memory_format=torch.channels_last)
+        decoder.movq.to(memory_format=torch.channels_last)
+        applied["channels_last"] = True
+    
+    if options.get("attention_slicing") and torch_modules:
+        decoder.enable_attention_slicing()
+        applied["attention_slicing"] = True
+    
+    if options.get("vae_slicing"):
+        slice_decode(decoder.movq)
+        applied["vae_slicing"] = True
+    
+    if options.get("vae_tiling") and torch_modules:
+        if hasattr(decoder.movq, "enable_tiling"):
+            decoder.movq.enable_tiling()
+            applied["vae_tiling"] = True
+        else:
+            logger.warning("MoVQ в этой версии diffusers не поддерживает тайловое декодирование")
+    
+    if options.get("compile") and torch_modules:
+        try:
+            decoder.unet = torch.compile(decoder.unet)
+            applied["compile"] = True
+        except Exception as e:
+            logger.warning(f"Не удалось включить torch.compile: {e}")
+    
+    logger.info(f"Оптимизации CPU: {applied}")
+    return applied
+
+class OnnxComponent:
+    """
+    Компонент пайплайна на ONNX Runtime вместо torch модуля
+    
+    Каталог компонента (см. export_onnx.py) содержит модель ONNX и config.json -
+    конфигурацию исходного модуля, которую читают пайплайны diffusers.
+    """
+
+    def __init__(self, directory: str, filename: str = "model.onnx"):
+        # Импортируем лениво: пакет нужен только при выборе бэкенда onnx
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS > 0:
+            options.intra_op_num_threads = ONNX_THREADS
+        providers = ["CPUExecutionProvider"]
+        if device == "cuda":
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = ort.InferenceSession(os.path.join(directory, filename), options, providers=providers)
+        with open(os.path.join(directory, "config.json")) as config_file:
+            self.config = FrozenDict(json.load(config_file))
+        self.dtype = torch.float32
+
+    def run(self, reference: torch.Tensor, **inputs) -> torch.Tensor:
+        """Запуск сессии; результат возвращается на устройство тензора reference"""
+        feeds = {}
+        for name, value in inputs.items():
+            value = value.detach().cpu()
+            feeds[name] = (value.float() if value.is_floating_point() else value).numpy()
+        return torch.from_numpy(self.session.run(None, feeds)[0]).to(reference.device)
+
+
+def onnx_timestep(timestep) -> torch.Tensor:
+    """Шаг планировщика в формате входа экспортированных моделей: float32 формы (1,)"""
+    return torch.as_tensor(timestep, dtype=torch.float32).reshape(-1)[:1]
+
+
+class OnnxPrior(OnnxComponent):
+    """PriorTransformer на ONNX Runtime"""
+
+    def __init__(self, directory: str):
+        super().__init__(directory)
+        stats = np.load(os.path.join(directory, "clip_stats.npz"))
+        self.clip_mean = torch.from_numpy(stats["clip_mean"])
+        self.clip_std = torch.from_numpy(stats["clip_std"])
+
+    def __call__(self, hidden_states, timestep, proj_embedding, encoder_hidden_states=None,
+                 attention_mask=None, return_dict=True):
+        predicted = self.run(
+            hidden_states,
+            hidden_states=hidden_states,
+            timestep=onnx_timestep(timestep),
+            proj_embedding=proj_embedding,
+            encoder_hidden_states=encoder_hidden_states,
+            attention_mask=attention_mask
+        )
+        return SimpleNamespace(predicted_image_embedding=predicted)
+
+    def post_process_latents(self, prior_latents):
+        return prior_latents * self.clip_std.to(prior_latents) + self.clip_mean.to(prior_latents)
+
+
+class OnnxUNet(OnnxComponent):
+    """UNet декодера на ONNX Runtime"""
+
+    def __call__(self, sample, timestep, encoder_hidden_states=None, added_cond_kwargs=None,
+                 return_dict=False, **kwargs):
+        noise_pred = self.run(
+            sample,
+            sample=sample,
+            timestep=onnx_timestep(timestep),
+            image_embeds=added_cond_kwargs["image_embeds"]
+        )
+        return (noise_pred,)
+
+
+class OnnxMoVQ(OnnxComponent):
+    """Декодер MoVQ на ONNX Runtime (экспортирован только путь force_not_quantize=True)"""
+
+    def decode(self, latents, force_not_quantize=True, return_dict=True):
+        return {"sample": self.run(latents, latents=latents)}
+
+
+def attach_onnx_backend(prior, decoder, directory: str = ONNX_DIR, int8_unet: bool = ONNX_INT8_UNET):
+    """Замена prior, UNet и MoVQ в пайплайнах на модели ONNX Runtime из directory"""
+    unet_file = "model.int8.onnx" if int8_unet else "model.onnx"
+    for path in (os.path.join(directory, "prior", "model.onnx"), os.path.join(directory, "unet", unet_file),
+                 os.path.join(directory, "movq", "model.onnx")):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Модель ONNX не найдена: {path}. Выполните export_onnx.py")
+    
+    # Torch модули освобождаются до создания сессий, чтобы не держать в памяти обе копии весов
+    prior.prior = decoder.unet = decoder.movq = None
+    gc.collect()
+    prior.prior = OnnxPrior(os.path.join(directory, "prior"))
+    decoder.unet = OnnxUNet(os.path.join(directory, "unet"), unet_file)
+    decoder.movq = OnnxMoVQ(os.path.join(directory, "movq"))
+    logger.info(f"Бэкенд ONNX Runtime: модели из {directory}, UNet {'int8' if int8_unet else 'fp32'}")
+
+def inference_context():
+    """Контекст запуска пайплайнов: bf16 autocast, если он включен профилем CPU"""
+    if cpu_optimizations.get("bf16"):
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+def load_hub_pipeline(pipeline_class, model_name: str, label: str, dtype, timings: dict):
+    """Загрузка пайплайна с Hugging Face Hub (или из его кэша) с повторными попытками"""
+    # Максимальное количество попыток загрузки
+    max_retries = 3
+    
+    for attempt in range(max_retries):
+        try:
+            logger.info(f"Загружаем Kandinsky 2.2 {label}... (попытка {attempt + 1}/{max_retries})")
+            start = time.perf_counter()
+            pipeline = pipeline_class.from_pretrained(
+                model_name,
+                torch_dtype=dtype,
+                resume_download=True,  # Возобновление загрузки при обрыве
+                force_download=False   # Не перезагружать если уже есть
+            )
+            timings[label] = round(time.perf_counter() - start, 2)
+            logger.info(f"{label} успешно загружен за {timings[label]:.1f} с!")
+            return pipeline
+        except Exception as e:
+            logger.warning(f"Попытка {attempt + 1} загрузки {label} не удалась: {e}")
+            if attempt == max_retries - 1:
+                raise e
+
+def load_component(directory: str, name: str, library: str, class_name: str, dtype, timings: dict, key: str):
+    """Загрузка одного компонента пайплайна из локального каталога"""
+    component_class = getattr(importlib.import_module(library), class_name)
+    options = {"local_files_only": True}
+    if issubclass(component_class, torch.nn.Module):
+        # Веса читаются из safetensors через mmap, без промежуточной инициализации случайными значениями
+        options.update(torch_dtype=dtype, use_safetensors=True, low_cpu_mem_usage=True)
+    start = time.perf_counter()
+    component = component_class.from_pretrained(os.path.join(directory, name), **options)
+    timings[key] = round(time.perf_counter() - start, 2)
+    return component
+
+def load_local_pipelines(dtype, timings: dict) -> tuple:
+    """
+    Загрузка prior и decoder из MODELS_DIR без обращения к Hugging Face Hub
+    
+    Каталог содержит prior/ и decoder/ в формате save_pretrained (см. save_models.py).
+    Компоненты обоих пайплайнов по model_index.json загружаются параллельно
+    в MODEL_LOAD_WORKERS потоков; время каждого записывается в timings.
+    """
+    pipelines = {"prior": KandinskyV22PriorPipeline, "decoder": KandinskyV22Pipeline}
+    with ThreadPoolExecutor(max_workers=MODEL_LOAD_WORKERS, thread_name_prefix="kandinsky-load") as pool:
+        futures = {}
+        for pipeline_name in pipelines:
+            directory = os.path.join(MODELS_DIR, pipeline_name)
+            with open(os.path.join(directory, "model_index.json")) as index_file:
+                index = json.load(index_file)
+            for name, spec in index.items():
+                if name.startswith("_") or not isinstance(spec, list) or spec[0] is None:
+                    continue
+                key = f"{pipeline_name}/{name}"
+                futures[key] = pool.submit(load_component, directory, name, spec[0], spec[1], dtype, timings, key)
+        components = {key: future.result() for key, future in futures.items()}
+
+    logger.info(f"Модели загружены из {MODELS_DIR}: {timings}")
+    return tuple(
+        pipeline_class(**{
+            key.split("/", 1)[1]: component for key, component in components.items()
+            if key.startswith(f"{pipeline_name}/")
+        })
+        for pipeline_name, pipeline_class in pipelines.items()
+    )
+
+def record_load_stats(timings: dict, seconds: float):
+    """Время загрузки моделей; первая успешная загрузка задает время холодного старта"""
+    load_stats.update(
+        source=MODELS_DIR or "hub",
+        seconds=round(seconds, 2),
+        components=timings
+    )
+    if load_stats.get("cold_start_seconds") is None:
+        load_stats["cold_start_seconds"] = round(time.time() - PROCESS_START, 2)
+        logger.info(f"Холодный старт: {load_stats['cold_start_seconds']:.1f} с от запуска процесса")
+
+def create_schedulers(decoder) -> dict:
+    """Планировщики декодера, созданные из конфигурации штатного планировщика модели"""
+    config = decoder.scheduler.config
+    schedulers = {}
+    for name, scheduler_class in SCHEDULERS.items():
+        if isinstance(decoder.scheduler, scheduler_class):
+            schedulers[name] = decoder.scheduler
+        else:
+            schedulers[name] = scheduler_class.from_config(config)
+    return schedulers
+
+startup_load = None
+
 @app.on_event("startup")
 async def startup_event():
     """Событие запуска приложения"""
+    global generation_batcher, startup_load
     logger.info("Запуск сервиса Kandinsky 2.2...")
+    inference_worker.start()
+    generation_batcher = GenerationBatcher()
+    generation_jobs.start()
+    # Модели загружаются в потоке инференса: /health отвечает уже во время загрузки
+    startup_load = asyncio.create_task(load_models_on_startup())
+
+async def load_models_on_startup():
+    """Фоновая загрузка моделей при старте"""
     try:
-        success = load_models()
+        success = await reload_pipelines()
         if not success:
             logger.error("Не удалось загрузить модели при старте!")
             logger.info("Сервис будет работать, но модели нужно будет загрузить позже через /reload")
@@ -118,78 +683,615 @@ async def startup_event():
         logger.error(f"Ошибка при запуске: {e}")
         logger.info("Сервис продолжит работу, но без загруженных моделей")
 
+async def reload_pipelines() -> bool:
+    """Загрузка моделей в потоке инференса после уже принятых генераций"""
+    global models_loading
+    models_loading = True
+    try:
+        return await inference_worker.submit(load_models, timed=False)
+    finally:
+        models_loading = False
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Проверка здоровья сервиса"""
     models_loaded = prior_pipeline is not None and decoder_pipeline is not None
+    if models_loading:
+        status = "loading"
+    else:
+        status = "healthy" if models_loaded else "unhealthy"
     return HealthResponse(
-        status="healthy" if models_loaded else "unhealthy",
+        status=status,
         device=device or "unknown",
-        models_loaded=models_loaded
+        models_loaded=models_loaded,
+        queue_depth=generation_jobs.depth,
+        inference_queue_depth=inference_worker.depth
     )
 
-@app.post("/generate")
-async def generate_image(request: ImageGenerationRequest):
-    """Генерация изображения по текстовому описанию"""
+def check_models_ready():
+    """503, если модели не загружены; во время загрузки - с Retry-After"""
+    if models_loading:
+        raise HTTPException(
+            status_code=503,
+            detail="Модели загружаются, повторите позже",
+            headers={"Retry-After": str(MODELS_LOADING_RETRY_AFTER)}
+        )
     if prior_pipeline is None or decoder_pipeline is None:
         raise HTTPException(status_code=503, detail="Модели не загружены")
+
+def make_generators(seeds: list):
+    """
+    Генераторы случайных чисел по одному на элемент батча (None - если seed не задан ни у кого)
     
-    try:
-        logger.info(f"Генерация изображения по промпту: {request.prompt}")
-        
-        # Генерируем эмбеддинги через prior pipeline
-        logger.info("Генерация image embeddings...")
+    Элемент с seed воспроизводим независимо от того, с какими запросами он попал в батч.
+    """
+    if all(seed is None for seed in seeds):
+        return None
+    generators = []
+    for seed in seeds:
+        generator = torch.Generator(device="cpu")
+        if seed is not None:
+            generator.manual_seed(seed)
+        else:
+            generator.seed()
+        generators.append(generator)
+    return generators
+
+def run_prior(prompts: list, negative_prompts: Optional[list], scale: float, seeds: list):
+    """
+    Один запуск prior pipeline на батче промптов
+    
+    Возвращает (image_embeds, negative_image_embeds, секунды на один промпт).
+    """
+    # С негативными промптами pipeline дописывает их в батч - генераторы нужны и для них
+    generators = make_generators(seeds + seeds if negative_prompts is not None else seeds)
+    start = time.perf_counter()
+    with inference_context():
         image_embeds, negative_image_embeds = prior_pipeline(
-            prompt=request.prompt,
-            negative_prompt=request.negative_prompt,
-            guidance_scale=request.prior_guidance_scale,
-            num_inference_steps=25
+            prompt=prompts,
+            negative_prompt=negative_prompts,
+            guidance_scale=scale,
+            num_inference_steps=PRIOR_STEPS,
+            generator=generators
         ).to_tuple()
-        
-        # Генерируем изображение через decoder pipeline
-        logger.info("Генерация изображения...")
+    return image_embeds, negative_image_embeds, (time.perf_counter() - start) / len(prompts)
+
+def resolve_prior(tasks: dict, scale: float) -> dict:
+    """
+    Эмбеддинги prior для набора ключей кэша
+    
+    tasks: ключ -> (prompt, negative_prompt, seed). Промахи кэша считаются батчем - по одному
+    запуску prior на режим (с негативными промптами в батче и без них).
+    Возвращает ключ -> (кортеж тензоров, секунды вычисления, из кэша ли).
+    """
+    resolved = {}
+    misses = {True: [], False: []}
+    for key, (prompt, negative_prompt, seed) in tasks.items():
+        entry = prior_cache.get(key)
+        if entry is not None:
+            resolved[key] = (entry[0], entry[1], True)
+        else:
+            misses[negative_prompt is not None].append((key, prompt, negative_prompt, seed))
+    
+    for with_negative, group in misses.items():
+        if not group:
+            continue
+        keys, prompts, negative_prompts, seeds = (list(column) for column in zip(*group))
+        image_embeds, negative_image_embeds, seconds = run_prior(
+            prompts, negative_prompts if with_negative else None, scale, seeds
+        )
+        for index, key in enumerate(keys):
+            tensors = (image_embeds[index:index + 1], negative_image_embeds[index:index + 1])
+            prior_cache.put(key, tensors, seconds)
+            resolved[key] = (tensors, seconds, False)
+    return resolved
+
+def compute_prior_embeddings(requests: list) -> list:
+    """
+    Эмбеддинги изображений и негативных промптов для батча запросов с учетом кэша
+    
+    При prior_guidance_scale <= 1 негативный промпт не участвует в guidance, и его эмбеддинг
+    не зависит от основного промпта: он вычисляется один раз отдельно и переиспользуется,
+    а основной промпт идет в prior без негативной половины батча. Для каждого запроса
+    возвращает (image_embeds, negative_image_embeds, все ли из кэша, сэкономленные секунды).
+    """
+    scale = requests[0].prior_guidance_scale  # Одинаков для всех запросов батча
+    tasks = {}
+    for request in requests:
+        key = (request.prompt, request.negative_prompt, scale, request.seed)
+        if request.negative_prompt is not None and scale <= 1.0:
+            tasks[(None, request.negative_prompt, scale, request.seed)] = (request.negative_prompt, None, request.seed)
+            tasks[key] = (request.prompt, None, request.seed)
+        else:
+            tasks[key] = (request.prompt, request.negative_prompt, request.seed)
+    resolved = resolve_prior(tasks, scale)
+    
+    results = []
+    for request in requests:
+        tensors, seconds, cached = resolved[(request.prompt, request.negative_prompt, scale, request.seed)]
+        saved = seconds if cached else 0.0
+        if request.negative_prompt is not None and scale <= 1.0:
+            negative_tensors, negative_seconds, negative_cached = resolved[
+                (None, request.negative_prompt, scale, request.seed)
+            ]
+            saved += negative_seconds if negative_cached else 0.0
+            results.append((tensors[0], negative_tensors[0], cached and negative_cached, saved))
+        else:
+            results.append((tensors[0], tensors[1], cached, saved))
+    return results
+
+def batch_key(request: ImageGenerationRequest) -> tuple:
+    """Параметры, которые должны совпадать у запросов одного батча"""
+    return (request.width, request.height, request.num_inference_steps,
+            request.guidance_scale, request.prior_guidance_scale,
+            request.scheduler or DEFAULT_SCHEDULER)
+
+def decode_previews(latents, indexes: list) -> list:
+    """
+    Быстрые превью по латентам декодера: JPEG не больше PREVIEW_SIZE пикселей по большей стороне
+    
+    Латенты уменьшаются до размера превью и только потом декодируются MoVQ, поэтому
+    декодирование превью в (размер изображения / PREVIEW_SIZE)^2 раз дешевле финального.
+    """
+    latents = latents[indexes]
+    height, width = latents.shape[-2:]
+    factor = PREVIEW_SIZE / (max(height, width) * decoder_pipeline.movq_scale_factor)
+    with torch.no_grad():
+        if factor < 1:
+            latents = torch.nn.functional.interpolate(
+                latents, size=(max(1, round(height * factor)), max(1, round(width * factor))), mode="bilinear"
+            )
+        images = decoder_pipeline.movq.decode(latents, force_not_quantize=True)["sample"]
+    images = (images * 0.5 + 0.5).clamp(0, 1).permute(0, 2, 3, 1).float().cpu().numpy()
+    
+    previews = []
+    for image in decoder_pipeline.numpy_to_pil(images):
+        image_io = io.BytesIO()
+        image.save(image_io, format="JPEG", quality=PREVIEW_QUALITY)
+        previews.append(image_io.getvalue())
+    return previews
+
+def make_step_callback(step_callbacks: list, total: int):
+    """
+    callback_on_step_end декодера: каждые PREVIEW_EVERY шагов отдает превью запросам батча
+    
+    step_callbacks - по одной функции (step, total, preview) на запрос батча или None.
+    Ошибка построения превью не прерывает генерацию: превью для батча отключаются.
+    """
+    indexes = [index for index, callback in enumerate(step_callbacks) if callback is not None]
+    
+    def on_step_end(pipeline, step, timestep, callback_kwargs):
+        step += 1
+        if indexes and step % PREVIEW_EVERY == 0 and step < total:
+            try:
+                previews = decode_previews(callback_kwargs["latents"], indexes)
+            except Exception as e:
+                logger.warning(f"Не удалось построить превью, превью отключены до конца генерации: {e}")
+                indexes.clear()
+                return callback_kwargs
+            for index, preview in zip(indexes, previews):
+                step_callbacks[index](step, total, preview)
+        return callback_kwargs
+    
+    return on_step_end
+
+def generate_batch(requests: list, step_callbacks: Optional[list] = None, encode: bool = True) -> list:
+    """
+    Генерация батча изображений одним проходом prior и декодера; выполняется в потоке инференса
+    
+    Запросы должны иметь одинаковый batch_key. step_callbacks - функции (step, total, preview)
+    для превью по запросам (None - без превью). Для каждого запроса возвращает словарь
+    с prior_cached, prior_seconds_saved и полями encode_image, а при encode=False -
+    с некодированным изображением в pil_image.
+    """
+    if prior_pipeline is None or decoder_pipeline is None:
+        raise HTTPException(status_code=503, detail="Модели не загружены")
+    logger.info(f"Генерация {len(requests)} изображений по промптам: {[request.prompt for request in requests]}")
+    
+    # Генерируем эмбеддинги через prior pipeline (или берем из кэша)
+    logger.info("Генерация image embeddings...")
+    priors = compute_prior_embeddings(requests)
+    seconds_saved = sum(prior[3] for prior in priors)
+    if seconds_saved > 0:
+        logger.info(f"Эмбеддинги prior из кэша: сэкономлено {seconds_saved:.2f} с")
+    dtype = decoder_pipeline.unet.dtype
+    first = requests[0]
+    
+    # Поток инференса один, поэтому планировщик можно переключать перед каждым батчем
+    if not decoder_schedulers:
+        decoder_schedulers.update(create_schedulers(decoder_pipeline))
+    decoder_pipeline.scheduler = decoder_schedulers[first.scheduler or DEFAULT_SCHEDULER]
+    
+    # Превью считаются только для запросов, которые их ждут
+    callback = None
+    if PREVIEW_EVERY > 0 and step_callbacks and any(step_callbacks):
+        callback = make_step_callback(step_callbacks, first.num_inference_steps)
+    
+    # Генерируем изображения через decoder pipeline
+    logger.info("Генерация изображений...")
+    with inference_context():
         images = decoder_pipeline(
-            image_embeds=image_embeds,
-            negative_image_embeds=negative_image_embeds,
-            width=request.width,
-            height=request.height,
-            num_inference_steps=request.num_inference_steps,
-            guidance_scale=request.guidance_scale
+            image_embeds=torch.cat([prior[0] for prior in priors]).to(device, dtype),
+            negative_image_embeds=torch.cat([prior[1] for prior in priors]).to(device, dtype),
+            width=first.width,
+            height=first.height,
+            num_inference_steps=first.num_inference_steps,
+            guidance_scale=first.guidance_scale,
+            generator=make_generators([request.seed for request in requests]),
+            callback_on_step_end=callback
         ).images
-        
-        # Сохраняем изображение в BytesIO
-        image_io = io.BytesIO()
-        images[0].save(image_io, format="PNG")
-        image_io.seek(0)
-        
-        logger.info("Изображение успешно сгенерировано!")
-        
-        return Response(
-            content=image_io.getvalue(),
-            media_type="image/png",
-            headers={
-                "Content-Disposition": "inline; filename=generated_image.png"
+    
+    results = []
+    for request, image, (_, _, prior_cached, saved) in zip(requests, images, priors):
+        result = {"prior_cached": prior_cached, "prior_seconds_saved": saved}
+        if encode:
+            result.update(encode_image(image, request))
+        else:
+            result["pil_image"] = image
+        results.append(result)
+    
+    logger.info("Изображения успешно сгенерированы!")
+    return results
+
+def encode_image(image, request: ImageGenerationRequest) -> dict:
+    """
+    Кодирование изображения в формат запроса
+    
+    Возвращает словарь: image (байты), format, media_type и encode_seconds.
+    """
+    output_format = request.output_format or "png"
+    pillow_format, media_type, _ = OUTPUT_FORMATS[output_format]
+    options = {"compress_level": PNG_COMPRESS_LEVEL} if output_format == "png" else {"quality": request.quality}
+    start = time.perf_counter()
+    image_io = io.BytesIO()
+    image.save(image_io, format=pillow_format, **options)
+    encode_seconds = time.perf_counter() - start
+    
+    data = image_io.getvalue()
+    encoding_stats.record(output_format, len(data), encode_seconds)
+    return {
+        "image": data,
+        "format": output_format,
+        "media_type": media_type,
+        "encode_seconds": encode_seconds,
+    }
+
+
+class EncodingStats:
+    """Число изображений, байты и время кодирования по форматам"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.formats = {}
+
+    def record(self, output_format: str, size: int, seconds: float):
+        with self.lock:
+            stats = self.formats.setdefault(output_format, {"images": 0, "bytes": 0, "seconds": 0.0})
+            stats["images"] += 1
+            stats["bytes"] += size
+            stats["seconds"] += seconds
+
+    def metrics(self) -> dict:
+        with self.lock:
+            return {
+                output_format: {
+                    "images": stats["images"],
+                    "average_kb": round(stats["bytes"] / stats["images"] / 1024, 1),
+                    "average_encode_ms": round(stats["seconds"] / stats["images"] * 1000, 1),
+                }
+                for output_format, stats in self.formats.items()
             }
+
+
+encoding_stats = EncodingStats()
+# Изображения кодируются вне потока инференса и event loop: следующий батч не ждет кодирования
+encode_executor = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="kandinsky-encode")
+
+
+class GenerationBatcher:
+    """Собирает одновременные запросы генерации в батчи
+
+    Первый запрос открывает окно BATCH_WINDOW; запросы с тем же batch_key, пришедшие
+    за это время (но не больше MAX_BATCH_SIZE), генерируются одним вызовом generate_batch.
+    Пока батч считается в потоке инференса, новые запросы копятся и образуют следующий.
+    Запросов в ожидании - не больше max_pending, сверх этого submit выбрасывает QueueFullError.
+    """
+
+    def __init__(self, window: float = BATCH_WINDOW, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_pending: int = INFERENCE_QUEUE_SIZE):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+        self.slots = asyncio.Semaphore(1)
+        self.queues = {}
+        self.tasks = []
+        self.pending = 0
+        self.batches = 0
+        self.requests = 0
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+    async def submit(self, request: ImageGenerationRequest, on_step=None) -> dict:
+        """Генерация в составе батча; on_step(step, total, preview) вызывается из потока инференса"""
+        if self.pending >= self.max_pending:
+            raise QueueFullError(inference_worker.retry_after())
+        key = batch_key(request)
+        if key not in self.queues:
+            self.queues[key] = asyncio.Queue()
+            self.tasks.append(asyncio.create_task(self._run(self.queues[key])))
+        future = asyncio.get_running_loop().create_future()
+        self.pending += 1
+        try:
+            await self.queues[key].put((request, future, on_step))
+            return await future
+        finally:
+            self.pending -= 1
+
+    async def _collect(self, queue: asyncio.Queue, first) -> list:
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            # Пока поток инференса занят, запросы копятся в очереди и попадут в следующий батч.
+            # Слот занимается только при наличии запроса, чтобы пустая очередь не блокировала остальные
+            first = await queue.get()
+            await self.slots.acquire()
+            batch = await self._collect(queue, first)
+            self.tasks.append(asyncio.create_task(self._execute(batch)))
+            self.tasks = [task for task in self.tasks if not task.done()]
+
+    async def _execute(self, batch: list):
+        requests = [request for request, _, _ in batch]
+        step_callbacks = [on_step for _, _, on_step in batch]
+        try:
+            results = await inference_worker.submit(generate_batch, requests, step_callbacks, False)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            # Слот освобождается до кодирования: следующий батч считается параллельно с ним
+            self.slots.release()
+        self.batches += 1
+        self.requests += len(batch)
+        
+        loop = asyncio.get_running_loop()
+        encoded = await asyncio.gather(
+            *(loop.run_in_executor(encode_executor, encode_image, result.pop("pil_image"), request)
+              for result, request in zip(results, requests)),
+            return_exceptions=True
         )
+        for (_, future, _), result, image in zip(batch, results, encoded):
+            if future.done():
+                continue
+            if isinstance(image, Exception):
+                future.set_exception(image)
+            else:
+                result.update(image)
+                future.set_result(result)
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.requests / self.batches if self.batches else 0.0
+
+
+generation_batcher = None
+
+def negotiate_format(request: ImageGenerationRequest, accept: str) -> ImageGenerationRequest:
+    """Формат ответа по заголовку Accept, если он не задан в запросе явно"""
+    if request.output_format is not None:
+        return request
+    for output_format in ("webp", "jpeg"):
+        if OUTPUT_FORMATS[output_format][1] in accept:
+            return request.model_copy(update={"output_format": output_format})
+    return request
+
+def image_response(result: dict) -> Response:
+    """
+    HTTP ответ с изображением
+    
+    Изображение к этому моменту уже целиком закодировано в пуле кодирования, поэтому
+    тело отдается как есть, без копий; в заголовках - сведения о кэше prior и время кодирования.
+    """
+    extension = OUTPUT_FORMATS[result["format"]][2]
+    return Response(
+        content=result["image"],
+        media_type=result["media_type"],
+        headers={
+            "Content-Disposition": f"inline; filename=generated_image.{extension}",
+            "X-Prior-Cache": "hit" if result["prior_cached"] else "miss",
+            "X-Prior-Seconds-Saved": f"{result['prior_seconds_saved']:.2f}",
+            "X-Encode-Seconds": f"{result['encode_seconds']:.3f}",
+        }
+    )
+
+async def run_generation_job(request: ImageGenerationRequest, report_progress) -> dict:
+    """Исполнитель задачи из очереди: генерация через батчер с превью в описании задачи"""
+    loop = asyncio.get_running_loop()
+    
+    def on_step(step: int, total: int, preview: bytes):
+        # Вызывается из потока инференса - прогресс передается в event loop
+        loop.call_soon_threadsafe(report_progress, step, total, preview)
+    
+    while True:
+        try:
+            return await generation_batcher.submit(request, on_step)
+        except QueueFullError as e:
+            # Генератор занят прямыми запросами /generate - задача ждет своей очереди
+            await asyncio.sleep(e.retry_after)
+
+generation_jobs = JobQueue(run_generation_job, JOB_QUEUE_SIZE, JOB_WORKERS, JOB_RESULT_TTL)
+
+@app.post("/generate")
+async def generate_image(request: ImageGenerationRequest, http_request: Request):
+    """Генерация изображения по текстовому описанию (формат - output_format или заголовок Accept)"""
+    check_models_ready()
+    request = negotiate_format(request, http_request.headers.get("accept", ""))
+    
+    try:
+        return image_response(await generation_batcher.submit(request))
         
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Генератор занят, повторите позже",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при генерации изображения: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка генерации: {str(e)}")
 
+@app.post("/jobs/generate", status_code=202)
+async def submit_generation_job(request: ImageGenerationRequest):
+    """
+    Постановка генерации изображения в очередь
+    
+    Сразу возвращает job_id; статус - через GET /jobs/{job_id}, изображение -
+    через GET /jobs/{job_id}/result. При заполненной очереди отвечает 503 с Retry-After.
+    """
+    check_models_ready()
+    
+    try:
+        job = generation_jobs.submit(request)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Очередь генерации заполнена ({generation_jobs.depth} задач). Повторите позже.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    logger.info(f"Задача {job['id']} поставлена в очередь: {request.prompt}")
+    return generation_jobs.describe(job)
+
+@app.get("/jobs/{job_id}")
+async def get_generation_job(job_id: str, wait: float = 0, after_step: Optional[int] = None):
+    """
+    Статус задачи генерации
+    
+    Args:
+        job_id: Идентификатор задачи
+        wait: Long-poll - сколько секунд ждать завершения (не больше 30)
+        after_step: Завершить long-poll раньше, когда появится превью новее этого шага
+    """
+    job = await generation_jobs.wait(job_id, min(max(wait, 0.0), JOB_MAX_WAIT), after_step)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена или ее результат уже удален")
+    
+    response = generation_jobs.describe(job)
+    if job["status"] == "done":
+        response["result_url"] = f"/jobs/{job_id}/result"
+    return response
+
+@app.get("/jobs/{job_id}/preview")
+async def get_generation_preview(job_id: str):
+    """Последнее превью выполняющейся задачи генерации (JPEG)"""
+    job = generation_jobs.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена или ее результат уже удален")
+    if job["preview"] is None:
+        raise HTTPException(status_code=404, detail="Превью еще нет")
+    
+    return Response(
+        content=job["preview"],
+        media_type="image/jpeg",
+        headers={
+            "X-Preview-Step": str(job["preview_step"]),
+            "X-Total-Steps": str(job["total_steps"]),
+        }
+    )
+
+@app.get("/jobs/{job_id}/result")
+async def get_generation_result(job_id: str):
+    """Изображение завершенной задачи генерации"""
+    job = generation_jobs.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена или ее результат уже удален")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Задача еще не завершена (статус: {job['status']})")
+    
+    return image_response(job["result"])
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики сервиса: кэш эмбеддингов prior и очереди"""
+    return {
+        "prior_cache": prior_cache.metrics(),
+        "encoding": encoding_stats.metrics(),
+        "jobs": {
+            "queue_depth": generation_jobs.depth,
+            "queue_size": generation_jobs.max_queued,
+            "running": generation_jobs.running
+        },
+        "inference_queue_depth": inference_worker.depth,
+        "loading": load_stats,
+        "backend": {
+            "name": KANDINSKY_BACKEND,
+            "int8_unet": KANDINSKY_BACKEND == "onnx" and ONNX_INT8_UNET
+        },
+        "cpu_optimizations": cpu_optimizations,
+        "batching": {
+            "batches": generation_batcher.batches,
+            "average_batch_size": round(generation_batcher.average_batch_size, 2)
+        }
+    }
+
 @app.post("/reload")
 async def reload_models():
-    """Повторная загрузка моделей"""
+    """
+    Повторная загрузка моделей
+    
+    Загрузка выполняется в потоке инференса: уже принятые генерации завершаются на прежних
+    моделях, новые ждут окончания загрузки.
+    """
     logger.info("Запрос на повторную загрузку моделей...")
+    if models_loading:
+        raise HTTPException(status_code=409, detail="Загрузка моделей уже выполняется")
     try:
-        success = load_models()
+        success = await reload_pipelines()
         if success:
-            return {"status": "success", "message": "Модели успешно загружены"}
+            return {
+                "status": "success",
+                "message": "Модели успешно загружены",
+                "load_seconds": load_stats.get("seconds"),
+                "components": load_stats.get("components")
+            }
         else:
             raise HTTPException(status_code=500, detail="Не удалось загрузить модели")
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Очередь инференса заполнена, повторите позже",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         logger.error(f"Ошибка при перезагрузке моделей: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка перезагрузки: {str(e)}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Остановка очереди задач, потока инференса и кодирования при завершении сервиса"""
+    generation_jobs.stop()
+    generation_batcher.stop()
+    inference_worker.stop()
+    encode_executor.shutdown(wait=False)
+
 @app.get("/")
 async def root():
     """Корневой эндпоинт"""
@@ -199,9 +1301,16 @@ async def root():
         "endpoints": {
             "/health": "Проверка статуса сервиса",
             "/generate": "POST - Генерация изображения",
+            "/jobs/generate": "POST - Постановка генерации в очередь",
+            "/jobs/{job_id}": "GET - Статус задачи (long-poll через ?wait=)",
+            "/jobs/{job_id}/preview": "GET - Последнее превью выполняющейся задачи",
+            "/jobs/{job_id}/result": "GET - Изображение завершенной задачи",
             "/reload": "POST - Повторная загрузка моделей",
+            "/metrics": "Метрики кэша эмбеддингов prior и очередей",
             "/docs": "Swagger документация"
-        }
+        },
+        "presets": GENERATION_PRESETS,
+        "schedulers": list(SCHEDULERS)
     }
 
 if __name__ == "__main__":
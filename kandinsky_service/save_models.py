@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Сохранение Kandinsky 2.2 в локальный каталог safetensors для быстрого старта сервиса
+
+Запускается рядом с main.py:
+    python save_models.py --output models
+    python save_models.py --output models --fp16   # веса в float16 (для GPU)
+
+Сервис загружает сохраненные модели при KANDINSKY_MODELS_DIR=<output>: компоненты читаются
+параллельно из файлов safetensors без обращения к Hugging Face Hub.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+PRIOR_MODEL = "kandinsky-community/kandinsky-2-2-prior"
+DECODER_MODEL = "kandinsky-community/kandinsky-2-2-decoder"
+
+
+def save_pipeline(pipeline, directory: str):
+    """Сохранение пайплайна в directory: model_index.json и подкаталоги компонентов"""
+    start = time.perf_counter()
+    pipeline.save_pretrained(directory, safe_serialization=True)
+    size = sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(directory)
+        for name in names
+    )
+    print(f"   {directory}: {size / 1024 ** 3:.2f} ГБ за {time.perf_counter() - start:.1f} с")
+
+
+def main_cli():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description="Сохранение Kandinsky 2.2 в локальный каталог")
+    parser.add_argument("--output", default="models", help="Каталог для моделей")
+    parser.add_argument("--fp16", action="store_true", help="Сохранить веса в float16")
+    parser.add_argument("--tiny", action="store_true", help="Крошечные пайплайны со случайными весами (для проверки)")
+    args = parser.parse_args()
+
+    dtype = torch.float16 if args.fp16 else torch.float32
+
+    print("📦 Загрузка пайплайнов...")
+    if args.tiny:
+        from tiny_pipelines import build_tiny_pipelines
+        prior_pipeline, decoder_pipeline = build_tiny_pipelines()
+    else:
+        from diffusers import KandinskyV22Pipeline, KandinskyV22PriorPipeline
+        prior_pipeline = KandinskyV22PriorPipeline.from_pretrained(PRIOR_MODEL, torch_dtype=dtype)
+        decoder_pipeline = KandinskyV22Pipeline.from_pretrained(DECODER_MODEL, torch_dtype=dtype)
+
+    print(f"💾 Сохранение в {args.output}")
+    save_pipeline(prior_pipeline, os.path.join(args.output, "prior"))
+    save_pipeline(decoder_pipeline, os.path.join(args.output, "decoder"))
+    print("✅ Готово")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
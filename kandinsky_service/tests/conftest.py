@@ -0,0 +1,59 @@
+"""
+Общие настройки тестов Kandinsky сервиса
+
+Запуск из каталога сервиса (нужны зависимости из requirements.txt и pytest):
+    python -m pytest tests
+
+Модели Kandinsky 2.2 не загружаются: генерация проверяется на крошечных пайплайнах
+со случайными весами (tiny_pipelines.py).
+"""
+
+import copy
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def make_request(prompt: str = "котенок", **fields) -> main.ImageGenerationRequest:
+    """Запрос генерации маленького изображения за несколько шагов"""
+    fields = {"width": 64, "height": 64, "num_inference_steps": 2, "seed": 0, **fields}
+    return main.ImageGenerationRequest(prompt=prompt, **fields)
+
+
+@pytest.fixture(scope="session")
+def tiny_pipelines_template():
+    """Крошечные пайплайны строятся один раз; тесты получают их копии"""
+    from tiny_pipelines import build_tiny_pipelines
+    return build_tiny_pipelines()
+
+
+@pytest.fixture
+def tiny_models(monkeypatch, tiny_pipelines_template):
+    """Копия крошечных пайплайнов в роли загруженных моделей сервиса"""
+    prior, decoder = copy.deepcopy(tiny_pipelines_template)
+    monkeypatch.setattr(main, "prior_pipeline", prior)
+    monkeypatch.setattr(main, "decoder_pipeline", decoder)
+    monkeypatch.setattr(main, "device", "cpu")
+    monkeypatch.setattr(main, "decoder_schedulers", {})
+    monkeypatch.setattr(main, "cpu_optimizations", {})
+    monkeypatch.setattr(main, "prior_cache", main.PriorEmbeddingCache())
+    return prior, decoder
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """Свой поток инференса вместо общего inference_worker"""
+    started = main.InferenceWorker(max_queued=2)
+    started.start()
+    monkeypatch.setattr(main, "inference_worker", started)
+    yield started
+    started.stop()
+    started.thread.join(timeout=5)
@@ -0,0 +1,109 @@
+"""Батчирование одновременных генераций с совместимыми параметрами"""
+
+import asyncio
+import io
+
+import httpx
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import make_request
+import main
+
+
+@pytest.fixture
+def batch_calls(monkeypatch, tiny_models, worker):
+    """Размеры батчей, прошедших через generate_batch"""
+    calls = []
+    generate_batch = main.generate_batch
+
+    def spy(requests, step_callbacks=None, encode=True):
+        calls.append([request.prompt for request in requests])
+        return generate_batch(requests, step_callbacks, encode)
+
+    monkeypatch.setattr(main, "generate_batch", spy)
+    return calls
+
+
+def run_batched(requests: list, **batcher_options) -> tuple:
+    """Одновременная отправка запросов в новый батчер; исключения возвращаются как результаты"""
+    async def scenario():
+        batcher = main.GenerationBatcher(**batcher_options)
+        try:
+            results = await asyncio.wait_for(asyncio.gather(
+                *(batcher.submit(request) for request in requests), return_exceptions=True
+            ), timeout=120)
+            return results, batcher
+        finally:
+            batcher.stop()
+
+    return asyncio.run(scenario())
+
+
+def pixels(result: dict) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(result["image"])).convert("RGB"), np.int16)
+
+
+def test_compatible_requests_share_one_batch(batch_calls):
+    requests = [make_request(prompt, seed=seed) for prompt, seed in (("котенок", 1), ("щенок", 2), ("котенок", 1))]
+
+    results, batcher = run_batched(requests, window=0.2)
+
+    assert batch_calls == [["котенок", "щенок", "котенок"]]
+    assert batcher.batches == 1 and batcher.average_batch_size == 3
+    assert all(result["format"] == "png" for result in results)
+    # Одинаковые промпт и seed дают одинаковое изображение независимо от соседей по батчу
+    assert np.abs(pixels(results[0]) - pixels(results[2])).max() <= 1
+    assert np.abs(pixels(results[0]) - pixels(results[1])).max() > 10
+
+
+def test_seeded_request_matches_single_generation(batch_calls):
+    batched, _ = run_batched([make_request("котенок", seed=5), make_request("щенок", seed=6)], window=0.2)
+    single, _ = run_batched([make_request("котенок", seed=5)], window=0.01)
+
+    assert np.abs(pixels(batched[0]) - pixels(single[0])).mean() < 1
+
+
+def test_incompatible_shapes_are_batched_separately(batch_calls):
+    requests = [make_request("котенок"), make_request("щенок", width=128), make_request("лисенок")]
+
+    results, batcher = run_batched(requests, window=0.2)
+
+    assert sorted(batch_calls) == [["котенок", "лисенок"], ["щенок"]]
+    assert Image.open(io.BytesIO(results[1]["image"])).size == (128, 64)
+    assert batcher.batches == 2
+
+
+def test_batch_size_is_limited(batch_calls):
+    run_batched([make_request(f"промпт {index}") for index in range(3)], window=0.2, max_batch_size=2)
+
+    assert [len(prompts) for prompts in batch_calls] == [2, 1]
+
+
+def test_failed_batch_fails_every_request(monkeypatch, tiny_models, worker):
+    def generate_batch(requests, step_callbacks=None, encode=True):
+        raise RuntimeError("нехватка памяти")
+
+    monkeypatch.setattr(main, "generate_batch", generate_batch)
+
+    results, batcher = run_batched([make_request("котенок"), make_request("щенок")], window=0.2)
+
+    assert [str(result) for result in results] == ["нехватка памяти", "нехватка памяти"]
+    assert batcher.batches == 0
+
+
+def test_generate_returns_503_when_batcher_is_full(monkeypatch, tiny_models, worker):
+    monkeypatch.setattr(main, "models_loading", False)
+
+    async def scenario():
+        batcher = main.GenerationBatcher(max_pending=0)
+        monkeypatch.setattr(main, "generation_batcher", batcher)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return await client.post("/generate", json={"prompt": "котенок", "width": 64, "height": 64})
+
+    response = asyncio.run(scenario())
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(worker.retry_after())
+    assert response.json()["detail"] == "Генератор занят, повторите позже"
@@ -0,0 +1,88 @@
+"""Профиль производительности CPU"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from conftest import make_request
+import main
+
+FULL_PROFILE = {
+    "bf16": "false", "channels_last": True, "attention_slicing": True,
+    "vae_slicing": True, "vae_tiling": True, "compile": False,
+}
+
+
+def pixels(result: dict) -> np.ndarray:
+    return np.asarray(result["pil_image"], np.int16)
+
+
+def test_full_profile_keeps_images_unchanged(monkeypatch, tiny_models):
+    prior, decoder = tiny_models
+    requests = [make_request("котенок", seed=1), make_request("щенок", seed=2)]
+    baseline = main.generate_batch(requests, encode=False)
+    main.prior_cache.clear()
+
+    applied = main.apply_cpu_optimizations(prior, decoder, FULL_PROFILE)
+    monkeypatch.setattr(main, "cpu_optimizations", applied)
+    optimized = main.generate_batch(requests, encode=False)
+
+    # Тайловое декодирование MoVQ есть не во всех версиях diffusers - без него оно пропускается
+    tiling = {"vae_tiling": True} if hasattr(decoder.movq, "enable_tiling") else {}
+    assert applied == {"bf16": False, "channels_last": True, "attention_slicing": True, "vae_slicing": True, **tiling}
+    conv = decoder.unet.conv_in.weight
+    assert conv.is_contiguous(memory_format=torch.channels_last) and not conv.is_contiguous()
+    for before, after in zip(baseline, optimized):
+        assert np.abs(pixels(before) - pixels(after)).max() <= 2
+
+
+def test_sliced_decode_matches_batch_decode(tiny_models):
+    _, decoder = tiny_models
+    latents = torch.randn(3, 4, 8, 8, generator=torch.Generator().manual_seed(0))
+    with torch.no_grad():
+        expected = decoder.movq.decode(latents, force_not_quantize=True)["sample"]
+        main.slice_decode(decoder.movq)
+        sliced = decoder.movq.decode(latents, force_not_quantize=True)["sample"]
+
+    torch.testing.assert_close(sliced, expected, atol=1e-5, rtol=1e-4)
+
+
+def test_bf16_autocast_follows_cpu_support(monkeypatch, tiny_models):
+    prior, decoder = tiny_models
+    monkeypatch.setattr(main, "bf16_supported", lambda: False)
+    assert main.apply_cpu_optimizations(prior, decoder, {"bf16": "auto"}) == {"bf16": False}
+
+    monkeypatch.setattr(main, "bf16_supported", lambda: True)
+    applied = main.apply_cpu_optimizations(prior, decoder, {"bf16": "auto"})
+    monkeypatch.setattr(main, "cpu_optimizations", applied)
+
+    with main.inference_context():
+        assert torch.is_autocast_cpu_enabled()
+        assert torch.get_autocast_cpu_dtype() == torch.bfloat16
+    result, = main.generate_batch([make_request()], encode=False)
+    assert result["pil_image"].size == (64, 64)
+
+
+def test_failed_compile_is_skipped(monkeypatch, tiny_models):
+    prior, decoder = tiny_models
+    unet = decoder.unet
+
+    def compile(module):
+        raise RuntimeError("нет компилятора")
+
+    monkeypatch.setattr(main.torch, "compile", compile)
+
+    applied = main.apply_cpu_optimizations(prior, decoder, {"compile": True})
+
+    assert "compile" not in applied
+    assert decoder.unet is unet
+
+
+def test_onnx_backend_gets_only_vae_slicing(tiny_models):
+    prior, _ = tiny_models
+    onnx_decoder = SimpleNamespace(unet=object(), movq=SimpleNamespace(decode=lambda latents, **kwargs: None))
+
+    applied = main.apply_cpu_optimizations(prior, onnx_decoder, FULL_PROFILE)
+
+    assert applied == {"bf16": False, "vae_slicing": True}
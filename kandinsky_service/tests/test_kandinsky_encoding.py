@@ -0,0 +1,105 @@
+"""Выбор формата ответа и кодирование изображений"""
+
+import asyncio
+import io
+
+import httpx
+import pytest
+from PIL import Image
+from pydantic import ValidationError
+
+from conftest import make_request
+import main
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("image/webp,image/*;q=0.8", "webp"),
+    ("image/jpeg", "jpeg"),
+    ("image/png", None),
+    ("*/*", None),
+])
+def test_negotiate_format_by_accept(accept, expected):
+    assert main.negotiate_format(make_request(), accept).output_format == expected
+
+
+def test_negotiate_format_keeps_explicit_format():
+    request = make_request(output_format="png")
+    assert main.negotiate_format(request, "image/webp").output_format == "png"
+
+
+@pytest.mark.parametrize("fields", [{"output_format": "gif"}, {"quality": 0}, {"quality": 101}])
+def test_invalid_format_or_quality_rejected(fields):
+    with pytest.raises(ValidationError):
+        make_request(**fields)
+
+
+def test_jpg_alias_normalized():
+    assert make_request(output_format="JPG").output_format == "jpeg"
+
+
+@pytest.mark.parametrize("output_format, pillow_format", [(None, "PNG"), ("jpeg", "JPEG"), ("webp", "WEBP")])
+def test_encode_image_formats(output_format, pillow_format):
+    image = Image.new("RGB", (64, 64), "red")
+    result = main.encode_image(image, make_request(output_format=output_format, quality=80))
+
+    assert result["format"] == (output_format or "png")
+    assert result["media_type"] == main.OUTPUT_FORMATS[result["format"]][1]
+    assert result["encode_seconds"] >= 0
+    decoded = Image.open(io.BytesIO(result["image"]))
+    assert decoded.format == pillow_format
+    assert decoded.size == (64, 64)
+    assert main.encoding_stats.metrics()[result["format"]]["images"] >= 1
+
+
+def test_image_response_headers():
+    image = Image.new("RGB", (64, 64), "blue")
+    result = main.encode_image(image, make_request(output_format="webp"))
+    result.update(prior_cached=True, prior_seconds_saved=1.5)
+
+    response = main.image_response(result)
+
+    assert response.body == result["image"]
+    assert response.media_type == "image/webp"
+    assert response.headers["content-length"] == str(len(result["image"]))
+    assert response.headers["content-disposition"] == "inline; filename=generated_image.webp"
+    assert response.headers["x-prior-cache"] == "hit"
+    assert response.headers["x-prior-seconds-saved"] == "1.50"
+    assert float(response.headers["x-encode-seconds"]) >= 0
+
+
+def post_generate(headers: dict, **fields) -> httpx.Response:
+    async def scenario():
+        batcher = main.GenerationBatcher(window=0.01)
+        main.generation_batcher = batcher
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                body = {"prompt": "котенок", "width": 64, "height": 64, "num_inference_steps": 2, "seed": 0, **fields}
+                return await client.post("/generate", json=body, headers=headers)
+        finally:
+            batcher.stop()
+    return asyncio.run(scenario())
+
+
+def test_generate_negotiates_format_by_accept(monkeypatch, tiny_models, worker):
+    monkeypatch.setattr(main, "generation_batcher", None)
+    monkeypatch.setattr(main, "models_loading", False)
+
+    webp = post_generate({"Accept": "image/webp,image/*;q=0.8"})
+    explicit = post_generate({"Accept": "image/webp"}, output_format="jpeg", quality=50)
+
+    assert webp.status_code == 200 and webp.headers["content-type"] == "image/webp"
+    assert Image.open(io.BytesIO(webp.content)).format == "WEBP"
+    assert explicit.headers["content-type"] == "image/jpeg"
+    assert explicit.headers["content-disposition"] == "inline; filename=generated_image.jpg"
+
+
+def test_generate_rejects_unknown_format_and_missing_models(monkeypatch, tiny_models, worker):
+    monkeypatch.setattr(main, "generation_batcher", None)
+    monkeypatch.setattr(main, "models_loading", False)
+
+    assert post_generate({}, output_format="gif").status_code == 422
+
+    monkeypatch.setattr(main, "decoder_pipeline", None)
+    response = post_generate({"Accept": "image/webp"})
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Модели не загружены"
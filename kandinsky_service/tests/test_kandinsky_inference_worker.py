@@ -0,0 +1,59 @@
+"""Поток инференса и оценка Retry-After"""
+
+import asyncio
+import time
+
+import pytest
+
+import main
+
+
+def generation(seconds: float) -> str:
+    time.sleep(seconds)
+    return "готово"
+
+
+def failing():
+    raise RuntimeError("сбой генерации")
+
+
+def test_model_loading_excluded_from_retry_after(monkeypatch, worker):
+    monkeypatch.setattr(main, "load_models", lambda: generation(1.5) == "готово")
+
+    async def scenario():
+        loaded = await main.reload_pipelines()
+        result = await worker.submit(generation, 0.05)
+        return loaded, result
+
+    loaded, result = asyncio.run(scenario())
+
+    assert loaded is True and result == "готово"
+    assert len(worker.durations) == 1
+    assert worker.durations[0] < 1.0
+    assert worker.retry_after() == 1
+
+
+def test_queue_full_reports_retry_after(worker):
+    worker.durations.extend([2.2, 2.6])
+
+    async def scenario():
+        running = worker.submit(generation, 0.3)
+        await asyncio.sleep(0.05)  # Первый вызов уже выполняется, очередь пуста
+        queued = [worker.submit(generation, 0) for _ in range(2)]
+        with pytest.raises(main.QueueFullError) as error:
+            worker.submit(generation, 0)
+        await asyncio.gather(running, *queued)
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.retry_after == 3
+
+
+def test_worker_error_reaches_caller(worker):
+    async def scenario():
+        with pytest.raises(RuntimeError, match="сбой генерации"):
+            await worker.submit(failing)
+        # Поток продолжает работу после ошибки
+        return await worker.submit(generation, 0)
+
+    assert asyncio.run(scenario()) == "готово"
@@ -0,0 +1,53 @@
+"""Загрузка моделей из локального каталога safetensors (save_models.py)"""
+
+import os
+
+import pytest
+
+from conftest import make_request
+import main
+import save_models
+
+
+@pytest.fixture(scope="module")
+def models_dir(tmp_path_factory, tiny_pipelines_template):
+    """Крошечные пайплайны, сохраненные save_models.py"""
+    directory = tmp_path_factory.mktemp("models")
+    prior, decoder = tiny_pipelines_template
+    save_models.save_pipeline(prior, str(directory / "prior"))
+    save_models.save_pipeline(decoder, str(directory / "decoder"))
+    return directory
+
+
+@pytest.fixture
+def local_loading(monkeypatch, tiny_models):
+    """Загрузка на CPU с бэкендом torch и чистой статистикой загрузки"""
+    monkeypatch.setattr(main.torch.cuda, "is_available", lambda: False)
+    monkeypatch.setattr(main, "KANDINSKY_BACKEND", "torch")
+    monkeypatch.setattr(main, "load_stats", {"cold_start_seconds": None})
+
+
+def test_load_models_from_local_directory(monkeypatch, local_loading, models_dir):
+    monkeypatch.setattr(main, "MODELS_DIR", str(models_dir))
+
+    assert main.load_models()
+
+    assert isinstance(main.prior_pipeline, main.KandinskyV22PriorPipeline)
+    assert isinstance(main.decoder_pipeline, main.KandinskyV22Pipeline)
+    assert main.load_stats["source"] == str(models_dir)
+    assert main.load_stats["cold_start_seconds"] is not None
+    # Время записано для каждого компонента обоих пайплайнов
+    assert {"prior/prior", "prior/text_encoder", "decoder/unet", "decoder/movq"} <= set(main.load_stats["components"])
+    result = main.generate_batch([make_request()])[0]
+    assert result["image"]
+
+
+def test_load_models_fails_without_model_index(monkeypatch, local_loading, tmp_path):
+    os.makedirs(tmp_path / "prior")
+    os.makedirs(tmp_path / "decoder")
+    monkeypatch.setattr(main, "MODELS_DIR", str(tmp_path))
+
+    assert main.load_models() is False
+
+    assert main.prior_pipeline is None and main.decoder_pipeline is None
+    assert "source" not in main.load_stats
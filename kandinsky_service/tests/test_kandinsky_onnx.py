@@ -0,0 +1,58 @@
+"""Экспорт в ONNX и бэкенд ONNX Runtime"""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import make_request
+import main
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+import export_onnx  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def onnx_dir(tmp_path_factory, tiny_pipelines_template):
+    """Крошечные пайплайны, экспортированные в ONNX (fp32 и int8 UNet)"""
+    directory = str(tmp_path_factory.mktemp("onnx"))
+    prior, decoder = tiny_pipelines_template
+    export_onnx.export_pipelines(prior, decoder, directory, size=64, int8_unet=True)
+    return directory
+
+
+def generate(request) -> np.ndarray:
+    result = main.generate_batch([request])[0]
+    return np.asarray(Image.open(io.BytesIO(result["image"])).convert("RGB"), dtype=np.float64)
+
+
+def psnr(image: np.ndarray, reference: np.ndarray) -> float:
+    mse = np.mean((image - reference) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+@pytest.mark.parametrize("int8_unet, min_psnr", [(False, 40.0), (True, 10.0)])
+def test_onnx_backend_matches_torch(tiny_models, onnx_dir, int8_unet, min_psnr):
+    prior, decoder = tiny_models
+    request = make_request(output_format="png")
+    reference = generate(request)
+
+    main.attach_onnx_backend(prior, decoder, onnx_dir, int8_unet)
+    main.prior_cache.clear()
+    image = generate(request)
+
+    assert isinstance(decoder.unet, main.OnnxUNet)
+    assert isinstance(prior.prior, main.OnnxPrior)
+    assert image.shape == reference.shape
+    assert psnr(image, reference) >= min_psnr
+
+
+def test_attach_onnx_backend_requires_exported_models(tiny_models, tmp_path):
+    prior, decoder = tiny_models
+    with pytest.raises(FileNotFoundError, match="export_onnx.py"):
+        main.attach_onnx_backend(prior, decoder, str(tmp_path))
+    # Пайплайны не тронуты: torch модули остаются на месте
+    assert not isinstance(decoder.unet, main.OnnxUNet)
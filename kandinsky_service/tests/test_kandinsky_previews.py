@@ -0,0 +1,108 @@
+"""Промежуточные превью во время генерации"""
+
+import asyncio
+import io
+import threading
+
+import httpx
+import pytest
+from PIL import Image
+
+from conftest import make_request
+import main
+
+
+@pytest.fixture
+def previews(monkeypatch, tiny_models):
+    """Превью на каждом шаге, не больше 32 пикселей по большей стороне"""
+    monkeypatch.setattr(main, "PREVIEW_EVERY", 1)
+    monkeypatch.setattr(main, "PREVIEW_SIZE", 32)
+
+
+def test_previews_are_reported_before_the_final_step(previews):
+    received = []
+
+    main.generate_batch(
+        [make_request(width=128, height=128, num_inference_steps=4)],
+        [lambda step, total, preview: received.append((step, total, preview))]
+    )
+
+    assert [(step, total) for step, total, _ in received] == [(1, 4), (2, 4), (3, 4)]
+    image = Image.open(io.BytesIO(received[0][2]))
+    assert image.format == "JPEG" and image.size == (32, 32)
+
+
+def test_only_waiting_requests_get_previews(previews):
+    received = []
+
+    main.generate_batch(
+        [make_request("котенок", num_inference_steps=3), make_request("щенок", num_inference_steps=3)],
+        [None, lambda step, total, preview: received.append(step)]
+    )
+
+    assert received == [1, 2]
+
+
+def test_failed_preview_does_not_stop_generation(monkeypatch, previews):
+    def decode_previews(latents, indexes):
+        raise RuntimeError("нехватка памяти")
+
+    monkeypatch.setattr(main, "decode_previews", decode_previews)
+    received = []
+
+    result, = main.generate_batch([make_request(num_inference_steps=3)], [lambda *args: received.append(args)])
+
+    assert received == []
+    assert result["format"] == "png" and result["image"]
+
+
+def test_job_exposes_latest_preview(monkeypatch, previews, worker):
+    monkeypatch.setattr(main, "models_loading", False)
+    release = threading.Event()
+    make_step_callback = main.make_step_callback
+
+    def paused_step_callback(step_callbacks, total):
+        callback = make_step_callback(step_callbacks, total)
+
+        def on_step_end(pipeline, step, timestep, callback_kwargs):
+            if step == 1:
+                release.wait(timeout=30)  # После первого превью генерация ждет, пока тест его прочитает
+            return callback(pipeline, step, timestep, callback_kwargs)
+        return on_step_end
+
+    monkeypatch.setattr(main, "make_step_callback", paused_step_callback)
+    jobs = main.JobQueue(main.run_generation_job, 2, 1, 60)
+    monkeypatch.setattr(main, "generation_jobs", jobs)
+
+    async def scenario():
+        monkeypatch.setattr(main, "generation_batcher", main.GenerationBatcher(window=0.01))
+        jobs.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                accepted = await client.post("/jobs/generate", json={
+                    "prompt": "котенок", "width": 64, "height": 64, "num_inference_steps": 4, "seed": 0
+                })
+                job_id = accepted.json()["job_id"]
+                progress = await client.get(f"/jobs/{job_id}", params={"wait": 30, "after_step": 0})
+                preview = await client.get(f"/jobs/{job_id}/preview")
+                early_result = await client.get(f"/jobs/{job_id}/result")
+                release.set()
+                done = await client.get(f"/jobs/{job_id}", params={"wait": 30})
+                result = await client.get(f"/jobs/{job_id}/result")
+                missing = await client.get("/jobs/unknown/preview")
+                return progress, preview, early_result, done, result, missing
+        finally:
+            release.set()
+            jobs.stop()
+            main.generation_batcher.stop()
+
+    progress, preview, early_result, done, result, missing = asyncio.run(scenario())
+
+    assert progress.json()["status"] == "running"
+    assert progress.json()["preview_step"] == 1 and progress.json()["total_steps"] == 4
+    assert preview.headers["content-type"] == "image/jpeg"
+    assert preview.headers["X-Preview-Step"] == "1" and preview.headers["X-Total-Steps"] == "4"
+    assert early_result.status_code == 409
+    assert done.json()["status"] == "done" and done.json()["result_url"] == f"/jobs/{done.json()['job_id']}/result"
+    assert result.headers["content-type"] == "image/png"
+    assert missing.status_code == 404
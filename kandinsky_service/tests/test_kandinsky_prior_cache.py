@@ -0,0 +1,81 @@
+"""Кэш эмбеддингов prior и однократное вычисление негативного эмбеддинга"""
+
+import numpy as np
+import pytest
+import torch
+from fastapi import HTTPException
+
+from conftest import make_request
+import main
+
+
+@pytest.fixture
+def prior_calls(monkeypatch, tiny_models):
+    """Аргументы каждого запуска prior pipeline: (промпты, негативные промпты)"""
+    calls = []
+    run_prior = main.run_prior
+
+    def spy(prompts, negative_prompts, scale, seeds):
+        calls.append((list(prompts), negative_prompts and list(negative_prompts)))
+        return run_prior(prompts, negative_prompts, scale, seeds)
+
+    monkeypatch.setattr(main, "run_prior", spy)
+    return calls
+
+
+def test_repeated_prompt_reuses_prior_embeddings(prior_calls):
+    first, = main.generate_batch([make_request("котенок")], encode=False)
+    second, = main.generate_batch([make_request("котенок")], encode=False)
+
+    assert not first["prior_cached"] and second["prior_cached"]
+    assert second["prior_seconds_saved"] > 0
+    # Эмбеддинги хранятся в float16, но изображение с тем же seed почти не меняется
+    difference = np.abs(np.asarray(first["pil_image"], np.int16) - np.asarray(second["pil_image"], np.int16))
+    assert difference.mean() < 0.5 and difference.max() <= 8
+    # Основной и негативный промпты посчитаны одним запуском prior, повторный запрос prior не запускает
+    assert prior_calls == [(["low quality, bad quality", "котенок"], None)]
+    assert main.prior_cache.metrics()["hits"] == 2
+
+
+def test_negative_prompt_is_computed_once_per_batch(prior_calls):
+    requests = [make_request(prompt, seed=0) for prompt in ("котенок", "щенок", "лисенок")]
+
+    results = main.generate_batch(requests, encode=False)
+
+    assert len(results) == 3
+    # При prior_guidance_scale <= 1 негативный промпт идет отдельным элементом батча без guidance
+    assert prior_calls == [(["low quality, bad quality", "котенок", "щенок", "лисенок"], None)]
+    negative_keys = [key for key in main.prior_cache.entries if key[0] is None]
+    assert negative_keys == [(None, "low quality, bad quality", 1.0, 0)]
+
+
+def test_prior_guidance_keeps_negative_prompt_in_batch(prior_calls):
+    main.generate_batch([make_request("котенок", prior_guidance_scale=4.0)], encode=False)
+
+    assert prior_calls == [(["котенок"], ["low quality, bad quality"])]
+
+
+def test_cache_evicts_least_recently_used():
+    cache = main.PriorEmbeddingCache(max_entries=2)
+    tensors = (torch.ones(1, 4), torch.zeros(1, 4))
+    for key in ("a", "b"):
+        cache.put((key,), tensors, 1.0)
+    assert cache.get(("a",)) is not None
+    cache.put(("c",), tensors, 1.0)
+
+    assert list(cache.entries) == [("a",), ("c",)]
+    assert cache.get(("b",)) is None
+    assert cache.entries[("a",)][0][0].dtype == torch.float16
+    assert cache.metrics() == {"entries": 2, "hits": 1, "misses": 1, "hit_rate": 0.5, "seconds_saved": 1.0}
+
+    disabled = main.PriorEmbeddingCache(max_entries=0)
+    disabled.put(("a",), tensors, 1.0)
+    assert not disabled.entries
+
+
+def test_generation_without_models_is_rejected(monkeypatch):
+    monkeypatch.setattr(main, "prior_pipeline", None)
+
+    with pytest.raises(HTTPException) as error:
+        main.generate_batch([make_request()])
+    assert error.value.status_code == 503
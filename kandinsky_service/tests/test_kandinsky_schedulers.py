@@ -0,0 +1,66 @@
+"""Планировщики декодера и пресеты качества"""
+
+import asyncio
+
+import httpx
+import pytest
+from pydantic import ValidationError
+
+from conftest import make_request
+import main
+
+
+def test_preset_fills_fields_not_set_explicitly():
+    draft = main.ImageGenerationRequest(prompt="котенок", preset="draft")
+    custom = main.ImageGenerationRequest(prompt="котенок", preset="draft", num_inference_steps=8, width=256)
+
+    assert (draft.scheduler, draft.num_inference_steps, draft.width, draft.height) == ("dpm", 12, 512, 512)
+    assert (custom.scheduler, custom.num_inference_steps, custom.width, custom.height) == ("dpm", 8, 256, 512)
+
+
+@pytest.mark.parametrize("fields, message", [
+    ({"preset": "ultra"}, "Неизвестный пресет"),
+    ({"scheduler": "euler"}, "Неизвестный планировщик"),
+])
+def test_unknown_preset_or_scheduler_rejected(fields, message):
+    with pytest.raises(ValidationError, match=message):
+        make_request(**fields)
+
+
+def test_unknown_preset_returns_422(monkeypatch, tiny_models):
+    monkeypatch.setattr(main, "models_loading", False)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return await client.post("/generate", json={"prompt": "котенок", "preset": "ultra"})
+
+    assert asyncio.run(scenario()).status_code == 422
+
+
+def test_schedulers_share_the_model_config(tiny_models):
+    _, decoder = tiny_models
+    original = decoder.scheduler
+
+    schedulers = main.create_schedulers(decoder)
+
+    assert set(schedulers) == set(main.SCHEDULERS)
+    assert schedulers["ddim"] is original  # Штатный планировщик крошечной модели - DDIM
+    for name, scheduler in schedulers.items():
+        assert isinstance(scheduler, main.SCHEDULERS[name])
+        assert scheduler.config.num_train_timesteps == original.config.num_train_timesteps
+        assert scheduler.config.beta_end == original.config.beta_end
+
+
+@pytest.mark.parametrize("scheduler", list(main.SCHEDULERS))
+def test_generation_uses_requested_scheduler(tiny_models, scheduler):
+    _, decoder = tiny_models
+
+    result, = main.generate_batch([make_request(scheduler=scheduler)], encode=False)
+
+    assert isinstance(decoder.scheduler, main.SCHEDULERS[scheduler])
+    assert result["pil_image"].size == (64, 64)
+
+
+def test_scheduler_is_part_of_batch_key():
+    assert main.batch_key(make_request(scheduler="dpm")) != main.batch_key(make_request(scheduler="ddim"))
+    assert main.batch_key(make_request()) == main.batch_key(make_request(scheduler=main.DEFAULT_SCHEDULER))
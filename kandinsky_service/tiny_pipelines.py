@@ -0,0 +1,90 @@
+"""
+Крошечные пайплайны Kandinsky 2.2 со случайными весами
+
+Архитектура та же, что у Kandinsky 2.2, но слои минимальных размеров: пайплайны строятся
+без скачивания моделей и без сети и быстро считаются на CPU. Используются бенчмарком,
+export_onnx.py и save_models.py (--tiny) для проверки без моделей, а также тестами.
+"""
+
+import json
+import os
+import tempfile
+
+import torch
+
+EMBEDDING_DIM = 32
+
+
+def build_tiny_tokenizer():
+    """Токенизатор CLIP с побайтовым словарем без слияний BPE"""
+    from transformers import CLIPTokenizer
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    symbols = list(bytes_to_unicode().values())
+    vocab = {"<|startoftext|>": 0, "<|endoftext|>": 1}
+    for symbol in symbols + [symbol + "</w>" for symbol in symbols]:
+        vocab[symbol] = len(vocab)
+
+    directory = tempfile.mkdtemp(prefix="kandinsky_tokenizer_")
+    vocab_file = os.path.join(directory, "vocab.json")
+    merges_file = os.path.join(directory, "merges.txt")
+    with open(vocab_file, "w", encoding="utf-8") as file:
+        json.dump(vocab, file, ensure_ascii=False)
+    with open(merges_file, "w", encoding="utf-8") as file:
+        file.write("#version: 0.2\n")
+    return CLIPTokenizer(vocab_file, merges_file, model_max_length=77)
+
+
+def build_tiny_pipelines():
+    """Крошечные prior и decoder пайплайны Kandinsky 2.2 со случайными весами"""
+    from diffusers import (DDIMScheduler, KandinskyV22Pipeline, KandinskyV22PriorPipeline,
+                           PriorTransformer, UnCLIPScheduler, UNet2DConditionModel, VQModel)
+    from transformers import (CLIPImageProcessor, CLIPTextConfig, CLIPTextModelWithProjection,
+                              CLIPVisionConfig, CLIPVisionModelWithProjection)
+
+    torch.manual_seed(0)
+    tokenizer = build_tiny_tokenizer()
+    prior = PriorTransformer(num_attention_heads=2, attention_head_dim=12, embedding_dim=EMBEDDING_DIM, num_layers=1)
+    prior.clip_std = torch.nn.Parameter(torch.ones(prior.clip_std.shape))
+    prior_pipeline = KandinskyV22PriorPipeline(
+        prior=prior,
+        image_encoder=CLIPVisionModelWithProjection(CLIPVisionConfig(
+            hidden_size=EMBEDDING_DIM, image_size=224, projection_dim=EMBEDDING_DIM, intermediate_size=37,
+            num_attention_heads=4, num_channels=3, num_hidden_layers=5, patch_size=14
+        )),
+        text_encoder=CLIPTextModelWithProjection(CLIPTextConfig(
+            bos_token_id=0, eos_token_id=2, hidden_size=EMBEDDING_DIM, projection_dim=EMBEDDING_DIM,
+            intermediate_size=37, layer_norm_eps=1e-05, num_attention_heads=4, num_hidden_layers=5,
+            pad_token_id=1, vocab_size=len(tokenizer)
+        )),
+        tokenizer=tokenizer,
+        scheduler=UnCLIPScheduler(
+            variance_type="fixed_small_log", prediction_type="sample", num_train_timesteps=1000,
+            clip_sample=True, clip_sample_range=10.0
+        ),
+        image_processor=CLIPImageProcessor(
+            crop_size=224, do_center_crop=True, do_normalize=True, do_resize=True, resample=3, size=224,
+            image_mean=[0.48145466, 0.4578275, 0.40821073], image_std=[0.26862954, 0.26130258, 0.27577711]
+        ),
+    )
+    decoder_pipeline = KandinskyV22Pipeline(
+        unet=UNet2DConditionModel(
+            in_channels=4, out_channels=8, addition_embed_type="image",
+            down_block_types=("ResnetDownsampleBlock2D", "SimpleCrossAttnDownBlock2D"),
+            up_block_types=("SimpleCrossAttnUpBlock2D", "ResnetUpsampleBlock2D"),
+            mid_block_type="UNetMidBlock2DSimpleCrossAttn", block_out_channels=(32, 64), layers_per_block=1,
+            encoder_hid_dim=EMBEDDING_DIM, encoder_hid_dim_type="image_proj", cross_attention_dim=EMBEDDING_DIM,
+            attention_head_dim=4, resnet_time_scale_shift="scale_shift", class_embed_type=None
+        ),
+        scheduler=DDIMScheduler(
+            num_train_timesteps=1000, beta_schedule="linear", beta_start=0.00085, beta_end=0.012,
+            clip_sample=False, set_alpha_to_one=False, steps_offset=1, prediction_type="epsilon"
+        ),
+        movq=VQModel(
+            block_out_channels=[32, 64], down_block_types=["DownEncoderBlock2D", "AttnDownEncoderBlock2D"],
+            in_channels=3, latent_channels=4, layers_per_block=1, norm_num_groups=8, norm_type="spatial",
+            num_vq_embeddings=12, out_channels=3, up_block_types=["AttnUpDecoderBlock2D", "UpDecoderBlock2D"],
+            vq_embed_dim=4
+        ),
+    )
+    return prior_pipeline, decoder_pipeline
@@ -1,13 +1,18 @@
 import httpx
+import json
+import asyncio
 import logging
 import subprocess
 import io
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Callable
 from config import (
     NEUROAPI_URL, NEUROAPI_API_KEY, MODELS, DEFAULT_MODEL, SYSTEM_PROMPT, 
     MAX_CONTEXT_MESSAGES, WHISPER_API_URL, HUGGINGFACE_API_KEY,
     YANDEX_TTS_URL, YANDEX_VOICES, DEFAULT_VOICE, YANDEX_FOLDER_ID,
-    KANDINSKY_SERVICE_URL, OCR_SERVICE_URL, WHISPER_SERVICE_URL
+    KANDINSKY_SERVICE_URL, OCR_SERVICE_URL, WHISPER_SERVICE_URL,
+    OCR_RECOGNIZER_PROFILE, OCR_DOCUMENT_RECOGNIZER_PROFILE, OCR_RECOGNIZERS, TRANSCRIPTION_CACHE_SIZE,
+    JOB_MAX_WAIT, JOB_POLL_WAIT, DEFAULT_IMAGE_PRESET, IMAGE_OUTPUT_FORMAT, IMAGE_OUTPUT_QUALITY
 )
 
 # Настраиваем логирование
@@ -30,6 +35,13 @@ class NeuroAPIClient:
         self.user_voice_mode: Dict[int, bool] = {}
         self.user_voices: Dict[int, str] = {}
         
+        # Профиль распознавания OCR, выбранный пользователем
+        self.user_ocr_recognizers: Dict[int, str] = {}
+        
+        # Распознанные голосовые сообщения по file_unique_id (LRU)
+        self.transcription_cache: "OrderedDict[str, str]" = OrderedDict()
+        self.transcription_cache_stats = {"hits": 0, "misses": 0}
+        
         # HTTP клиент
         self.client = httpx.AsyncClient(
             headers={
@@ -140,20 +152,106 @@ class NeuroAPIClient:
             logger.error(f"Неожиданная ошибка при генерации ответа: {e}")
             return "Извините, произошла неожиданная ошибка. Попробуйте еще раз."
 
+    def get_cached_transcription(self, file_unique_id: str) -> Optional[str]:
+        """Получить ранее распознанный текст голосового сообщения"""
+        text = self.transcription_cache.get(file_unique_id)
+        if text is None:
+            self.transcription_cache_stats["misses"] += 1
+            return None
+        
+        self.transcription_cache.move_to_end(file_unique_id)
+        self.transcription_cache_stats["hits"] += 1
+        lookups = self.transcription_cache_stats["hits"] + self.transcription_cache_stats["misses"]
+        logger.info(
+            f"Транскрибация из кэша бота (попаданий {self.transcription_cache_stats['hits']}/{lookups}, "
+            f"{self.transcription_cache_stats['hits'] / lookups:.0%})"
+        )
+        return text
+    
+    def cache_transcription(self, file_unique_id: str, text: str):
+        """Запомнить распознанный текст голосового сообщения"""
+        self.transcription_cache[file_unique_id] = text
+        self.transcription_cache.move_to_end(file_unique_id)
+        while len(self.transcription_cache) > TRANSCRIPTION_CACHE_SIZE:
+            self.transcription_cache.popitem(last=False)
+    
+    async def _submit_job(self, client: httpx.AsyncClient, url: str, deadline: float, **kwargs) -> Dict[str, Any]:
+        """
+        Постановка задачи в очередь сервиса
+        
+        Если очередь заполнена (503 с Retry-After), повторяет попытку через указанное
+        сервисом время, пока не истечет deadline.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            response = await client.post(url, **kwargs)
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code == 503 and retry_after is not None:
+                delay = float(retry_after)
+                if loop.time() + delay < deadline:
+                    logger.info(f"Очередь {url} заполнена, повтор через {delay:.0f} с")
+                    await asyncio.sleep(delay)
+                    continue
+            response.raise_for_status()
+            return response.json()
+
+    async def _wait_job(self, client: httpx.AsyncClient, service_url: str, job_id: str, deadline: float,
+                        on_preview: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """
+        Ожидание завершения задачи через long-poll; возвращает описание задачи
+        
+        С on_preview long-poll возвращается и при появлении нового превью, и on_preview
+        вызывается с описанием задачи.
+        """
+        loop = asyncio.get_running_loop()
+        preview_step = 0
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Задача {job_id} не завершилась за {JOB_MAX_WAIT:.0f} с")
+            params = {"wait": min(JOB_POLL_WAIT, remaining)}
+            if on_preview is not None:
+                params["after_step"] = preview_step
+            response = await client.get(f"{service_url}/jobs/{job_id}", params=params)
+            response.raise_for_status()
+            job = response.json()
+            if job["status"] in ("done", "failed"):
+                return job
+            if on_preview is not None and job.get("preview_step", 0) > preview_step:
+                preview_step = job["preview_step"]
+                await on_preview(job)
+
+    @staticmethod
+    def _whisper_unavailable_message(response: httpx.Response) -> str:
+        """
+        Текст ошибки для ответа 503 Whisper сервиса
+        
+        С Retry-After сервис отвечает, когда заполнена очередь задач; без него - пока
+        модель еще загружается.
+        """
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            return f"Ошибка: сервис распознавания речи перегружен. Попробуйте через {retry_after} с."
+        return "Ошибка: Whisper сервис еще загружается. Попробуйте через минуту."
+
     async def transcribe_audio(self, audio_data: bytes) -> str:
         """Транскрибация аудио с помощью локального Whisper Medium сервиса"""
         try:
             # Формируем данные для отправки
             files = {'file': ('voice.ogg', audio_data, 'audio/ogg')}
             
-            async with httpx.AsyncClient(timeout=240.0) as client:
-                response = await client.post(
-                    f"{WHISPER_SERVICE_URL}/transcribe",
-                    files=files
-                )
-                response.raise_for_status()
+            # Задача ставится в очередь сервиса, результат забирается long-poll запросами,
+            # поэтому таймаут ограничивает отдельный запрос, а не всю транскрибацию
+            deadline = asyncio.get_running_loop().time() + JOB_MAX_WAIT
+            async with httpx.AsyncClient(timeout=JOB_POLL_WAIT + 30.0) as client:
+                job = await self._submit_job(client, f"{WHISPER_SERVICE_URL}/jobs/transcribe", deadline, files=files)
+                job = await self._wait_job(client, WHISPER_SERVICE_URL, job["job_id"], deadline)
             
-            response_data = response.json()
+            if job["status"] == "failed":
+                logger.error(f"Ошибка транскрибации в Whisper сервисе: {job.get('error')}")
+                return "Ошибка: не удалось распознать речь."
+            
+            response_data = job["result"]
             
             if response_data.get("success") and "text" in response_data:
                 transcribed_text = response_data["text"].strip()
@@ -170,15 +268,52 @@ class NeuroAPIClient:
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP ошибка при запросе к Whisper сервису: {e.response.status_code} - {e.response.text}")
             if e.response.status_code == 503:
-                return "Ошибка: Whisper сервис еще загружается. Попробуйте через минуту."
+                return self._whisper_unavailable_message(e.response)
             return "Ошибка: сервис распознавания речи временно недоступен."
         except httpx.RequestError as e:
             logger.error(f"Ошибка сети при запросе к Whisper сервису: {e}")
             return "Ошибка: проблема с подключением к сервису распознавания речи."
+        except TimeoutError as e:
+            logger.error(f"Превышено время ожидания транскрибации: {e}")
+            return "Ошибка: распознавание речи заняло слишком много времени."
         except Exception as e:
             logger.error(f"Неожиданная ошибка при транскрибации аудио: {e}")
             return "Ошибка: произошла непредвиденная ошибка при обработке аудио."
 
+    async def stream_transcription(self, audio_data: bytes) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковая транскрибация длинного аудио
+        
+        Выдает события Whisper сервиса по мере декодирования: "segment" (start, end, text)
+        и "done" (полный текст). При ошибке выдает событие "error" с текстом ошибки.
+        """
+        try:
+            files = {'file': ('voice.ogg', audio_data, 'audio/ogg')}
+            
+            # Таймаут на чтение - между сегментами, а не на всю запись
+            timeout = httpx.Timeout(30.0, read=120.0)
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                async with client.stream("POST", f"{WHISPER_SERVICE_URL}/transcribe_stream", files=files) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.strip():
+                            yield json.loads(line)
+
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP ошибка при запросе к Whisper сервису: {e.response.status_code} - {e.response.text}")
+            if e.response.status_code == 503:
+                yield {"type": "error", "error": self._whisper_unavailable_message(e.response)}
+            else:
+                yield {"type": "error", "error": "Ошибка: сервис распознавания речи временно недоступен."}
+        except httpx.RequestError as e:
+            logger.error(f"Ошибка сети при запросе к Whisper сервису: {e}")
+            yield {"type": "error", "error": "Ошибка: проблема с подключением к сервису распознавания речи."}
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при потоковой транскрибации аудио: {e}")
+            yield {"type": "error", "error": "Ошибка: произошла непредвиденная ошибка при обработке аудио."}
+
     def fetch_iam_token(self) -> Optional[str]:
         """Получить IAM токен для Yandex Cloud через yc CLI"""
         try:
@@ -277,31 +412,71 @@ class NeuroAPIClient:
             return True
         return False
 
+    def get_user_ocr_recognizer(self, user_id: int, document: bool = False) -> str:
+        """Профиль распознавания OCR пользователя (без выбора - профиль по умолчанию для фото или документов)"""
+        default = OCR_DOCUMENT_RECOGNIZER_PROFILE if document else OCR_RECOGNIZER_PROFILE
+        return self.user_ocr_recognizers.get(user_id, default)
+
+    def set_user_ocr_recognizer(self, user_id: int, recognizer: str) -> bool:
+        """Установить профиль распознавания OCR для пользователя"""
+        if recognizer in OCR_RECOGNIZERS:
+            self.user_ocr_recognizers[user_id] = recognizer
+            logger.info(f"Пользователь {user_id} выбрал профиль OCR: {recognizer}")
+            return True
+        return False
+
     def get_available_voices(self) -> Dict[str, Dict[str, Any]]:
         """Получить список доступных голосов"""
         return YANDEX_VOICES
 
-    async def generate_image(self, prompt: str) -> Optional[bytes]:
-        """Генерация изображения с помощью Kandinsky 2.2 через локальный сервис"""
+    async def generate_image(self, prompt: str, preset: str = DEFAULT_IMAGE_PRESET,
+                             on_preview: Optional[Callable[[bytes, int, int], Awaitable[None]]] = None) -> Optional[bytes]:
+        """
+        Генерация изображения с помощью Kandinsky 2.2 через локальный сервис
+        
+        Args:
+            prompt: Описание изображения
+            preset: Пресет качества
+            on_preview: Корутина (превью JPEG, шаг, всего шагов) для промежуточных превью
+        """
         try:
+            # Размер, число шагов и планировщик задает пресет сервиса
             payload = {
                 "prompt": prompt,
                 "negative_prompt": "low quality, bad quality, blurry, pixelated",
-                "width": 768,
-                "height": 768,
-                "num_inference_steps": 50,
+                "preset": preset,
+                "output_format": IMAGE_OUTPUT_FORMAT,
+                "quality": IMAGE_OUTPUT_QUALITY,
                 "guidance_scale": 4.0,
                 "prior_guidance_scale": 1.0
             }
             
-            async with httpx.AsyncClient(timeout=180.0) as client:
-                response = await client.post(
-                    f"{KANDINSKY_SERVICE_URL}/generate",
-                    json=payload
-                )
+            deadline = asyncio.get_running_loop().time() + JOB_MAX_WAIT
+            async with httpx.AsyncClient(timeout=JOB_POLL_WAIT + 30.0) as client:
+                job = await self._submit_job(client, f"{KANDINSKY_SERVICE_URL}/jobs/generate", deadline, json=payload)
+                
+                show_preview = None
+                if on_preview is not None:
+                    async def show_preview(job_status: Dict[str, Any]):
+                        preview = await client.get(f"{KANDINSKY_SERVICE_URL}/jobs/{job_status['job_id']}/preview")
+                        if preview.status_code == 200:
+                            await on_preview(
+                                preview.content,
+                                int(preview.headers.get("X-Preview-Step", job_status["preview_step"])),
+                                int(preview.headers.get("X-Total-Steps", job_status["total_steps"]))
+                            )
+                
+                job = await self._wait_job(client, KANDINSKY_SERVICE_URL, job["job_id"], deadline, show_preview)
+                
+                if job["status"] == "failed":
+                    logger.error(f"Ошибка генерации изображения в Kandinsky сервисе: {job.get('error')}")
+                    return None
+                
+                response = await client.get(f"{KANDINSKY_SERVICE_URL}/jobs/{job['job_id']}/result")
                 response.raise_for_status()
             
-            # Возвращаем байты изображения
+            # Байты изображения целиком: бот загружает фото в Telegram одним файлом
+            # (BufferedInputFile), так что потоковое чтение не уменьшило бы пик памяти
             return response.content
             
         except httpx.HTTPStatusError as e:
@@ -310,12 +485,15 @@ class NeuroAPIClient:
         except httpx.RequestError as e:
             logger.error(f"Ошибка сети при запросе к Kandinsky сервису: {e}")
             return None
+        except TimeoutError as e:
+            logger.error(f"Превышено время ожидания генерации изображения: {e}")
+            return None
         except Exception as e:
             logger.error(f"Неожиданная ошибка при генерации изображения через Kandinsky: {e}")
             return None
 
-    async def extract_text_from_image(self, image_data: bytes) -> str:
-        """Извлечение текста из изображения с помощью PaddleOCR сервиса"""
+    async def extract_text_from_image(self, image_data: bytes, recognizer: str = OCR_RECOGNIZER_PROFILE) -> str:
+        """Извлечение текста из изображения с помощью OCR сервиса (recognizer - профиль Tesseract)"""
         try:
             # Формируем данные для отправки
             files = {'file': ('image.jpg', image_data, 'image/jpeg')}
@@ -323,7 +501,8 @@ class NeuroAPIClient:
             async with httpx.AsyncClient(timeout=120.0) as client:
                 response = await client.post(
                     f"{OCR_SERVICE_URL}/ocr/extract_text_simple",
-                    files=files
+                    files=files,
+                    params={"recognizer": recognizer}
                 )
                 response.raise_for_status()
             
@@ -344,6 +523,83 @@ class NeuroAPIClient:
         except Exception as e:
             logger.error(f"Неожиданная ошибка при распознавании изображения: {e}")
             return "Ошибка: произошла непредвиденная ошибка при обработке изображения."
+
+    async def extract_text_from_images(self, images: List[bytes], recognizer: str = OCR_RECOGNIZER_PROFILE) -> List[str]:
+        """Пакетное извлечение текста из нескольких изображений (альбома) одним запросом"""
+        try:
+            files = [
+                ('files', (f'image_{i}.jpg', image_data, 'image/jpeg'))
+                for i, image_data in enumerate(images)
+            ]
+            
+            async with httpx.AsyncClient(timeout=180.0) as client:
+                response = await client.post(
+                    f"{OCR_SERVICE_URL}/ocr/extract_text_batch",
+                    files=files,
+                    params={"recognizer": recognizer}
+                )
+                response.raise_for_status()
+            
+            response_data = response.json()
+            
+            texts = []
+            for result in response_data.get("results", []):
+                if result.get("success"):
+                    texts.append(result.get("text", ""))
+                else:
+                    logger.error(f"OCR сервис вернул ошибку для изображения {result.get('index')}: {result.get('error')}")
+                    texts.append("Ошибка: не удалось распознать текст на изображении.")
+            return texts
+
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP ошибка при запросе к OCR сервису: {e.response.status_code} - {e.response.text}")
+            return ["Ошибка: OCR сервис временно недоступен."] * len(images)
+        except httpx.RequestError as e:
+            logger.error(f"Ошибка сети при запросе к OCR сервису: {e}")
+            return ["Ошибка: проблема с подключением к OCR сервису."] * len(images)
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при распознавании изображений: {e}")
+            return ["Ошибка: произошла непредвиденная ошибка при обработке изображений."] * len(images)
+
+    async def stream_document_text(self, document_data: bytes, filename: str, mime_type: str,
+                                   recognizer: str = OCR_DOCUMENT_RECOGNIZER_PROFILE) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковое распознавание многостраничного документа (PDF/TIFF)
+        
+        Выдает события OCR сервиса по мере готовности страниц: "document" (число страниц),
+        "page" (результат страницы), "done". При ошибке выдает событие "error" с текстом ошибки.
+        """
+        try:
+            files = {'file': (filename, document_data, mime_type)}
+            
+            # Таймаут на чтение - между строками потока, а не на весь документ
+            timeout = httpx.Timeout(30.0, read=300.0)
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                async with client.stream(
+                    "POST", f"{OCR_SERVICE_URL}/ocr/extract_document",
+                    files=files, params={"recognizer": recognizer}
+                ) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.strip():
+                            yield json.loads(line)
+
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP ошибка при запросе к OCR сервису: {e.response.status_code} - {e.response.text}")
+            if e.response.status_code == 413:
+                yield {"type": "error", "error": "Ошибка: документ слишком большой для распознавания."}
+            elif e.response.status_code == 400:
+                yield {"type": "error", "error": "Ошибка: неподдерживаемый или поврежденный документ."}
+            else:
+                yield {"type": "error", "error": "Ошибка: OCR сервис временно недоступен."}
+        except httpx.RequestError as e:
+            logger.error(f"Ошибка сети при запросе к OCR сервису: {e}")
+            yield {"type": "error", "error": "Ошибка: проблема с подключением к OCR сервису."}
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при распознавании документа: {e}")
+            yield {"type": "error", "error": "Ошибка: произошла непредвиденная ошибка при обработке документа."}
     
     async def close(self):
         """Закрыть HTTP клиент"""
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк OCR сервиса на синтетическом корпусе изображений
+
+Запускается локально рядом с main.py (нужны Tesseract и зависимости сервиса):
+    python benchmark_ocr.py
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import statistics
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+import main
+
+SAMPLE_LINES = [
+    "Invoice number 2024-117 issued on March 5",
+    "Total amount due: 15 400 RUB including VAT",
+    "Please transfer the payment within ten days",
+    "Meeting moved to Thursday at 14:30",
+    "Contact support if the problem persists",
+    "Order status: shipped, tracking code RB123456",
+]
+
+
+def load_font(size: int) -> ImageFont.ImageFont:
+    """Шрифт по умолчанию нужного размера (масштабируемый при наличии FreeType)"""
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def render_text_page(width: int, height: int, lines: int, dark: bool = False, seed: int = 0,
+                     font_size: int = 11, paragraph_every: int = 0) -> Image.Image:
+    """Отрисовка страницы с текстом (аналог скриншота)"""
+    rng = random.Random(seed)
+    background, foreground = ((30, 30, 30), (230, 230, 230)) if dark else ((255, 255, 255), (20, 20, 20))
+    image = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(image)
+    font = load_font(font_size)
+    line_height = int(font_size * 1.6)
+    margin = max(20, width // 20)
+    y = margin
+    for line in range(lines):
+        if y + line_height > height - margin:
+            break
+        draw.text((margin, y), rng.choice(SAMPLE_LINES), fill=foreground, font=font)
+        y += line_height
+        if paragraph_every and (line + 1) % paragraph_every == 0:
+            y += line_height * 2
+    return image
+
+
+def render_document(seed: int = 0) -> Image.Image:
+    """Плотный документ формата A4 при 300 DPI"""
+    return render_text_page(2480, 3508, 200, seed=seed, font_size=36, paragraph_every=6)
+
+
+def degrade_to_photo(image: Image.Image, seed: int = 0, blur: float = 1.5, noise: float = 12.0) -> Image.Image:
+    """Имитация фотографии бумажного документа: наклон, размытие, шум, низкий контраст"""
+    rng = np.random.default_rng(seed)
+    photo = image.rotate(float(rng.uniform(-3, 3)), expand=True, fillcolor=(200, 200, 190))
+    photo = photo.filter(ImageFilter.GaussianBlur(blur))
+    pixels = np.asarray(photo).astype(np.float32)
+    pixels = pixels * 0.6 + 60  # Сжимаем динамический диапазон
+    pixels += rng.normal(0, noise, pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def build_mixed_corpus(size: int = 12) -> List[Tuple[str, Image.Image]]:
+    """Смешанный корпус: светлые и темные скриншоты, четкие и плохие фотографии"""
+    corpus = []
+    for i in range(size):
+        kind = i % 4
+        page = render_text_page(900, 600, 20, dark=(kind == 1), seed=i)
+        if kind == 0:
+            corpus.append(("screenshot", page))
+        elif kind == 1:
+            corpus.append(("screenshot_dark", page))
+        elif kind == 2:
+            corpus.append(("photo", degrade_to_photo(page, seed=i, blur=0.6, noise=4.0)))
+        else:
+            corpus.append(("photo_bad", degrade_to_photo(page, seed=i)))
+    return corpus
+
+
+def benchmark_preprocessing_profiles(corpus_size: int):
+    """Сравнение фиксированного профиля "standard" с автоматическим выбором профиля"""
+    print("🖼️  Профили предобработки на смешанном корпусе")
+    print("-" * 50)
+    corpus = build_mixed_corpus(corpus_size)
+
+    results: Dict[str, List[float]] = {"standard": [], "auto": []}
+    chosen: Dict[str, List[str]] = {}
+    for kind, image in corpus:
+        for mode in results:
+            start = time.perf_counter()
+            result = main.recognize_image(image, mode)
+            results[mode].append(time.perf_counter() - start)
+            if mode == "auto":
+                chosen.setdefault(kind, []).append(result["preprocessing_profile"])
+
+    for kind, profiles in chosen.items():
+        print(f"   {kind:16s} -> {', '.join(sorted(set(profiles)))}")
+    baseline = statistics.mean(results["standard"])
+    adaptive = statistics.mean(results["auto"])
+    print(f"   Всегда standard: {baseline * 1000:.0f} мс/изобр.")
+    print(f"   Авто-профиль:    {adaptive * 1000:.0f} мс/изобр.")
+    print(f"   Ускорение:       x{baseline / adaptive:.2f}")
+
+
+def benchmark_parallel_regions(corpus_size: int):
+    """Ускорение распознавания крупных документов при OCR регионов в пуле потоков"""
+    print("📄 Параллельное распознавание регионов на документах A4")
+    print("-" * 50)
+    documents = [main.preprocess_image(render_document(seed=i), "fast") for i in range(max(corpus_size // 6, 1))]
+    config = r'--oem 3 --psm 6 -l rus+eng'
+    lang = 'rus+eng'
+
+    start = time.perf_counter()
+    for document in documents:
+        main.recognize_full_page(document, config, lang)
+    baseline = (time.perf_counter() - start) / len(documents)
+    print(f"   Вся страница целиком: {baseline:.2f} с/стр.")
+
+    worker_counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    for workers in worker_counts:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            regions = 0
+            for document in documents:
+                result = main.recognize_regions_parallel(document, config, lang, executor)
+                regions += result["regions"] if result else 1
+            elapsed = (time.perf_counter() - start) / len(documents)
+        print(f"   Регионы, {workers:2d} потоков:  {elapsed:.2f} с/стр. "
+              f"(регионов: {regions // len(documents)}, ускорение x{baseline / elapsed:.2f})")
+
+
+def benchmark_album(corpus_size: int, llm_latency: float = 3.0):
+    """Альбом из 10 фото: по одному запросу на фото против одного пакетного запроса"""
+    print("🗂️  Альбом из 10 изображений: поштучно против пакета")
+    print("-" * 50)
+    album = [image for _, image in build_mixed_corpus(10)]
+
+    # Прежний сценарий: каждое фото - отдельный запрос OCR и отдельный запрос к LLM
+    start = time.perf_counter()
+    for image in album:
+        main.recognize_image(image)
+    sequential_ocr = time.perf_counter() - start
+
+    # Пакетный сценарий: изображения распознаются параллельно, один запрос к LLM
+    start = time.perf_counter()
+    list(main.image_executor.map(main.recognize_image, album))
+    batch_ocr = time.perf_counter() - start
+
+    sequential_total = sequential_ocr + len(album) * llm_latency
+    batch_total = batch_ocr + llm_latency
+    print(f"   OCR поштучно:   {sequential_ocr:.2f} с, запросов OCR: {len(album)}, запросов LLM: {len(album)}")
+    print(f"   OCR пакетом:    {batch_ocr:.2f} с, запросов OCR: 1, запросов LLM: 1")
+    print(f"   Оценка end-to-end при {llm_latency:.1f} с на ответ LLM: "
+          f"{sequential_total:.1f} с -> {batch_total:.1f} с")
+
+
+def encode_large_inputs() -> Dict[str, bytes]:
+    """Крупные входные файлы: фото документа 48 Мп в JPEG и скан 36 Мп в PNG"""
+    page = render_text_page(8000, 6000, 300, font_size=64, paragraph_every=6)
+    jpeg_io = io.BytesIO()
+    page.save(jpeg_io, format="JPEG", quality=90)
+    png_io = io.BytesIO()
+    page.crop((0, 0, 6000, 6000)).convert("L").save(png_io, format="PNG")
+    return {"jpeg_48mp": jpeg_io.getvalue(), "png_36mp": png_io.getvalue()}
+
+
+def make_decompression_bomb_png(width: int, height: int) -> bytes:
+    """PNG из одного пикселя с подмененными размерами в заголовке IHDR"""
+    png_io = io.BytesIO()
+    Image.new("L", (1, 1), 255).save(png_io, format="PNG")
+    data = bytearray(png_io.getvalue())
+    # Сигнатура (8) + длина (4) + тип "IHDR" (4), затем ширина и высота
+    ihdr_start = 8 + 4
+    data[ihdr_start + 4:ihdr_start + 12] = struct.pack(">II", width, height)
+    crc = zlib.crc32(bytes(data[ihdr_start:ihdr_start + 4 + 13]))
+    data[ihdr_start + 4 + 13:ihdr_start + 4 + 13 + 4] = struct.pack(">I", crc)
+    return bytes(data)
+
+
+def reset_peak_rss():
+    """Сброс пикового RSS процесса (Linux: запись 5 в /proc/self/clear_refs)"""
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+
+
+def read_peak_rss_mb() -> float:
+    """Пиковый RSS процесса в МБ (VmHWM из /proc/self/status)"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def decode_in_fresh_process(image_data: bytes, bounded: bool) -> Tuple[float, float]:
+    """Декодирование в отдельном процессе: время и прирост пикового RSS в МБ"""
+    reset_peak_rss()
+    baseline = read_peak_rss_mb()
+    start = time.perf_counter()
+    if bounded:
+        image = main.decode_image(image_data)
+    else:
+        # Полное декодирование и уменьшение до того же размера, что и decode_image
+        image = Image.open(io.BytesIO(image_data))
+        image.load()
+        image.thumbnail((main.MAX_DECODE_SIDE, main.MAX_DECODE_SIDE), Image.Resampling.BICUBIC)
+    elapsed = time.perf_counter() - start
+    peak = read_peak_rss_mb()
+    del image
+    return elapsed, peak - baseline
+
+
+def benchmark_bounded_decode(corpus_size: int):
+    """Пиковая память и время декодирования крупных изображений"""
+    print("🧮 Декодирование крупных изображений")
+    print("-" * 50)
+    inputs = encode_large_inputs()
+    for name, image_data in inputs.items():
+        for bounded in (False, True):
+            # Новый процесс на каждый замер, чтобы освобожденная память не искажала пик
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                elapsed, rss_mb = executor.submit(decode_in_fresh_process, image_data, bounded).result()
+            label = "decode_image" if bounded else "полное декодирование"
+            print(f"   {name:10s} {label:22s} {elapsed * 1000:7.0f} мс, +{rss_mb:6.0f} МБ RSS")
+
+    # Decompression bomb: крошечный PNG с заголовком 30000x30000 (~900 МБ при декодировании)
+    bomb = make_decompression_bomb_png(30000, 30000)
+    try:
+        main.decode_image(bomb)
+        print("   ❌ decompression bomb не отклонена")
+    except main.ImageTooLargeError as e:
+        print(f"   ✅ decompression bomb ({len(bomb)} байт) отклонена по заголовку: {e}")
+
+
+def build_pdf_document(pages: int) -> bytes:
+    """Многостраничный PDF из отрисованных страниц A4 при 150 DPI"""
+    images = [render_text_page(1240, 1754, 60, seed=i, font_size=20, paragraph_every=5) for i in range(pages)]
+    pdf_io = io.BytesIO()
+    images[0].save(pdf_io, format="PDF", save_all=True, append_images=images[1:], resolution=150)
+    return pdf_io.getvalue()
+
+
+async def consume_document_stream(document: bytes) -> Tuple[float, float, List[int]]:
+    """Время до первой страницы, общее время и порядок готовности страниц"""
+    start = time.perf_counter()
+    rasterizer = main.DocumentRasterizer(document)
+    first_page = None
+    order = []
+    try:
+        async for page in main.iter_document_pages(rasterizer):
+            if first_page is None:
+                first_page = time.perf_counter() - start
+            order.append(page["page"])
+    finally:
+        rasterizer.close()
+    return first_page, time.perf_counter() - start, order
+
+
+def benchmark_document_stream(corpus_size: int):
+    """Многостраничный PDF: последовательная обработка против потоковой параллельной"""
+    pages = max(corpus_size, 2)
+    print(f"📚 Потоковое распознавание PDF из {pages} страниц")
+    print("-" * 50)
+    document = build_pdf_document(pages)
+
+    # Последовательно: ответ только после последней страницы
+    start = time.perf_counter()
+    rasterizer = main.DocumentRasterizer(document)
+    for index in range(rasterizer.page_count):
+        main.recognize_document_page(rasterizer, index, "auto")
+    rasterizer.close()
+    sequential = time.perf_counter() - start
+
+    first_page, total, order = asyncio.run(consume_document_stream(document))
+    print(f"   Последовательно:  первый результат через {sequential:.2f} с (весь документ)")
+    print(f"   Поток NDJSON:     первая страница через {first_page:.2f} с, весь документ {total:.2f} с")
+    print(f"   Страниц одновременно: {main.DOCUMENT_PAGE_WORKERS}, порядок готовности: {order[:10]}...")
+
+
+def benchmark_recognizers(corpus_size: int):
+    """Пропускная способность профилей распознавания Tesseract"""
+    print("🔤 Профили распознавания: best / fast / single-language")
+    print("-" * 50)
+    corpus = [image for _, image in build_mixed_corpus(corpus_size)]
+    for recognizer in main.RECOGNIZER_PROFILES:
+        start = time.perf_counter()
+        languages = set()
+        for image in corpus:
+            result = main.recognize_image(image, "auto", recognizer=recognizer)
+            languages.add(result["languages"])
+        elapsed = time.perf_counter() - start
+        print(f"   {recognizer:16s} {len(corpus) / elapsed * 60:6.1f} изобр./мин, "
+              f"{elapsed / len(corpus) * 1000:5.0f} мс/изобр., языки: {', '.join(sorted(languages))}")
+
+
+BENCHMARKS = {
+    "profiles": benchmark_preprocessing_profiles,
+    "regions": benchmark_parallel_regions,
+    "album": benchmark_album,
+    "decode": benchmark_bounded_decode,
+    "document": benchmark_document_stream,
+    "recognizers": benchmark_recognizers,
+}
+
+
+def main_cli():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description="Бенчмарк OCR сервиса")
+    parser.add_argument("suites", nargs="*", default=list(BENCHMARKS), help=f"Набор тестов: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--size", type=int, default=12, help="Размер синтетического корпуса")
+    args = parser.parse_args()
+
+    for suite in args.suites:
+        if suite not in BENCHMARKS:
+            print(f"❌ Неизвестный набор: {suite}")
+            return 1
+        BENCHMARKS[suite](args.size)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
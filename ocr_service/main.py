@@ -1,12 +1,18 @@
 import logging
 import io
+import json
+import os
+import time
 import asyncio
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from PIL import Image, ImageEnhance, ImageFilter
+from fastapi.responses import JSONResponse, StreamingResponse
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
 import numpy as np
 import pytesseract
+import pypdfium2 as pdfium
 import cv2
 import uvicorn
 
@@ -24,7 +30,188 @@ app = FastAPI(
     version="1.0.0"
 )
 
-def preprocess_image(image: Image.Image) -> Image.Image:
+# Профили предобработки: "fast" для четких скриншотов, "standard" - полная цепочка,
+# "heavy" - полная цепочка с шумоподавлением для размытых и зашумленных фото
+PREPROCESSING_PROFILES = ("fast", "standard", "heavy")
+
+# Профиль по умолчанию: "auto" - выбирается анализом качества изображения
+DEFAULT_PREPROCESSING_PROFILE = os.getenv("OCR_PREPROCESSING_PROFILE", "auto")
+
+# Профили распознавания Tesseract: "best" - модели tessdata по умолчанию, rus+eng;
+# "fast" - облегченные модели tessdata_fast; "single-language" - определение письменности
+# и загрузка только одной языковой модели
+TESSDATA_FAST_DIR = os.getenv("OCR_TESSDATA_FAST_DIR", "/usr/share/tesseract-ocr/5/tessdata_fast")
+RECOGNIZER_PROFILES: Dict[str, Dict[str, Any]] = {
+    "best": {"oem": 3, "tessdata_dir": None, "detect_script": False},
+    "fast": {"oem": 1, "tessdata_dir": TESSDATA_FAST_DIR, "detect_script": False},
+    "single-language": {"oem": 1, "tessdata_dir": None, "detect_script": True},
+}
+DEFAULT_RECOGNIZER_PROFILE = os.getenv("OCR_RECOGNIZER_PROFILE", "best")
+
+# Языковая модель для письменности, определенной OSD
+SCRIPT_LANGUAGES = {"Cyrillic": "rus", "Latin": "eng"}
+SCRIPT_MIN_CONFIDENCE = 1.0  # Ниже порога распознаем rus+eng
+
+# Пороги классификатора качества (считаются на уменьшенной копии изображения)
+QUALITY_ANALYSIS_SIZE = 512       # Максимальная сторона миниатюры для анализа
+BLUR_THRESHOLD = 100.0            # Дисперсия Лапласиана ниже порога - размытое изображение
+CONTRAST_THRESHOLD = 100.0        # Размах яркости (99-й минус 1-й перцентиль) ниже порога - низкий контраст
+NOISE_THRESHOLD = 8.0             # Оценка сигмы шума выше порога - зашумленное изображение
+SCREENSHOT_COLOR_COVERAGE = 0.6   # Доля пикселей в 8 самых частых цветах для скриншота
+
+# Параллельное распознавание по текстовым регионам для крупных изображений
+PARALLEL_REGIONS_ENABLED = os.getenv("OCR_PARALLEL_REGIONS", "true").lower() == "true"
+REGION_WORKERS = int(os.getenv("OCR_REGION_WORKERS", str(os.cpu_count() or 2)))
+REGION_MIN_PIXELS = int(os.getenv("OCR_REGION_MIN_PIXELS", str(1500 * 1500)))  # Меньшие страницы распознаются целиком
+REGION_MIN_SIZE = 8   # Минимальная ширина/высота региона в пикселях
+REGION_PADDING = 6    # Отступ вокруг региона, чтобы не обрезать края букв
+
+if PARALLEL_REGIONS_ENABLED:
+    # Несколько процессов tesseract одновременно: отключаем внутренний OpenMP,
+    # иначе потоки конкурируют за те же ядра
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+region_executor = ThreadPoolExecutor(max_workers=REGION_WORKERS)
+
+# Пул для распознавания целых изображений (отдельный от пула регионов,
+# чтобы задачи изображений не ждали освобождения собственного пула)
+IMAGE_WORKERS = int(os.getenv("OCR_IMAGE_WORKERS", "4"))
+MAX_BATCH_SIZE = int(os.getenv("OCR_MAX_BATCH_SIZE", "20"))
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS)
+
+# Ограничения декодирования: размеры проверяются по заголовку до чтения пикселей
+MAX_UPLOAD_BYTES = int(os.getenv("OCR_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("OCR_MAX_IMAGE_PIXELS", str(100_000_000)))
+MAX_DECODE_SIDE = int(os.getenv("OCR_MAX_DECODE_SIDE", "3500"))  # ~A4 при 300 DPI
+
+# Многостраничные документы (PDF/TIFF)
+DOCUMENT_DPI = int(os.getenv("OCR_DOCUMENT_DPI", "200"))
+DOCUMENT_PAGE_WORKERS = int(os.getenv("OCR_DOCUMENT_PAGE_WORKERS", "4"))  # Страниц в обработке одновременно
+MAX_DOCUMENT_PAGES = int(os.getenv("OCR_MAX_DOCUMENT_PAGES", "200"))
+
+# Защита PIL от decompression bomb для всех остальных мест открытия изображений
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Метрики сервиса (обновляются из разных потоков)
+metrics_lock = threading.Lock()
+ocr_metrics: Dict[str, Any] = {
+    "requests_total": 0,
+    "profiles": {
+        profile: {"count": 0, "total_seconds": 0.0}
+        for profile in PREPROCESSING_PROFILES
+    },
+    "recognizers": {
+        recognizer: {"count": 0, "total_seconds": 0.0}
+        for recognizer in RECOGNIZER_PROFILES
+    }
+}
+
+
+def record_recognition_metrics(profile: str, recognizer: str, elapsed: float):
+    """Учет выбранных профилей предобработки и распознавания и времени обработки"""
+    with metrics_lock:
+        ocr_metrics["requests_total"] += 1
+        for group, name in (("profiles", profile), ("recognizers", recognizer)):
+            group_metrics = ocr_metrics[group][name]
+            group_metrics["count"] += 1
+            group_metrics["total_seconds"] += elapsed
+
+
+def analyze_image_quality(image: Image.Image) -> Dict[str, Any]:
+    """
+    Быстрая оценка качества изображения для выбора профиля предобработки
+    
+    Анализ выполняется на миниатюре, поэтому занимает единицы миллисекунд.
+    
+    Args:
+        image: Исходное изображение
+        
+    Returns:
+        Словарь с оценками контраста, шума, резкости и признаком скриншота
+    """
+    # Сначала уменьшение, потом перевод в RGB: полноразмерная копия изображения не создается.
+    # NEAREST сохраняет точные цвета пикселей, что важно для детекции скриншотов
+    scale = min(1.0, QUALITY_ANALYSIS_SIZE / max(image.size))
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    thumbnail = image.resize(size, Image.Resampling.NEAREST).convert('RGB')
+    rgb = np.array(thumbnail)
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    
+    # Контраст: размах яркости между темными (текст) и светлыми (фон) пикселями
+    dark, light = np.percentile(gray, [1, 99])
+    contrast = float(light - dark)
+    
+    # Резкость: дисперсия Лапласиана
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    
+    # Шум: оценка сигмы методом Иммеркера
+    h, w = gray.shape
+    noise = 0.0
+    if h > 2 and w > 2:
+        kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float64)
+        response = cv2.filter2D(gray.astype(np.float64), -1, kernel)
+        noise = float(np.sqrt(np.pi / 2) * np.abs(response[1:-1, 1:-1]).sum() / (6 * (w - 2) * (h - 2)))
+    
+    # Скриншот: большие однотонные области, несколько цветов покрывают большую часть кадра
+    # Цвета огрубляются до 64 уровней на канал, чтобы сгладить артефакты JPEG
+    quantized = (rgb >> 2).reshape(-1, 3).astype(np.int32)
+    color_codes = (quantized[:, 0] << 12) | (quantized[:, 1] << 6) | quantized[:, 2]
+    color_counts = np.bincount(color_codes)
+    top_colors_coverage = float(np.sort(color_counts)[-8:].sum() / max(len(color_codes), 1))
+    
+    return {
+        "contrast": round(contrast, 2),
+        "sharpness": round(sharpness, 2),
+        "noise": round(noise, 2),
+        "color_coverage": round(top_colors_coverage, 3),
+        "is_screenshot": top_colors_coverage >= SCREENSHOT_COLOR_COVERAGE
+    }
+
+
+def select_preprocessing_profile(quality: Dict[str, Any]) -> str:
+    """
+    Выбор профиля предобработки по оценкам качества
+    
+    Args:
+        quality: Результат analyze_image_quality
+        
+    Returns:
+        Название профиля: "fast", "standard" или "heavy"
+    """
+    is_blurry = quality["sharpness"] < BLUR_THRESHOLD
+    is_low_contrast = quality["contrast"] < CONTRAST_THRESHOLD
+    is_noisy = quality["noise"] > NOISE_THRESHOLD
+    
+    if quality["is_screenshot"] and not is_blurry and not is_low_contrast:
+        return "fast"
+    if is_noisy or (is_blurry and is_low_contrast):
+        return "heavy"
+    return "standard"
+
+
+def preprocess_image_fast(image: Image.Image) -> Image.Image:
+    """
+    Облегченная предобработка для четких изображений (скриншотов)
+    
+    Только перевод в оттенки серого, инверсия темной темы и увеличение мелкого текста.
+    Бинаризацию Tesseract выполняет самостоятельно.
+    """
+    gray_image = image.convert('L')
+    
+    # Tesseract лучше распознает темный текст на светлом фоне
+    if np.asarray(gray_image).mean() < 127:
+        gray_image = ImageOps.invert(gray_image)
+    
+    min_dimension = 1200
+    if max(gray_image.size) < min_dimension:
+        scale_factor = min_dimension / max(gray_image.size)
+        new_size = (int(gray_image.size[0] * scale_factor), int(gray_image.size[1] * scale_factor))
+        gray_image = gray_image.resize(new_size, Image.Resampling.BICUBIC)
+    
+    return gray_image
+
+
+def preprocess_image(image: Image.Image, profile: str = "standard") -> Image.Image:
     """
     Продвинутая предобработка изображения для максимального качества OCR
     Автоматически применяет все рекомендуемые преобразования:
@@ -32,9 +219,14 @@ def preprocess_image(image: Image.Image) -> Image.Image:
     - Улучшение контрастности текста и фона
     - Коррекция наклона и искажений
     - Устранение размытия и повышение четкости
+    
+    Профиль "fast" пропускает тяжелые шаги, "heavy" добавляет шумоподавление.
     """
+    if profile == "fast":
+        return preprocess_image_fast(image)
+    
     try:
-        logger.info(f"Начальное изображение: {image.size}, режим: {image.mode}")
+        logger.info(f"Начальное изображение: {image.size}, режим: {image.mode}, профиль: {profile}")
         
         # Конвертируем в RGB если необходимо
         if image.mode != 'RGB':
@@ -75,6 +267,10 @@ def preprocess_image(image: Image.Image) -> Image.Image:
         # Конвертируем в OpenCV для продвинутой обработки
         cv_image = np.array(gray_image)
         
+        # Шумоподавление только для зашумленных и размытых фотографий
+        if profile == "heavy":
+            cv_image = enhance_image_quality(cv_image)
+        
         # 4. КОРРЕКЦИЯ НАКЛОНА И ИСКАЖЕНИЙ
         # Детекция и коррекция наклона текста
         cv_image = correct_skew(cv_image)
@@ -210,6 +406,191 @@ def enhance_image_quality(image: np.ndarray) -> np.ndarray:
         logger.warning(f"Ошибка при улучшении качества: {e}")
         return image
 
+def detect_text_regions(image: Image.Image) -> List[Tuple[int, int, int, int]]:
+    """
+    Поиск текстовых блоков на предобработанном изображении
+    
+    Символы объединяются дилатацией в строки и абзацы, после чего
+    ограничивающие прямоугольники контуров становятся регионами для OCR.
+    
+    Args:
+        image: Предобработанное изображение (темный текст на светлом фоне)
+        
+    Returns:
+        Список регионов (x, y, width, height) в порядке чтения
+    """
+    gray = np.array(image.convert('L'))
+    h, w = gray.shape
+    
+    # Маска текста: текст белый, фон черный
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    
+    # Горизонтальная дилатация склеивает буквы в слова и строки,
+    # вертикальная - соседние строки в абзацы
+    kernel_width = max(w // 60, 9)
+    kernel_height = max(h // 200, 5)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_width, kernel_height))
+    merged = cv2.dilate(mask, kernel, iterations=1)
+    
+    contours, _ = cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    regions = []
+    padding = REGION_PADDING
+    for contour in contours:
+        x, y, cw, ch = cv2.boundingRect(contour)
+        # Отбрасываем точки шума и рамки на всю страницу
+        if cw < REGION_MIN_SIZE or ch < REGION_MIN_SIZE:
+            continue
+        if cw * ch > 0.9 * w * h:
+            continue
+        x0, y0 = max(x - padding, 0), max(y - padding, 0)
+        x1, y1 = min(x + cw + padding, w), min(y + ch + padding, h)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+    
+    return sort_regions_reading_order(regions)
+
+
+def sort_regions_reading_order(regions: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """
+    Сортировка регионов в порядке чтения: сверху вниз, в пределах ряда - слева направо
+    
+    Регионы попадают в один ряд, если середина региона лежит внутри высоты ряда.
+    """
+    rows: List[List[Tuple[int, int, int, int]]] = []
+    for region in sorted(regions, key=lambda r: r[1]):
+        center_y = region[1] + region[3] / 2
+        if rows:
+            row_top = min(r[1] for r in rows[-1])
+            row_bottom = max(r[1] + r[3] for r in rows[-1])
+            if row_top <= center_y <= row_bottom:
+                rows[-1].append(region)
+                continue
+        rows.append([region])
+    
+    return [region for row in rows for region in sorted(row, key=lambda r: r[0])]
+
+
+def recognize_region(image: Image.Image, region: Tuple[int, int, int, int], config: str, lang: str) -> Dict[str, Any]:
+    """
+    OCR одного региона за один вызов Tesseract
+    
+    Текст собирается из результата image_to_data по номерам блоков и строк,
+    координаты слов переводятся в систему координат страницы.
+    """
+    x, y, w, h = region
+    crop = image.crop((x, y, x + w, y + h))
+    data = pytesseract.image_to_data(crop, config=config, lang=lang, output_type=pytesseract.Output.DICT)
+    
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    text_blocks = []
+    for i in range(len(data['text'])):
+        text = data['text'][i].strip()
+        if not text:
+            continue
+        confidence = float(data['conf'][i])
+        line_key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(line_key, []).append(text)
+        if confidence > 30:  # Фильтруем по уверенности > 30%
+            text_blocks.append({
+                "text": text,
+                "confidence": confidence / 100.0,  # Нормализуем 0-1
+                "coordinates": {
+                    "x": int(data['left'][i]) + x,
+                    "y": int(data['top'][i]) + y,
+                    "width": int(data['width'][i]),
+                    "height": int(data['height'][i])
+                }
+            })
+    
+    return {
+        "text": "\n".join(" ".join(words) for _, words in sorted(lines.items())),
+        "blocks": text_blocks
+    }
+
+
+def recognize_regions_parallel(image: Image.Image, config: str, lang: str,
+                               executor: Optional[ThreadPoolExecutor] = None) -> Optional[Dict[str, Any]]:
+    """
+    Параллельное распознавание текстовых регионов страницы
+    
+    Каждый вызов pytesseract запускает отдельный процесс tesseract,
+    поэтому пул потоков дает реальную загрузку нескольких ядер.
+    
+    Returns:
+        Результат в формате text/blocks или None, если регионов меньше двух
+    """
+    regions = detect_text_regions(image)
+    if len(regions) < 2:
+        return None
+    
+    logger.info(f"Параллельное распознавание {len(regions)} регионов")
+    pool = executor or region_executor
+    futures = [pool.submit(recognize_region, image, region, config, lang) for region in regions]
+    # Порядок futures совпадает с порядком чтения регионов
+    results = [future.result() for future in futures]
+    
+    return {
+        "text": "\n\n".join(result["text"] for result in results if result["text"]),
+        "blocks": [block for result in results for block in result["blocks"]],
+        "regions": len(regions)
+    }
+
+
+def get_tessdata_languages(tessdata_dir: Optional[str]) -> List[str]:
+    """Список языковых моделей в каталоге tessdata (None - каталог по умолчанию)"""
+    config = f'--tessdata-dir "{tessdata_dir}"' if tessdata_dir else ''
+    return pytesseract.get_languages(config=config)
+
+
+def detect_script(image: Image.Image) -> Optional[str]:
+    """
+    Быстрое определение письменности страницы (кириллица/латиница) через OSD Tesseract
+    
+    Returns:
+        Название письменности ("Cyrillic", "Latin", ...) или None, если определить не удалось
+    """
+    try:
+        osd = pytesseract.image_to_osd(image, config='--psm 0', output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        # OSD требует достаточно текста на странице и модели osd
+        logger.info(f"Не удалось определить письменность: {e}")
+        return None
+    
+    if float(osd.get("script_conf", 0)) < SCRIPT_MIN_CONFIDENCE:
+        return None
+    return osd.get("script")
+
+
+def build_recognizer_config(image: Image.Image, recognizer: str) -> Tuple[str, str]:
+    """
+    Конфигурация Tesseract для профиля распознавания
+    
+    Args:
+        image: Предобработанное изображение (для определения письменности)
+        recognizer: Профиль распознавания ("best", "fast", "single-language")
+        
+    Returns:
+        Строка конфигурации Tesseract и языки распознавания
+    """
+    settings = RECOGNIZER_PROFILES[recognizer]
+    tessdata_dir = settings["tessdata_dir"]
+    if tessdata_dir and not os.path.isdir(tessdata_dir):
+        logger.debug(f"Каталог {tessdata_dir} не найден, используются модели по умолчанию")
+        tessdata_dir = None
+    
+    lang = 'rus+eng'
+    if settings["detect_script"]:
+        script = detect_script(image)
+        # Загружаем только нужную языковую модель вместо двух
+        lang = SCRIPT_LANGUAGES.get(script, lang)
+        logger.info(f"Письменность: {script or 'не определена'}, языки: {lang}")
+    
+    config = f'--oem {settings["oem"]} --psm 6'
+    if tessdata_dir:
+        config += f' --tessdata-dir "{tessdata_dir}"'
+    return config, lang
+
+
 def initialize_tesseract():
     """Проверка инициализации Tesseract"""
     try:
@@ -227,6 +608,14 @@ def initialize_tesseract():
             logger.warning("Русский язык (rus) не найден в Tesseract")
             return False
         
+        if os.path.isdir(TESSDATA_FAST_DIR):
+            logger.info(f"Быстрые модели ({TESSDATA_FAST_DIR}): {get_tessdata_languages(TESSDATA_FAST_DIR)}")
+        else:
+            logger.warning(f"Каталог быстрых моделей {TESSDATA_FAST_DIR} не найден, профиль fast использует модели по умолчанию")
+        
+        if 'osd' not in languages:
+            logger.warning("Модель osd не найдена: профиль single-language будет распознавать rus+eng")
+        
         logger.info("Tesseract успешно инициализирован для русского языка")
         return True
         
@@ -266,7 +655,9 @@ async def health_check():
             "ocr_ready": True,
             "tesseract_version": str(version),
             "russian_support": 'rus' in languages,
-            "available_languages": languages
+            "available_languages": languages,
+            "fast_models": os.path.isdir(TESSDATA_FAST_DIR),
+            "script_detection": 'osd' in languages
         }
     except Exception as e:
         return {
@@ -275,13 +666,359 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики сервиса: распределение профилей предобработки и распознавания, среднее время"""
+    with metrics_lock:
+        summary = {
+            group: {
+                name: {
+                    "count": data["count"],
+                    "avg_seconds": round(data["total_seconds"] / data["count"], 3) if data["count"] else 0.0
+                }
+                for name, data in ocr_metrics[group].items()
+            }
+            for group in ("profiles", "recognizers")
+        }
+        return {
+            "requests_total": ocr_metrics["requests_total"],
+            **summary
+        }
+
+def recognize_full_page(processed_image: Image.Image, config: str, lang: str) -> Dict[str, Any]:
+    """
+    Распознавание страницы целиком одним процессом Tesseract
+    
+    Returns:
+        Словарь с распознанным текстом и блоками
+    """
+    # Получаем текст
+    extracted_text = pytesseract.image_to_string(
+        processed_image, 
+        config=config,
+        lang=lang
+    ).strip()
+    
+    # Получаем детальную информацию о распознанных блоках
+    try:
+        data = pytesseract.image_to_data(
+            processed_image, 
+            config=config,
+            lang=lang,
+            output_type=pytesseract.Output.DICT
+        )
+        
+        # Обрабатываем результаты
+        text_blocks = []
+        for i in range(len(data['text'])):
+            if int(data['conf'][i]) > 30:  # Фильтруем по уверенности > 30%
+                text = data['text'][i].strip()
+                if text:  # Игнорируем пустые строки
+                    text_blocks.append({
+                        "text": text,
+                        "confidence": float(data['conf'][i]) / 100.0,  # Нормализуем 0-1
+                        "coordinates": {
+                            "x": int(data['left'][i]),
+                            "y": int(data['top'][i]),
+                            "width": int(data['width'][i]),
+                            "height": int(data['height'][i])
+                        }
+                    })
+        
+    except Exception as detail_error:
+        logger.warning(f"Не удалось получить детальную информацию: {detail_error}")
+        text_blocks = []
+    
+    # Если основной текст пустой, пробуем альтернативную конфигурацию
+    if not extracted_text and len(text_blocks) == 0:
+        logger.info("Пробуем альтернативную конфигурацию OCR...")
+        alternative_config = config.replace('--psm 6', '--psm 3')
+        extracted_text = pytesseract.image_to_string(
+            processed_image,
+            config=alternative_config,
+            lang=lang
+        ).strip()
+    
+    return {
+        "text": extracted_text,
+        "blocks": text_blocks
+    }
+
+def recognize_image(image: Image.Image, profile: str = "auto", parallel_regions: Optional[bool] = None,
+                    recognizer: str = DEFAULT_RECOGNIZER_PROFILE) -> Dict[str, Any]:
+    """
+    Полный цикл распознавания одного изображения: анализ качества, предобработка, OCR
+    
+    Крупные страницы разбиваются на текстовые регионы, которые распознаются параллельно.
+    
+    Args:
+        image: Исходное изображение
+        profile: Профиль предобработки ("auto", "fast", "standard", "heavy")
+        parallel_regions: Распознавание по регионам (None - по настройке сервиса и размеру страницы)
+        recognizer: Профиль распознавания ("best", "fast", "single-language")
+        
+    Returns:
+        Словарь с распознанным текстом, блоками и выбранным профилем
+    """
+    start_time = time.perf_counter()
+    
+    # Выбираем профиль предобработки по качеству изображения
+    quality = analyze_image_quality(image)
+    if profile == "auto":
+        profile = select_preprocessing_profile(quality)
+    logger.info(f"Профиль предобработки: {profile}, оценка качества: {quality}")
+    
+    # Предварительная обработка изображения
+    processed_image = preprocess_image(image, profile)
+    
+    # Выполняем OCR с получением детальной информации
+    logger.info("Выполняем распознавание текста с помощью Tesseract...")
+    
+    # Конфигурация Tesseract для выбранного профиля распознавания
+    custom_config, lang = build_recognizer_config(processed_image, recognizer)
+    
+    if parallel_regions is None:
+        parallel_regions = (
+            PARALLEL_REGIONS_ENABLED
+            and processed_image.width * processed_image.height >= REGION_MIN_PIXELS
+        )
+    
+    result = None
+    if parallel_regions:
+        result = recognize_regions_parallel(processed_image, custom_config, lang)
+    if result is None:
+        result = recognize_full_page(processed_image, custom_config, lang)
+    
+    logger.info(f"Распознано текстовых блоков: {len(result['blocks'])}")
+    
+    record_recognition_metrics(profile, recognizer, time.perf_counter() - start_time)
+    
+    return {
+        "text": result["text"],
+        "blocks": result["blocks"],
+        "regions": result.get("regions", 1),
+        "preprocessing_profile": profile,
+        "recognizer": recognizer,
+        "languages": lang,
+        "quality": quality
+    }
+
+class ImageTooLargeError(ValueError):
+    """Изображение превышает допустимые размеры для декодирования"""
+
+
+def decode_image(image_data: bytes, max_side: int = MAX_DECODE_SIDE) -> Image.Image:
+    """
+    Декодирование изображения с ограничением памяти
+    
+    Размеры читаются из заголовка до декодирования пикселей: слишком большие
+    изображения (в том числе decompression bomb) отклоняются сразу. JPEG декодируется
+    в draft-режиме с уменьшением в 2/4/8 раз прямо в декодере, поэтому полный
+    кадр в память не попадает. Остальные форматы уменьшаются после декодирования.
+    
+    Args:
+        image_data: Байты файла изображения
+        max_side: Максимальная сторона изображения, достаточная для OCR
+        
+    Returns:
+        Декодированное изображение не больше max_side по большей стороне
+    """
+    if len(image_data) > MAX_UPLOAD_BYTES:
+        raise ImageTooLargeError(f"Файл слишком большой: {len(image_data)} байт (максимум {MAX_UPLOAD_BYTES})")
+    
+    # Image.open читает только заголовок
+    try:
+        image = Image.open(io.BytesIO(image_data))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"Изображение слишком большое: {e}")
+    width, height = image.size
+    pixels = width * height
+    estimated_bytes = pixels * len(image.getbands())
+    logger.info(f"Заголовок изображения: {image.format} {width}x{height} {image.mode}, "
+                f"~{estimated_bytes / 1024 / 1024:.0f} МБ при полном декодировании")
+    
+    if pixels > MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(f"Изображение слишком большое: {width}x{height} (максимум {MAX_IMAGE_PIXELS} пикселей)")
+    
+    scale = max_side / max(width, height)
+    if scale < 1:
+        target_size = (max(int(width * scale), 1), max(int(height * scale), 1))
+        if image.format == "JPEG":
+            # Декодер JPEG масштабирует DCT-блоки, результат не меньше target_size
+            image.draft(image.mode, target_size)
+        image.load()
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.Resampling.BICUBIC, reducing_gap=2.0)
+        logger.info(f"Изображение уменьшено при декодировании: {width}x{height} -> {image.size[0]}x{image.size[1]}")
+    else:
+        image.load()
+    
+    return image
+
+
+def validate_profiles(profile: str, recognizer: str):
+    """Проверка названий профилей предобработки и распознавания из запроса"""
+    if profile != "auto" and profile not in PREPROCESSING_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный профиль предобработки: {profile}")
+    if recognizer not in RECOGNIZER_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный профиль распознавания: {recognizer}")
+
+
+def recognize_image_bytes(image_data: bytes, profile: str = "auto",
+                          recognizer: str = DEFAULT_RECOGNIZER_PROFILE) -> Dict[str, Any]:
+    """Декодирование изображения и распознавание текста (выполняется в пуле потоков)"""
+    image = decode_image(image_data)
+    return recognize_image(image, profile, recognizer=recognizer)
+
+class DocumentRasterizer:
+    """
+    Ленивая растеризация страниц многостраничного документа (PDF или TIFF)
+    
+    Страница растеризуется только при запросе, поэтому в памяти одновременно
+    находятся лишь страницы, которые сейчас распознаются. PDFium и кадры TIFF
+    не потокобезопасны, поэтому растеризация выполняется под блокировкой.
+    Одностраничные изображения (JPEG, PNG) декодируются через decode_image -
+    с теми же проверками размеров и draft-режимом JPEG, что и в /ocr/extract_text.
+    """
+    
+    def __init__(self, data: bytes, max_side: int = MAX_DECODE_SIDE, dpi: int = DOCUMENT_DPI):
+        self.max_side = max_side
+        self.dpi = dpi
+        self.lock = threading.Lock()
+        self.pdf = None
+        self.image = None
+        self.data = None
+        self.closed = False
+        
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise ImageTooLargeError(f"Файл слишком большой: {len(data)} байт (максимум {MAX_UPLOAD_BYTES})")
+        
+        if data[:5] == b"%PDF-":
+            self.pdf = pdfium.PdfDocument(data)
+            self.page_count = len(self.pdf)
+        else:
+            # Image.open читает только заголовок, кадры TIFF декодируются при seek
+            try:
+                self.image = Image.open(io.BytesIO(data))
+            except Image.DecompressionBombError as e:
+                raise ImageTooLargeError(f"Изображение слишком большое: {e}")
+            self.page_count = getattr(self.image, "n_frames", 1)
+            if self.page_count == 1:
+                self.image.close()
+                self.image = None
+                self.data = data
+        
+        if self.page_count > MAX_DOCUMENT_PAGES:
+            raise ImageTooLargeError(f"Слишком много страниц: {self.page_count} (максимум {MAX_DOCUMENT_PAGES})")
+    
+    def render(self, index: int) -> Image.Image:
+        """Растеризация одной страницы не больше max_side по большей стороне"""
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Документ уже закрыт")
+            if self.pdf is not None:
+                page = self.pdf[index]
+                try:
+                    width, height = page.get_size()  # В пунктах (1/72 дюйма)
+                    scale = min(self.dpi / 72, self.max_side / max(width, height))
+                    return page.render(scale=scale, grayscale=True).to_pil()
+                finally:
+                    page.close()
+            if self.data is not None:
+                return decode_image(self.data, self.max_side)
+            
+            self.image.seek(index)
+            width, height = self.image.size
+            if width * height > MAX_IMAGE_PIXELS:
+                raise ImageTooLargeError(f"Страница {index + 1} слишком большая: {width}x{height}")
+            frame = self.image.copy()
+        
+        if max(frame.size) > self.max_side:
+            frame.thumbnail((self.max_side, self.max_side), Image.Resampling.BICUBIC, reducing_gap=2.0)
+        return frame
+    
+    def close(self):
+        """Освобождение ресурсов документа (дожидается текущей растеризации)"""
+        with self.lock:
+            self.closed = True
+            if self.pdf is not None:
+                self.pdf.close()
+            if self.image is not None:
+                self.image.close()
+            self.data = None
+
+
+def recognize_document_page(rasterizer: DocumentRasterizer, index: int, profile: str,
+                            recognizer: str = DEFAULT_RECOGNIZER_PROFILE) -> Dict[str, Any]:
+    """Растеризация и распознавание одной страницы документа (выполняется в пуле потоков)"""
+    page_image = rasterizer.render(index)
+    try:
+        return recognize_image(page_image, profile, recognizer=recognizer)
+    finally:
+        page_image.close()
+
+
+async def iter_document_pages(rasterizer: DocumentRasterizer, profile: str = "auto",
+                              recognizer: str = DEFAULT_RECOGNIZER_PROFILE):
+    """
+    Асинхронный генератор результатов распознавания страниц по мере готовности
+    
+    Одновременно обрабатывается не больше DOCUMENT_PAGE_WORKERS страниц, что
+    ограничивает память; результаты выдаются в порядке завершения, а не номеров.
+    """
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(DOCUMENT_PAGE_WORKERS)
+    results: asyncio.Queue = asyncio.Queue()
+    
+    async def process_page(index: int):
+        try:
+            result = await loop.run_in_executor(
+                image_executor, recognize_document_page, rasterizer, index, profile, recognizer
+            )
+            await results.put({
+                "type": "page",
+                "page": index + 1,
+                "success": True,
+                "text": result["text"],
+                "blocks": result["blocks"],
+                "total_blocks": len(result["blocks"]),
+                "preprocessing_profile": result["preprocessing_profile"],
+                "recognizer": result["recognizer"],
+                "languages": result["languages"]
+            })
+        except Exception as e:
+            logger.error(f"Ошибка при обработке страницы {index + 1}: {e}")
+            await results.put({"type": "page", "page": index + 1, "success": False, "error": str(e)})
+        finally:
+            semaphore.release()
+    
+    async def schedule_pages():
+        for index in range(rasterizer.page_count):
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(process_page(index)))
+    
+    tasks: List[asyncio.Task] = []
+    scheduler = asyncio.create_task(schedule_pages())
+    try:
+        for _ in range(rasterizer.page_count):
+            yield await results.get()
+    finally:
+        # Клиент мог отключиться: отменяем еще не начатые страницы
+        scheduler.cancel()
+        for task in tasks:
+            task.cancel()
+
+
 @app.post("/ocr/extract_text")
-async def extract_text_from_image(file: UploadFile = File(...)):
+async def extract_text_from_image(file: UploadFile = File(...), profile: str = DEFAULT_PREPROCESSING_PROFILE,
+                                  recognizer: str = DEFAULT_RECOGNIZER_PROFILE):
     """
     Извлечение текста из изображения с детальной информацией
     
     Args:
         file: Загруженный файл изображения
+        profile: Профиль предобработки ("auto", "fast", "standard", "heavy")
+        recognizer: Профиль распознавания ("best", "fast", "single-language")
         
     Returns:
         JSON с распознанным текстом и дополнительной информацией
@@ -290,102 +1027,163 @@ async def extract_text_from_image(file: UploadFile = File(...)):
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="Файл должен быть изображением")
     
+    validate_profiles(profile, recognizer)
+    
     try:
         # Читаем файл изображения
         image_data = await file.read()
         
-        # Конвертируем в PIL Image
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Предварительная обработка изображения
-        processed_image = preprocess_image(image)
-        
-        # Выполняем OCR с получением детальной информации
-        logger.info("Выполняем распознавание текста с помощью Tesseract...")
-        
-        # Конфигурация Tesseract для русского языка
-        custom_config = r'--oem 3 --psm 6 -l rus+eng'
-        
-        # Получаем текст
-        extracted_text = pytesseract.image_to_string(
-            processed_image, 
-            config=custom_config,
-            lang='rus+eng'
-        ).strip()
-        
-        # Получаем детальную информацию о распознанных блоках
-        try:
-            data = pytesseract.image_to_data(
-                processed_image, 
-                config=custom_config,
-                lang='rus+eng',
-                output_type=pytesseract.Output.DICT
-            )
-            
-            # Обрабатываем результаты
-            text_blocks = []
-            for i in range(len(data['text'])):
-                if int(data['conf'][i]) > 30:  # Фильтруем по уверенности > 30%
-                    text = data['text'][i].strip()
-                    if text:  # Игнорируем пустые строки
-                        text_blocks.append({
-                            "text": text,
-                            "confidence": float(data['conf'][i]) / 100.0,  # Нормализуем 0-1
-                            "coordinates": {
-                                "x": int(data['left'][i]),
-                                "y": int(data['top'][i]),
-                                "width": int(data['width'][i]),
-                                "height": int(data['height'][i])
-                            }
-                        })
-            
-        except Exception as detail_error:
-            logger.warning(f"Не удалось получить детальную информацию: {detail_error}")
-            text_blocks = []
-        
-        logger.info(f"Распознано текстовых блоков: {len(text_blocks)}")
-        
-        # Если основной текст пустой, пробуем альтернативную конфигурацию
-        if not extracted_text and len(text_blocks) == 0:
-            logger.info("Пробуем альтернативную конфигурацию OCR...")
-            alternative_config = r'--oem 3 --psm 3 -l rus+eng'
-            extracted_text = pytesseract.image_to_string(
-                processed_image,
-                config=alternative_config,
-                lang='rus+eng'
-            ).strip()
+        # Декодирование и OCR выполняются в пуле, не блокируя цикл событий
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(image_executor, recognize_image_bytes, image_data, profile, recognizer)
         
         return {
             "success": True,
-            "text": extracted_text,
-            "blocks": text_blocks,
-            "total_blocks": len(text_blocks),
+            "text": result["text"],
+            "blocks": result["blocks"],
+            "total_blocks": len(result["blocks"]),
+            "total_regions": result["regions"],
+            "preprocessing_profile": result["preprocessing_profile"],
+            "recognizer": result["recognizer"],
+            "languages": result["languages"],
+            "quality": result["quality"],
             "engine": "Tesseract OCR"
         }
         
+    except ImageTooLargeError as e:
+        logger.warning(f"Изображение отклонено: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Ошибка при обработке изображения: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка OCR: {str(e)}")
 
 @app.post("/ocr/extract_text_simple")
-async def extract_text_simple(file: UploadFile = File(...)):
+async def extract_text_simple(file: UploadFile = File(...), profile: str = DEFAULT_PREPROCESSING_PROFILE,
+                              recognizer: str = DEFAULT_RECOGNIZER_PROFILE):
     """
     Упрощенное извлечение текста из изображения (только текст)
     
     Args:
         file: Загруженный файл изображения
+        profile: Профиль предобработки ("auto", "fast", "standard", "heavy")
+        recognizer: Профиль распознавания ("best", "fast", "single-language")
         
     Returns:
         JSON с распознанным текстом
     """
-    result = await extract_text_from_image(file)
+    result = await extract_text_from_image(file, profile, recognizer)
     
     return {
         "success": result["success"],
         "text": result["text"],
+        "preprocessing_profile": result["preprocessing_profile"],
+        "recognizer": result["recognizer"],
+        "engine": "Tesseract OCR"
+    }
+
+@app.post("/ocr/extract_text_batch")
+async def extract_text_batch(files: List[UploadFile] = File(...), profile: str = DEFAULT_PREPROCESSING_PROFILE,
+                             recognizer: str = DEFAULT_RECOGNIZER_PROFILE):
+    """
+    Пакетное извлечение текста из нескольких изображений (например, альбома Telegram)
+    
+    Изображения распознаются параллельно, ошибка одного изображения не прерывает пакет.
+    
+    Args:
+        files: Загруженные файлы изображений
+        profile: Профиль предобработки ("auto", "fast", "standard", "heavy")
+        recognizer: Профиль распознавания ("best", "fast", "single-language")
+        
+    Returns:
+        JSON с результатами в порядке загрузки файлов
+    """
+    if len(files) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Слишком много изображений: максимум {MAX_BATCH_SIZE}")
+    
+    validate_profiles(profile, recognizer)
+    
+    logger.info(f"Пакетное распознавание {len(files)} изображений")
+    loop = asyncio.get_event_loop()
+    
+    async def process_file(index: int, file: UploadFile) -> Dict[str, Any]:
+        if not file.content_type or not file.content_type.startswith('image/'):
+            return {"index": index, "filename": file.filename, "success": False, "error": "Файл должен быть изображением"}
+        try:
+            image_data = await file.read()
+            result = await loop.run_in_executor(image_executor, recognize_image_bytes, image_data, profile, recognizer)
+            return {
+                "index": index,
+                "filename": file.filename,
+                "success": True,
+                "text": result["text"],
+                "blocks": result["blocks"],
+                "total_blocks": len(result["blocks"]),
+                "preprocessing_profile": result["preprocessing_profile"],
+                "recognizer": result["recognizer"],
+                "languages": result["languages"]
+            }
+        except Exception as e:
+            logger.error(f"Ошибка при обработке изображения {file.filename}: {e}")
+            return {"index": index, "filename": file.filename, "success": False, "error": str(e)}
+    
+    results = await asyncio.gather(*(process_file(i, file) for i, file in enumerate(files)))
+    
+    return {
+        "success": any(result["success"] for result in results),
+        "results": results,
+        "total_images": len(results),
         "engine": "Tesseract OCR"
     }
 
+@app.post("/ocr/extract_document")
+async def extract_text_from_document(file: UploadFile = File(...), profile: str = DEFAULT_PREPROCESSING_PROFILE,
+                                     recognizer: str = DEFAULT_RECOGNIZER_PROFILE):
+    """
+    Потоковое распознавание многостраничного документа (PDF, TIFF или одиночное изображение)
+    
+    Ответ в формате NDJSON: первая строка описывает документ, далее по строке
+    на каждую страницу в порядке готовности, последняя строка - итог.
+    
+    Args:
+        file: Загруженный файл документа
+        profile: Профиль предобработки ("auto", "fast", "standard", "heavy")
+        recognizer: Профиль распознавания ("best", "fast", "single-language")
+        
+    Returns:
+        Поток NDJSON с результатами по страницам
+    """
+    validate_profiles(profile, recognizer)
+    
+    data = await file.read()
+    loop = asyncio.get_event_loop()
+    try:
+        rasterizer = await loop.run_in_executor(image_executor, DocumentRasterizer, data)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"Не удалось открыть документ {file.filename}: {e}")
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемый или поврежденный документ: {str(e)}")
+    
+    logger.info(f"Потоковое распознавание документа {file.filename}: {rasterizer.page_count} стр.")
+    
+    async def stream_pages():
+        start_time = time.perf_counter()
+        pages_done = 0
+        try:
+            yield json.dumps({"type": "document", "pages": rasterizer.page_count}, ensure_ascii=False) + "\n"
+            async for page_result in iter_document_pages(rasterizer, profile, recognizer):
+                pages_done += 1
+                yield json.dumps(page_result, ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "type": "done",
+                "pages": pages_done,
+                "elapsed": round(time.perf_counter() - start_time, 3)
+            }, ensure_ascii=False) + "\n"
+        finally:
+            rasterizer.close()
+    
+    return StreamingResponse(stream_pages(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     # Запуск сервера
     uvicorn.run(
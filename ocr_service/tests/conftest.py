@@ -0,0 +1,99 @@
+"""
+Общие настройки тестов OCR сервиса
+
+Запуск из каталога сервиса (нужны зависимости из requirements.txt и pytest):
+    python -m pytest tests
+
+Бинарный tesseract не нужен: вызовы pytesseract подменяет FakeTesseract.
+"""
+
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("cv2")
+pytest.importorskip("pytesseract")
+pytest.importorskip("pypdfium2")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+
+class FakeTesseract:
+    """Ответы pytesseract без процесса tesseract: текст - размер распознаваемого изображения"""
+
+    def __init__(self, script: str = "Cyrillic", script_conf: float = 5.0):
+        self.script = script
+        self.script_conf = script_conf
+        self.calls = []
+
+    def image_to_string(self, image, config: str = "", lang: str = "", **kwargs) -> str:
+        self.calls.append(("image_to_string", image.size, config, lang))
+        return f"текст {image.width}x{image.height}"
+
+    def image_to_data(self, image, config: str = "", lang: str = "", output_type=None, **kwargs) -> dict:
+        self.calls.append(("image_to_data", image.size, config, lang))
+        return {
+            "text": ["", f"текст {image.width}x{image.height}"],
+            "conf": ["-1", "90"],
+            "block_num": [0, 1], "par_num": [0, 1], "line_num": [0, 1],
+            "left": [0, 1], "top": [0, 2], "width": [image.width, 10], "height": [image.height, 5],
+        }
+
+    def image_to_osd(self, image, config: str = "", output_type=None, **kwargs) -> dict:
+        self.calls.append(("image_to_osd", image.size, config, None))
+        return {"script": self.script, "script_conf": self.script_conf}
+
+    def get_languages(self, config: str = "") -> list:
+        return ["eng", "osd", "rus"]
+
+    def get_tesseract_version(self) -> str:
+        return "5.3.0"
+
+
+@pytest.fixture
+def tesseract(monkeypatch):
+    """FakeTesseract вместо функций pytesseract"""
+    fake = FakeTesseract()
+    for name in ("image_to_string", "image_to_data", "image_to_osd", "get_languages", "get_tesseract_version"):
+        monkeypatch.setattr(main.pytesseract, name, getattr(fake, name))
+    return fake
+
+
+def text_page(width: int = 800, height: int = 600, lines: int = 6, mode: str = "RGB") -> Image.Image:
+    """Страница с темными строками "текста" на белом фоне"""
+    image = Image.new(mode, (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    step = height // (lines + 1)
+    for line in range(1, lines + 1):
+        top = line * step
+        draw.rectangle((width // 10, top, width * 9 // 10, top + max(step // 4, 2)), fill="black")
+    return image
+
+
+def photo_page(width: int = 800, height: int = 600, noise: float = 3.0, seed: int = 0) -> Image.Image:
+    """Фото страницы: строки текста на неравномерно освещенном фоне с шумом сенсора"""
+    rng = np.random.default_rng(seed)
+    text = np.asarray(text_page(width, height)).astype(np.float64)
+    background = np.linspace(150, 255, width)[None, :, None] * np.ones((height, width, 3))
+    pixels = np.where(text < 128, 30, background) + rng.normal(0, noise, (height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def encode(image: Image.Image, image_format: str = "PNG", **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+async def post(path: str, **kwargs):
+    """Запрос к приложению сервиса без запуска сервера (startup с проверкой tesseract не выполняется)"""
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(path, **kwargs)
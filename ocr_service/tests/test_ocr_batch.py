@@ -0,0 +1,47 @@
+"""Пакетное распознавание альбома: POST /ocr/extract_text_batch"""
+
+import asyncio
+
+from conftest import encode, post, text_page
+import main
+
+
+def test_batch_results_in_upload_order(tesseract):
+    files = [
+        ("files", ("first.png", encode(text_page(640, 480)), "image/png")),
+        ("files", ("notes.txt", b"not an image", "text/plain")),
+        ("files", ("second.jpg", encode(text_page(480, 640), "JPEG"), "image/jpeg")),
+    ]
+
+    response = asyncio.run(post("/ocr/extract_text_batch", params={"profile": "fast"}, files=files))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True and body["total_images"] == 3
+    first, text_file, second = body["results"]
+    assert [result["index"] for result in body["results"]] == [0, 1, 2]
+    assert first["success"] and first["filename"] == "first.png"
+    assert text_file == {"index": 1, "filename": "notes.txt", "success": False, "error": "Файл должен быть изображением"}
+    # Изображения распознаются независимо: у второго свой размер после предобработки
+    assert second["success"] and second["text"] != first["text"]
+
+
+def test_batch_over_limit_rejected(tesseract, monkeypatch):
+    monkeypatch.setattr(main, "MAX_BATCH_SIZE", 2)
+    files = [("files", (f"{i}.png", encode(text_page(64, 64)), "image/png")) for i in range(3)]
+
+    response = asyncio.run(post("/ocr/extract_text_batch", files=files))
+
+    assert response.status_code == 400
+    assert "максимум 2" in response.json()["detail"]
+    assert tesseract.calls == []
+
+
+def test_batch_fails_only_when_every_image_fails(tesseract):
+    files = [("files", ("broken.png", b"\x89PNG broken", "image/png"))]
+
+    response = asyncio.run(post("/ocr/extract_text_batch", files=files))
+
+    assert response.status_code == 200
+    assert response.json()["success"] is False
+    assert response.json()["results"][0]["success"] is False
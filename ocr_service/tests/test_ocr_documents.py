@@ -0,0 +1,109 @@
+"""Растеризация и потоковое распознавание документов (PDF, TIFF, одиночные изображения)"""
+
+import asyncio
+import json
+
+import pytest
+from PIL import JpegImagePlugin
+
+from conftest import encode, post, text_page
+import main
+
+
+def test_document_jpeg_decoded_in_draft_mode(monkeypatch):
+    drafts = []
+    original_draft = JpegImagePlugin.JpegImageFile.draft
+
+    def draft(image, mode, size):
+        drafts.append(size)
+        return original_draft(image, mode, size)
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", draft)
+    rasterizer = main.DocumentRasterizer(encode(text_page(4000, 3000), "JPEG"), max_side=1000)
+    try:
+        page = rasterizer.render(0)
+    finally:
+        rasterizer.close()
+
+    assert rasterizer.page_count == 1
+    assert drafts == [(1000, 750)]
+    assert max(page.size) <= 1000
+
+
+def test_document_image_over_pixel_limit_fails_page(monkeypatch, tesseract):
+    monkeypatch.setattr(main, "MAX_IMAGE_PIXELS", 1000 * 1000)
+    rasterizer = main.DocumentRasterizer(encode(text_page(2000, 1000), "JPEG"))
+
+    async def collect():
+        return [page async for page in main.iter_document_pages(rasterizer)]
+
+    try:
+        pages = asyncio.run(collect())
+    finally:
+        rasterizer.close()
+
+    assert len(pages) == 1
+    assert pages[0]["success"] is False
+    assert "слишком большое" in pages[0]["error"]
+    assert tesseract.calls == []
+
+
+def test_tiff_pages_rendered_lazily_and_recognized(tesseract):
+    frames = [text_page(600, 400), text_page(400, 600), text_page(500, 500)]
+    data = encode(frames[0], "TIFF", save_all=True, append_images=frames[1:])
+    rasterizer = main.DocumentRasterizer(data)
+
+    async def collect():
+        return [page async for page in main.iter_document_pages(rasterizer, profile="fast", recognizer="best")]
+
+    try:
+        pages = asyncio.run(collect())
+    finally:
+        rasterizer.close()
+
+    assert rasterizer.page_count == 3
+    assert sorted(page["page"] for page in pages) == [1, 2, 3]
+    assert all(page["success"] and page["text"].startswith("текст") for page in pages)
+    with pytest.raises(RuntimeError, match="закрыт"):
+        rasterizer.render(0)
+
+
+def pdf_document(pages: int) -> bytes:
+    frames = [text_page(595, 842, lines=page + 2) for page in range(pages)]
+    return encode(frames[0], "PDF", save_all=True, append_images=frames[1:], resolution=72)
+
+
+def test_pdf_streamed_as_ndjson(tesseract):
+    response = asyncio.run(post(
+        "/ocr/extract_document", params={"profile": "fast", "recognizer": "fast"},
+        files={"file": ("scan.pdf", pdf_document(3), "application/pdf")}
+    ))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {"type": "document", "pages": 3}
+    assert lines[-1]["type"] == "done" and lines[-1]["pages"] == 3
+    pages = lines[1:-1]
+    assert sorted(page["page"] for page in pages) == [1, 2, 3]
+    assert all(page["success"] and page["recognizer"] == "fast" for page in pages)
+
+
+def test_document_over_page_limit_rejected(tesseract, monkeypatch):
+    monkeypatch.setattr(main, "MAX_DOCUMENT_PAGES", 2)
+
+    response = asyncio.run(post(
+        "/ocr/extract_document", files={"file": ("scan.pdf", pdf_document(3), "application/pdf")}
+    ))
+
+    assert response.status_code == 413
+    assert "Слишком много страниц" in response.json()["detail"]
+
+
+def test_corrupted_document_rejected(tesseract):
+    response = asyncio.run(post(
+        "/ocr/extract_document", files={"file": ("scan.pdf", b"%PDF-1.4 broken", "application/pdf")}
+    ))
+
+    assert response.status_code == 400
+    assert tesseract.calls == []
@@ -0,0 +1,103 @@
+"""Адаптивные профили предобработки по оценке качества изображения"""
+
+import asyncio
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from conftest import encode, photo_page, post, text_page
+import main
+
+
+def profile_for(image: Image.Image) -> str:
+    return main.select_preprocessing_profile(main.analyze_image_quality(image))
+
+
+def test_screenshot_gets_fast_profile():
+    quality = main.analyze_image_quality(text_page())
+
+    assert quality["is_screenshot"]
+    assert main.select_preprocessing_profile(quality) == "fast"
+
+
+def test_clean_photo_gets_standard_profile():
+    quality = main.analyze_image_quality(photo_page())
+
+    assert not quality["is_screenshot"]
+    assert main.select_preprocessing_profile(quality) == "standard"
+
+
+def test_noisy_photo_gets_heavy_profile():
+    assert profile_for(photo_page(noise=40)) == "heavy"
+
+
+def test_blurry_low_contrast_scan_gets_heavy_profile():
+    blurred = np.asarray(text_page().convert("L").filter(ImageFilter.GaussianBlur(6))).astype(np.float64)
+    faded = Image.fromarray((120 + blurred * 0.2).astype(np.uint8))
+
+    quality = main.analyze_image_quality(faded)
+
+    assert quality["contrast"] < main.CONTRAST_THRESHOLD and quality["sharpness"] < main.BLUR_THRESHOLD
+    assert main.select_preprocessing_profile(quality) == "heavy"
+
+
+def test_quality_is_analyzed_on_thumbnail_only(monkeypatch):
+    page = text_page(2000, 1000).convert("P")
+    expected = main.analyze_image_quality(page.convert("RGB"))
+    converted = []
+    convert = Image.Image.convert
+
+    def spy(self, *args, **kwargs):
+        converted.append(self.size)
+        return convert(self, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "convert", spy)
+
+    assert main.analyze_image_quality(page) == expected
+    assert converted == [(512, 256)]
+
+
+def test_fast_profile_inverts_dark_theme_and_upscales():
+    dark = Image.eval(text_page(600, 300).convert("L"), lambda value: 255 - value)
+
+    processed = main.preprocess_image(dark, "fast")
+
+    assert processed.mode == "L"
+    assert max(processed.size) == 1200
+    assert np.asarray(processed).mean() > 127
+
+
+@pytest.mark.parametrize("profile", ["standard", "heavy"])
+def test_full_profiles_binarize(profile):
+    processed = main.preprocess_image(photo_page(), profile)
+
+    assert processed.mode == "L"
+    assert set(np.unique(np.asarray(processed))) <= {0, 255}
+    assert max(processed.size) >= 1200
+
+
+def test_auto_profile_reported_in_response(tesseract):
+    requests_before = main.ocr_metrics["requests_total"]
+
+    response = asyncio.run(post(
+        "/ocr/extract_text", params={"profile": "auto"},
+        files={"file": ("screen.png", encode(text_page()), "image/png")}
+    ))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["preprocessing_profile"] == "fast"
+    assert body["quality"]["is_screenshot"] is True
+    assert main.ocr_metrics["requests_total"] == requests_before + 1
+
+
+def test_unknown_profile_rejected(tesseract):
+    response = asyncio.run(post(
+        "/ocr/extract_text", params={"profile": "ultra"},
+        files={"file": ("screen.png", encode(text_page()), "image/png")}
+    ))
+
+    assert response.status_code == 400
+    assert "ultra" in response.json()["detail"]
+    assert tesseract.calls == []
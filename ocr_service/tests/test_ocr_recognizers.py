@@ -0,0 +1,82 @@
+"""Профили распознавания Tesseract и определение письменности"""
+
+import asyncio
+
+import pytest
+
+from conftest import encode, post, text_page
+import main
+
+
+def test_best_profile_uses_default_models(tesseract):
+    config, lang = main.build_recognizer_config(text_page(), "best")
+
+    assert config == "--oem 3 --psm 6"
+    assert lang == "rus+eng"
+    assert tesseract.calls == []
+
+
+def test_fast_profile_uses_fast_models_when_installed(monkeypatch, tmp_path):
+    profiles = {**main.RECOGNIZER_PROFILES, "fast": {**main.RECOGNIZER_PROFILES["fast"], "tessdata_dir": str(tmp_path)}}
+    monkeypatch.setattr(main, "RECOGNIZER_PROFILES", profiles)
+
+    config, lang = main.build_recognizer_config(text_page(), "fast")
+
+    assert config == f'--oem 1 --psm 6 --tessdata-dir "{tmp_path}"'
+    assert lang == "rus+eng"
+
+
+def test_fast_profile_without_fast_models_falls_back(monkeypatch, tmp_path):
+    profiles = {**main.RECOGNIZER_PROFILES, "fast": {**main.RECOGNIZER_PROFILES["fast"], "tessdata_dir": str(tmp_path / "нет")}}
+    monkeypatch.setattr(main, "RECOGNIZER_PROFILES", profiles)
+
+    config, _ = main.build_recognizer_config(text_page(), "fast")
+
+    assert config == "--oem 1 --psm 6"
+
+
+@pytest.mark.parametrize("script, confidence, expected", [
+    ("Cyrillic", 5.0, "rus"),
+    ("Latin", 5.0, "eng"),
+    ("Cyrillic", 0.5, "rus+eng"),  # Низкая уверенность OSD
+    ("Arabic", 5.0, "rus+eng"),   # Письменность без своей модели
+])
+def test_single_language_profile_loads_detected_script(tesseract, script, confidence, expected):
+    tesseract.script, tesseract.script_conf = script, confidence
+
+    _, lang = main.build_recognizer_config(text_page(), "single-language")
+
+    assert lang == expected
+    assert tesseract.calls[0][0] == "image_to_osd" and tesseract.calls[0][2] == "--psm 0"
+
+
+def test_single_language_profile_survives_osd_failure(tesseract, monkeypatch):
+    def image_to_osd(image, **kwargs):
+        raise RuntimeError("Too few characters")
+
+    monkeypatch.setattr(main.pytesseract, "image_to_osd", image_to_osd)
+
+    assert main.build_recognizer_config(text_page(), "single-language")[1] == "rus+eng"
+
+
+def test_recognizer_reported_and_counted(tesseract):
+    before = main.ocr_metrics["recognizers"]["single-language"]["count"]
+
+    response = asyncio.run(post(
+        "/ocr/extract_text", params={"profile": "fast", "recognizer": "single-language"},
+        files={"file": ("page.png", encode(text_page()), "image/png")}
+    ))
+
+    body = response.json()
+    assert (body["recognizer"], body["languages"]) == ("single-language", "rus")
+    assert main.ocr_metrics["recognizers"]["single-language"]["count"] == before + 1
+
+
+def test_unknown_recognizer_rejected(tesseract):
+    response = asyncio.run(post(
+        "/ocr/extract_text_simple", params={"recognizer": "turbo"},
+        files={"file": ("page.png", encode(text_page()), "image/png")}
+    ))
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Неизвестный профиль распознавания: turbo"
@@ -0,0 +1,69 @@
+"""Параллельное распознавание крупных страниц по текстовым регионам"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+import main
+
+# Три абзаца: два колонками вверху и один на всю ширину внизу, (x0, y0, x1, y1)
+BLOCKS = [(100, 100, 900, 400), (1100, 100, 1900, 400), (100, 800, 1900, 1100)]
+
+
+def columns_page() -> Image.Image:
+    """Страница 2000x1400 с абзацами BLOCKS из строк "текста" (темные полосы)"""
+    image = Image.new("L", (2000, 1400), 255)
+    draw = ImageDraw.Draw(image)
+    for x0, y0, x1, y1 in BLOCKS:
+        # Межстрочный интервал меньше вертикальной дилатации - строки склеиваются в абзац
+        for top in range(y0, y1 - 16, 20):
+            draw.rectangle((x0, top, x1, top + 16), fill=0)
+    return image
+
+
+def test_regions_found_in_reading_order():
+    regions = main.detect_text_regions(columns_page())
+
+    assert len(regions) == 3
+    for (x, y, w, h), (x0, y0, x1, y1) in zip(regions, BLOCKS):
+        assert x <= x0 and y <= y0 and x + w >= x1 and y + h >= y1 - 20
+        assert x >= x0 - 50 and y >= y0 - 50 and x + w <= x1 + 50 and y + h <= y1 + 50
+
+
+def test_sort_regions_rows_then_columns():
+    regions = [(500, 105, 100, 50), (0, 300, 100, 50), (10, 100, 100, 60)]
+
+    assert main.sort_regions_reading_order(regions) == [
+        (10, 100, 100, 60), (500, 105, 100, 50), (0, 300, 100, 50)
+    ]
+
+
+def test_parallel_regions_offset_coordinates_to_page(tesseract):
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        result = main.recognize_regions_parallel(columns_page(), "--psm 6", "rus+eng", executor=pool)
+    regions = main.detect_text_regions(columns_page())
+
+    assert result["regions"] == 3
+    assert len(result["blocks"]) == 3
+    # Слово в регионе (FakeTesseract: left=1, top=2) переводится в координаты страницы
+    for block, (x, y, w, h) in zip(result["blocks"], regions):
+        assert block["coordinates"]["x"] == x + 1 and block["coordinates"]["y"] == y + 2
+    assert result["text"].split("\n\n") == [f"текст {w}x{h}" for _, _, w, h in regions]
+
+
+def test_single_region_falls_back_to_full_page(tesseract):
+    image = Image.new("L", (2000, 1400), 255)
+    ImageDraw.Draw(image).rectangle((100, 100, 900, 116), fill=0)
+
+    assert main.recognize_regions_parallel(image, "--psm 6", "rus+eng") is None
+
+
+def test_recognize_image_uses_regions_only_for_large_pages(tesseract, monkeypatch):
+    monkeypatch.setattr(main, "PARALLEL_REGIONS_ENABLED", True)
+
+    large = main.recognize_image(columns_page().convert("RGB"), profile="fast")
+    small = main.recognize_image(columns_page().convert("RGB").resize((500, 350)), profile="fast")
+
+    assert large["regions"] == 3
+    assert small["regions"] == 1
+    assert [call[0] for call in tesseract.calls[-2:]] == ["image_to_string", "image_to_data"]
@@ -0,0 +1,5 @@
+"""Общий код сервисов Whisper и Kandinsky"""
+
+from .job_queue import JobQueue, QueueFullError
+
+__all__ = ["JobQueue", "QueueFullError"]
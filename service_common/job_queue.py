@@ -0,0 +1,202 @@
+"""
+Ограниченная очередь фоновых задач с опросом результата (POST /jobs, GET /jobs/{id})
+
+Используется сервисами Whisper и Kandinsky. Сервисы запускаются из своих каталогов,
+поэтому main.py добавляет корень репозитория в sys.path перед импортом.
+"""
+
+import asyncio
+import functools
+import logging
+import math
+import time
+import uuid
+from collections import deque
+from typing import Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Очередь задач заполнена"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Очередь задач заполнена")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """
+    Ограниченная очередь фоновых задач с опросом результата
+    
+    Задачи выполняют workers асинхронных исполнителей; при заполненной очереди submit
+    выбрасывает QueueFullError с оценкой времени до освобождения места (для Retry-After).
+    Завершенные задачи хранятся ttl секунд. runner получает payload задачи
+    и функцию report_progress(step, total, preview), привязанную к задаче.
+    default_duration - ожидаемая длительность задачи, пока нет ни одной завершенной.
+    Запросы, которые выполняются в обход исполнителей (потоковая выдача), занимают место
+    в очереди через reserve/release и учитываются в depth и в лимите max_queued.
+    """
+
+    def __init__(self, runner, max_queued: int, workers: int, ttl: int, default_duration: float = 60.0):
+        self.runner = runner
+        self.max_queued = max_queued
+        self.workers = workers
+        self.ttl = ttl
+        self.default_duration = default_duration
+        self.jobs = {}
+        self.queue = None
+        self.tasks = []
+        self.reserved = 0  # Места, занятые запросами вне очереди
+        self.durations = deque(maxlen=50)
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queued)
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+    @property
+    def depth(self) -> int:
+        return (self.queue.qsize() if self.queue is not None else 0) + self.reserved
+
+    @property
+    def running(self) -> int:
+        return sum(1 for job in self.jobs.values() if job["status"] == "running")
+
+    def retry_after(self) -> int:
+        """Оценка времени, через которое в очереди освободится место, секунды"""
+        average = sum(self.durations) / len(self.durations) if self.durations else self.default_duration
+        # Место освобождается, когда один из исполнителей заканчивает текущую задачу
+        return max(1, math.ceil(average / self.workers))
+
+    def submit(self, payload) -> dict:
+        if self.queue is None:
+            raise RuntimeError("Очередь задач не запущена")
+        self._cleanup()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "payload": payload,
+            "result": None,
+            "error": None,
+            "step": 0,
+            "total_steps": None,
+            "preview": None,
+            "preview_step": 0,
+            "done": asyncio.Event(),
+            "changed": asyncio.Event(),
+        }
+        if self.depth >= self.max_queued:
+            raise QueueFullError(self.retry_after())
+        self.queue.put_nowait(job)
+        self.jobs[job["id"]] = job
+        return job
+
+    def reserve(self):
+        """
+        Место в очереди для запроса, выполняемого вне исполнителей
+        
+        При заполненной очереди выбрасывает QueueFullError; занятое место освобождается release.
+        """
+        if self.queue is None:
+            raise RuntimeError("Очередь задач не запущена")
+        if self.depth >= self.max_queued:
+            raise QueueFullError(self.retry_after())
+        self.reserved += 1
+
+    def release(self):
+        self.reserved -= 1
+
+    async def wait(self, job_id: str, timeout: float, after_step: Optional[int] = None):
+        """
+        Задача по id; при timeout > 0 ждет ее завершения не дольше timeout (long-poll)
+        
+        С after_step ожидание заканчивается и раньше - когда появится превью новее этого шага.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or timeout <= 0:
+            return job
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not job["done"].is_set() and (after_step is None or job["preview_step"] <= after_step):
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(job["changed"].wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return job
+
+    def report_progress(self, job: dict, step: int, total: int, preview: Optional[bytes] = None):
+        """Прогресс задачи и последнее превью; будит long-poll запросы"""
+        if job["done"].is_set():
+            return
+        job["step"] = step
+        job["total_steps"] = total
+        if preview is not None:
+            job["preview"] = preview
+            job["preview_step"] = step
+        self._notify(job)
+
+    def _notify(self, job: dict):
+        job["changed"].set()
+        job["changed"] = asyncio.Event()
+
+    def describe(self, job: dict) -> dict:
+        """Публичное описание задачи"""
+        description = {
+            "job_id": job["id"],
+            "status": job["status"],
+            "queue_depth": self.depth,
+        }
+        if job["status"] == "queued":
+            description["queue_position"] = sum(
+                1 for other in self.jobs.values()
+                if other["status"] == "queued" and other["created"] <= job["created"]
+            )
+        if job["status"] == "running" and job["total_steps"]:
+            description["step"] = job["step"]
+            description["total_steps"] = job["total_steps"]
+            description["preview_step"] = job["preview_step"]
+        if job["finished"] is not None:
+            description["processing_seconds"] = round(job["finished"] - job["started"], 2)
+        if job["error"] is not None:
+            description["error"] = job["error"]
+        return description
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            job["status"] = "running"
+            job["started"] = time.time()
+            try:
+                # Входные данные больше не нужны после запуска - освобождаем память
+                job["result"] = await self.runner(job.pop("payload"), functools.partial(self.report_progress, job))
+                job["status"] = "done"
+            except HTTPException as e:
+                job["status"] = "failed"
+                job["error"] = e.detail
+            except Exception as e:
+                logger.error(f"Ошибка при выполнении задачи {job['id']}: {e}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["finished"] = time.time()
+                self.durations.append(job["finished"] - job["started"])
+                job["preview"] = None
+                job["done"].set()
+                self._notify(job)
+
+    def _cleanup(self):
+        expired = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job["finished"] is not None and job["finished"] < expired]:
+            del self.jobs[job_id]
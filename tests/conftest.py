@@ -0,0 +1,57 @@
+"""
+Общие настройки тестов бота, клиента neuroapi и общего кода сервисов
+
+Запуск из корня репозитория: python -m pytest
+Тесты сервисов лежат в их каталогах (whisper_service/tests, kandinsky_service/tests, ocr_service/tests).
+Сервисы не запускаются: их ответы подставляет httpx.MockTransport.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py требует токены, а бот при импорте bot.py проверяет формат своего
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("NEUROAPI_API_KEY", "test")
+os.environ.setdefault("HUGGINGFACE_API_KEY", "test")
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """
+    Подмена HTTP сервисов для neuroapi: service(handler) направляет запросы
+    всех клиентов httpx, создаваемых neuroapi, в handler(request) -> httpx.Response
+    """
+    httpx = pytest.importorskip("httpx")
+    pytest.importorskip("dotenv")
+    import neuroapi
+
+    def install(handler):
+        transport = httpx.MockTransport(handler)
+        client_class = httpx.AsyncClient
+
+        def client(*args, **kwargs):
+            return client_class(*args, transport=transport, **kwargs)
+
+        monkeypatch.setattr(neuroapi.httpx, "AsyncClient", client)
+        return transport
+
+    return install
+
+
+def fake_message(user_id: int = 1, **fields) -> SimpleNamespace:
+    """Сообщение Telegram: answer возвращает сообщение с edit_text и delete"""
+    reply = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock(), answer=AsyncMock())
+    message = SimpleNamespace(
+        from_user=SimpleNamespace(id=user_id),
+        chat=SimpleNamespace(id=user_id),
+        answer=AsyncMock(return_value=reply),
+        reply=reply,
+        **fields
+    )
+    return message
@@ -0,0 +1,95 @@
+"""Альбомы фото: сбор сообщений группы и один пакетный запрос OCR"""
+
+import asyncio
+import gc
+from unittest.mock import AsyncMock
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("aiogram")
+pytest.importorskip("dotenv")
+
+import bot  # noqa: E402
+from conftest import fake_message  # noqa: E402
+
+
+@pytest.fixture
+def album(monkeypatch):
+    """Бот без задержки сбора альбома; ответ ИИ и отправка подменены"""
+    monkeypatch.setattr(bot, "MEDIA_GROUP_COLLECT_DELAY", 0.05)
+    monkeypatch.setattr(bot, "media_group_buffers", {})
+    monkeypatch.setattr(bot, "media_group_tasks", set())
+    monkeypatch.setattr(bot, "download_photo", AsyncMock(side_effect=lambda message: f"photo {message.message_id}".encode()))
+    monkeypatch.setattr(bot.neuroapi_client, "generate_response", AsyncMock(return_value="ответ"))
+    monkeypatch.setattr(bot, "send_ai_response", AsyncMock())
+    monkeypatch.setattr(bot.bot, "send_chat_action", AsyncMock())
+
+    def build(count: int):
+        # Telegram может доставить фото альбома не по порядку
+        return [fake_message(user_id=3, media_group_id="group", message_id=number) for number in reversed(range(1, count + 1))]
+    return build
+
+
+async def deliver(messages) -> None:
+    for message in messages:
+        await bot.handle_photo_message(message)
+    await asyncio.sleep(0.2)
+
+
+def test_album_recognized_with_one_batch_request(album, service):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"success": True, "results": [
+            {"index": 0, "success": True, "text": "первый"},
+            {"index": 1, "success": False, "error": "сбой"},
+            {"index": 2, "success": True, "text": "третий"},
+        ]})
+
+    service(handler)
+    messages = album(3)
+
+    asyncio.run(deliver(messages))
+
+    assert len(requests) == 1 and requests[0].url.path == "/ocr/extract_text_batch"
+    # Фото уходят в сервис в порядке альбома, ответ - одно сообщение на весь альбом
+    body = requests[0].content
+    assert body.index(b"photo 1") < body.index(b"photo 2") < body.index(b"photo 3")
+    first = min(messages, key=lambda message: message.message_id)
+    first.reply.edit_text.assert_awaited_once_with("📝 Распознанный текст:\n\nИзображение 1:\nпервый\n\nИзображение 3:\nтретий")
+    bot.neuroapi_client.generate_response.assert_awaited_once()
+    assert "альбом из 3 изображений" in bot.neuroapi_client.generate_response.await_args.args[1]
+    assert bot.media_group_buffers == {}
+
+
+def test_album_service_error_shown_once(album, service):
+    service(lambda request: httpx.Response(500, text="internal error"))
+    messages = album(2)
+
+    asyncio.run(deliver(messages))
+
+    first = min(messages, key=lambda message: message.message_id)
+    first.reply.edit_text.assert_awaited_once_with("Ошибка: OCR сервис временно недоступен.")
+    bot.neuroapi_client.generate_response.assert_not_awaited()
+
+
+def test_album_task_is_kept_until_finished(album, service):
+    service(lambda request: httpx.Response(200, json={"success": True, "results": [
+        {"index": 0, "success": True, "text": "текст"},
+    ]}))
+    message, = album(1)
+
+    async def scenario():
+        await bot.handle_photo_message(message)
+        pending = set(bot.media_group_tasks)
+        gc.collect()  # Задача не должна пропасть во время ожидания остальных фото
+        await asyncio.sleep(0.2)
+        return pending
+
+    pending = asyncio.run(scenario())
+
+    assert len(pending) == 1 and all(task.done() for task in pending)
+    assert bot.media_group_tasks == set()
+    message.reply.edit_text.assert_awaited_once_with("📝 Распознанный текст:\n\nИзображение 1:\nтекст")
@@ -0,0 +1,72 @@
+"""Документы PDF/TIFF: потоковое распознавание страниц в боте"""
+
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("aiogram")
+pytest.importorskip("dotenv")
+
+import bot  # noqa: E402
+from conftest import fake_message  # noqa: E402
+
+
+@pytest.fixture
+def document_message(monkeypatch):
+    """Сообщение с документом; скачивание, ответ ИИ и отправка подменены"""
+    monkeypatch.setattr(bot.bot, "get_file", AsyncMock(return_value=SimpleNamespace(file_path="doc")))
+    monkeypatch.setattr(bot.bot, "download_file", AsyncMock(side_effect=lambda path: io.BytesIO(b"%PDF-")))
+    monkeypatch.setattr(bot.bot, "send_chat_action", AsyncMock())
+    monkeypatch.setattr(bot.neuroapi_client, "generate_response", AsyncMock(return_value="ответ"))
+    monkeypatch.setattr(bot, "send_ai_response", AsyncMock())
+
+    def build(mime_type: str = "application/pdf"):
+        document = SimpleNamespace(file_id="file", file_name="scan.pdf", mime_type=mime_type)
+        return fake_message(user_id=5, document=document)
+    return build
+
+
+def ndjson(*events) -> str:
+    return "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+
+
+def test_pages_shown_in_page_order(document_message, service):
+    service(lambda request: httpx.Response(200, text=ndjson(
+        {"type": "document", "pages": 3},
+        {"type": "page", "page": 2, "success": True, "text": "вторая"},
+        {"type": "page", "page": 1, "success": True, "text": "первая"},
+        {"type": "page", "page": 3, "success": False, "error": "сбой"},
+        {"type": "done", "pages": 3},
+    )))
+    message = document_message()
+
+    asyncio.run(bot.handle_document_message(message))
+
+    message.reply.edit_text.assert_awaited_with(
+        "📝 Распознанный текст (3 стр.):\n\nСтраница 1:\nпервая\n\nСтраница 2:\nвторая"
+    )
+    prompt = bot.neuroapi_client.generate_response.await_args.args[1]
+    assert "документ из 3 страниц" in prompt
+
+
+def test_too_large_document_reported(document_message, service):
+    service(lambda request: httpx.Response(413, json={"detail": "Слишком много страниц: 300 (максимум 200)"}))
+    message = document_message()
+
+    asyncio.run(bot.handle_document_message(message))
+
+    message.reply.edit_text.assert_awaited_once_with("Ошибка: документ слишком большой для распознавания.")
+    bot.neuroapi_client.generate_response.assert_not_awaited()
+
+
+def test_unsupported_document_type_ignored(document_message):
+    message = document_message("application/zip")
+
+    asyncio.run(bot.handle_document_message(message))
+
+    message.answer.assert_awaited_once_with("Поддерживаются документы PDF, TIFF и изображения.")
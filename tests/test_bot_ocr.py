@@ -0,0 +1,72 @@
+"""Выбор профиля распознавания текста (/ocr) и его передача в OCR сервис"""
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("aiogram")
+pytest.importorskip("dotenv")
+
+import bot  # noqa: E402
+import neuroapi  # noqa: E402
+from conftest import fake_message  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Клиент neuroapi без выбранных пользователями профилей OCR"""
+    monkeypatch.setattr(bot.neuroapi_client, "user_ocr_recognizers", {})
+    return bot.neuroapi_client
+
+
+def select(user_id: int, data: str) -> SimpleNamespace:
+    callback = SimpleNamespace(
+        data=data,
+        from_user=SimpleNamespace(id=user_id),
+        message=SimpleNamespace(edit_text=AsyncMock()),
+        answer=AsyncMock(),
+    )
+    asyncio.run(bot.process_ocr_selection(callback))
+    return callback
+
+
+def test_selected_recognizer_used_for_photos_and_documents(client):
+    callback = select(7, "ocr_single-language")
+
+    callback.message.edit_text.assert_awaited_once()
+    assert client.get_user_ocr_recognizer(7) == "single-language"
+    assert client.get_user_ocr_recognizer(7, document=True) == "single-language"
+    # Остальные пользователи - с профилями по умолчанию
+    assert client.get_user_ocr_recognizer(8) == neuroapi.OCR_RECOGNIZER_PROFILE
+    assert client.get_user_ocr_recognizer(8, document=True) == neuroapi.OCR_DOCUMENT_RECOGNIZER_PROFILE
+
+
+def test_unknown_recognizer_rejected(client):
+    callback = select(7, "ocr_turbo")
+
+    callback.answer.assert_awaited_once_with("❌ Ошибка: профиль не найден")
+    callback.message.edit_text.assert_not_awaited()
+    assert 7 not in client.user_ocr_recognizers
+
+
+def test_photo_sent_with_user_recognizer(client, service, monkeypatch):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"success": True, "text": ""})
+
+    service(handler)
+    monkeypatch.setattr(bot, "download_photo", AsyncMock(return_value=b"jpeg"))
+    client.set_user_ocr_recognizer(1, "fast")
+    message = fake_message(user_id=1, media_group_id=None)
+
+    asyncio.run(bot.handle_photo_message(message))
+
+    assert len(requests) == 1
+    assert requests[0].url.path == "/ocr/extract_text_simple"
+    assert requests[0].url.params["recognizer"] == "fast"
+    message.reply.edit_text.assert_awaited_once_with("На изображении не найден текст для распознавания.")
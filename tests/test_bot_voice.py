@@ -0,0 +1,138 @@
+"""Обработка голосовых сообщений в боте"""
+
+import asyncio
+import io
+from collections import OrderedDict
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("httpx")
+pytest.importorskip("dotenv")
+
+import bot  # noqa: E402
+from conftest import fake_message  # noqa: E402
+
+
+@pytest.fixture
+def voice_message(monkeypatch):
+    """Голосовое сообщение, уже распознанное ранее (из кэша клиента)"""
+    def build(transcription: str):
+        monkeypatch.setattr(bot.neuroapi_client, "get_cached_transcription", lambda file_unique_id: transcription)
+        monkeypatch.setattr(bot.neuroapi_client, "generate_response", AsyncMock(return_value="ответ"))
+        monkeypatch.setattr(bot, "send_ai_response", AsyncMock())
+        monkeypatch.setattr(bot.bot, "send_chat_action", AsyncMock())
+        return fake_message(voice=SimpleNamespace(file_id="file", file_unique_id="unique", duration=3))
+    return build
+
+
+def test_recognized_text_is_html_escaped(voice_message):
+    message = voice_message("a < b & <script>")
+
+    asyncio.run(bot.handle_voice_message(message))
+
+    message.reply.edit_text.assert_awaited_once_with(
+        "<i>Распознанный текст:</i>\na &lt; b &amp; &lt;script&gt;", parse_mode="HTML"
+    )
+    bot.neuroapi_client.generate_response.assert_awaited_once_with(1, "a < b & <script>")
+
+
+def test_streaming_error_is_shown_as_is(monkeypatch):
+    async def stream_transcription(audio_data: bytes):
+        yield {"type": "error", "error": "Ошибка: сервис распознавания речи перегружен. Попробуйте через 12 с."}
+
+    monkeypatch.setattr(bot.neuroapi_client, "stream_transcription", stream_transcription)
+    processing = fake_message().reply
+
+    text = asyncio.run(bot.transcribe_voice_streaming(processing, b"ogg"))
+
+    assert text == "Ошибка: сервис распознавания речи перегружен. Попробуйте через 12 с."
+    processing.edit_text.assert_not_awaited()
+
+
+@pytest.fixture
+def voice_pipeline(monkeypatch):
+    """Пустой кэш клиента; скачивание и распознавание подменены, чтобы считать вызовы"""
+    client = bot.neuroapi_client
+    monkeypatch.setattr(client, "transcription_cache", OrderedDict())
+    monkeypatch.setattr(client, "transcription_cache_stats", {"hits": 0, "misses": 0})
+    monkeypatch.setattr(client, "generate_response", AsyncMock(return_value="ответ"))
+    monkeypatch.setattr(bot, "send_ai_response", AsyncMock())
+    monkeypatch.setattr(bot.bot, "send_chat_action", AsyncMock())
+    monkeypatch.setattr(bot.bot, "get_file", AsyncMock(return_value=SimpleNamespace(file_path="voice/file.oga")))
+    monkeypatch.setattr(bot.bot, "download_file", AsyncMock(side_effect=lambda path: io.BytesIO(b"ogg")))
+
+    def build(file_unique_id: str = "unique") -> SimpleNamespace:
+        return fake_message(voice=SimpleNamespace(file_id="file", file_unique_id=file_unique_id, duration=3))
+    return build
+
+
+def test_forwarded_voice_is_not_downloaded_again(monkeypatch, voice_pipeline):
+    monkeypatch.setattr(bot.neuroapi_client, "transcribe_audio", AsyncMock(return_value="привет"))
+
+    asyncio.run(bot.handle_voice_message(voice_pipeline()))
+    forwarded = voice_pipeline()
+    asyncio.run(bot.handle_voice_message(forwarded))
+
+    bot.bot.download_file.assert_awaited_once()
+    bot.neuroapi_client.transcribe_audio.assert_awaited_once_with(b"ogg")
+    forwarded.reply.edit_text.assert_awaited_once_with("<i>Распознанный текст:</i>\nпривет", parse_mode="HTML")
+    assert bot.neuroapi_client.transcription_cache_stats == {"hits": 1, "misses": 1}
+
+
+def test_failed_transcription_is_not_cached(monkeypatch, voice_pipeline):
+    monkeypatch.setattr(
+        bot.neuroapi_client, "transcribe_audio",
+        AsyncMock(return_value="Ошибка: сервис распознавания речи недоступен.")
+    )
+
+    message = voice_pipeline()
+    asyncio.run(bot.handle_voice_message(message))
+
+    message.reply.edit_text.assert_awaited_once_with("Ошибка: сервис распознавания речи недоступен.")
+    assert bot.neuroapi_client.get_cached_transcription("unique") is None
+    bot.neuroapi_client.generate_response.assert_not_awaited()
+
+
+def test_client_cache_evicts_least_recently_used(monkeypatch, voice_pipeline):
+    import neuroapi
+
+    monkeypatch.setattr(neuroapi, "TRANSCRIPTION_CACHE_SIZE", 2)
+    client = bot.neuroapi_client
+    client.cache_transcription("первое", "1")
+    client.cache_transcription("второе", "2")
+    assert client.get_cached_transcription("первое") == "1"  # Теперь самое свежее
+    client.cache_transcription("третье", "3")
+
+    assert list(client.transcription_cache) == ["первое", "третье"]
+
+
+def test_text_message_reply_is_voiced_in_voice_mode(monkeypatch):
+    client = bot.neuroapi_client
+    monkeypatch.setattr(client, "generate_response", AsyncMock(return_value="ответ"))
+    monkeypatch.setattr(client, "is_voice_mode_enabled", lambda user_id: True)
+    monkeypatch.setattr(client, "synthesize_speech", AsyncMock(return_value=b"ogg"))
+    monkeypatch.setattr(bot.bot, "send_chat_action", AsyncMock())
+    monkeypatch.setattr(bot.bot, "send_voice", AsyncMock())
+    message = fake_message(text="привет")
+
+    asyncio.run(bot.handle_text_message(message))
+
+    client.synthesize_speech.assert_awaited_once_with("ответ", client.get_user_voice(1))
+    bot.bot.send_voice.assert_awaited_once()
+    message.answer.assert_awaited_with("<i>Текст:</i> ответ", parse_mode="HTML")
+
+
+def test_long_text_reply_is_split(monkeypatch):
+    client = bot.neuroapi_client
+    monkeypatch.setattr(client, "generate_response", AsyncMock(return_value="а" * 5000))
+    monkeypatch.setattr(client, "is_voice_mode_enabled", lambda user_id: False)
+    monkeypatch.setattr(bot.bot, "send_chat_action", AsyncMock())
+    message = fake_message(text="привет")
+
+    asyncio.run(bot.handle_text_message(message))
+
+    message.reply.delete.assert_awaited_once()
+    assert [call.args[0] for call in message.answer.await_args_list] == ["...", "а" * 4096, "а" * 904]
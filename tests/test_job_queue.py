@@ -0,0 +1,192 @@
+"""Общая очередь фоновых задач сервисов (service_common.job_queue)"""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException  # noqa: E402
+
+from service_common import JobQueue, QueueFullError  # noqa: E402
+
+
+def run(scenario):
+    """Запуск сценария с очередью в отдельном event loop"""
+    return asyncio.run(scenario())
+
+
+def test_job_result_available_after_long_poll():
+    release = None
+
+    async def runner(payload, report_progress):
+        await release.wait()
+        return {"text": payload}
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        jobs = JobQueue(runner, max_queued=4, workers=1, ttl=60)
+        jobs.start()
+        try:
+            job = jobs.submit("привет")
+            asyncio.get_running_loop().call_later(0.1, release.set)
+            start = time.perf_counter()
+            finished = await jobs.wait(job["id"], timeout=5)
+            return jobs.describe(finished), finished["result"], time.perf_counter() - start
+        finally:
+            jobs.stop()
+
+    description, result, waited = run(scenario)
+    assert description["status"] == "done"
+    assert result == {"text": "привет"}
+    # Long-poll просыпается по завершении задачи, а не по таймауту
+    assert waited < 2
+
+
+def test_long_poll_wakes_on_new_preview():
+    async def runner(payload, report_progress):
+        await asyncio.sleep(0.1)
+        report_progress(1, 4, b"preview")
+        await asyncio.sleep(5)
+
+    async def scenario():
+        jobs = JobQueue(runner, max_queued=4, workers=1, ttl=60)
+        jobs.start()
+        try:
+            job = jobs.submit(None)
+            start = time.perf_counter()
+            current = await jobs.wait(job["id"], timeout=3, after_step=0)
+            return jobs.describe(current), current["preview"], time.perf_counter() - start
+        finally:
+            jobs.stop()
+
+    description, preview, waited = run(scenario)
+    assert description["status"] == "running"
+    assert (description["step"], description["total_steps"], description["preview_step"]) == (1, 4, 1)
+    assert preview == b"preview"
+    assert waited < 2
+
+
+def test_long_poll_returns_after_timeout():
+    async def runner(payload, report_progress):
+        await asyncio.sleep(5)
+
+    async def scenario():
+        jobs = JobQueue(runner, max_queued=4, workers=1, ttl=60)
+        jobs.start()
+        try:
+            job = jobs.submit(None)
+            start = time.perf_counter()
+            current = await jobs.wait(job["id"], timeout=0.2)
+            return current["status"], time.perf_counter() - start
+        finally:
+            jobs.stop()
+
+    status, waited = run(scenario)
+    assert status == "running"
+    assert 0.2 <= waited < 2
+
+
+def test_queue_full_raises_with_retry_after():
+    async def runner(payload, report_progress):
+        await asyncio.sleep(5)
+
+    async def scenario():
+        jobs = JobQueue(runner, max_queued=1, workers=2, ttl=60, default_duration=30.0)
+        jobs.start()
+        try:
+            for payload in (1, 2):
+                jobs.submit(payload)
+                await asyncio.sleep(0.05)  # Задача у исполнителя, очередь пуста
+            queued = jobs.submit(3)
+            with pytest.raises(QueueFullError) as error:
+                jobs.submit(4)
+            return jobs.describe(queued), error.value.retry_after, len(jobs.jobs)
+        finally:
+            jobs.stop()
+
+    description, retry_after, stored = run(scenario)
+    assert description["status"] == "queued" and description["queue_position"] == 1
+    # Без статистики - ожидаемая длительность задачи на число исполнителей
+    assert retry_after == 15
+    assert stored == 3
+
+
+def test_reserved_places_count_against_the_limit():
+    async def runner(payload, report_progress):
+        await asyncio.sleep(5)
+
+    async def scenario():
+        jobs = JobQueue(runner, max_queued=2, workers=1, ttl=60, default_duration=30.0)
+        jobs.start()
+        try:
+            jobs.reserve()
+            jobs.submit("задача")
+            depth = jobs.depth
+            with pytest.raises(QueueFullError) as job_error:
+                jobs.submit("лишняя")
+            with pytest.raises(QueueFullError):
+                jobs.reserve()
+            jobs.release()
+            jobs.reserve()  # Освободившееся место снова доступно
+            return depth, job_error.value.retry_after, jobs.depth
+        finally:
+            jobs.stop()
+
+    depth, retry_after, depth_after = run(scenario)
+    assert depth == 2 and depth_after == 2
+    assert retry_after == 30
+
+
+def test_failed_jobs_report_error():
+    async def runner(payload, report_progress):
+        if payload == "http":
+            raise HTTPException(status_code=400, detail="Пустой аудиофайл")
+        raise RuntimeError("сбой модели")
+
+    async def scenario():
+        jobs = JobQueue(runner, max_queued=4, workers=1, ttl=60)
+        jobs.start()
+        try:
+            first, second = jobs.submit("http"), jobs.submit("other")
+            await jobs.wait(second["id"], timeout=5)
+            return jobs.describe(first), jobs.describe(second)
+        finally:
+            jobs.stop()
+
+    first, second = run(scenario)
+    assert first["status"] == "failed" and first["error"] == "Пустой аудиофайл"
+    assert second["status"] == "failed" and second["error"] == "сбой модели"
+
+
+def test_finished_jobs_expire_after_ttl(monkeypatch):
+    async def runner(payload, report_progress):
+        return payload
+
+    async def scenario():
+        jobs = JobQueue(runner, max_queued=4, workers=1, ttl=60)
+        jobs.start()
+        try:
+            finished = jobs.submit("old")
+            await jobs.wait(finished["id"], timeout=5)
+            now = time.time()
+            monkeypatch.setattr(time, "time", lambda: now + 61)
+            # Устаревшие задачи удаляются при постановке новой
+            fresh = jobs.submit("new")
+            return await jobs.wait(finished["id"], timeout=0), fresh["id"] in jobs.jobs
+        finally:
+            jobs.stop()
+
+    expired, fresh_stored = run(scenario)
+    assert expired is None
+    assert fresh_stored
+
+
+def test_submit_requires_started_queue():
+    async def runner(payload, report_progress):
+        return payload
+
+    with pytest.raises(RuntimeError, match="не запущена"):
+        JobQueue(runner, max_queued=1, workers=1, ttl=60).submit(None)
@@ -0,0 +1,54 @@
+"""Распознавание речи через Whisper сервис (NeuroAPIClient)"""
+
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("dotenv")
+
+import neuroapi  # noqa: E402
+
+
+async def collect(events) -> list:
+    return [event async for event in events]
+
+
+def test_stream_transcription_yields_segments(service):
+    lines = [
+        {"type": "segment", "start": 0.0, "end": 2.0, "text": "Привет"},
+        {"type": "done", "text": "Привет"},
+    ]
+    service(lambda request: httpx.Response(
+        200, content="\n".join(json.dumps(line, ensure_ascii=False) for line in lines) + "\n"
+    ))
+
+    events = asyncio.run(collect(neuroapi.neuroapi_client.stream_transcription(b"ogg")))
+
+    assert events == lines
+
+
+@pytest.mark.parametrize("headers, detail, expected", [
+    ({}, "Модель Whisper еще не загружена. Попробуйте позже.", "еще загружается"),
+    ({"Retry-After": "12"}, "Очередь транскрибации заполнена (32 задач). Повторите позже.", "перегружен. Попробуйте через 12 с"),
+])
+def test_stream_transcription_503_message_matches_cause(service, headers, detail, expected):
+    service(lambda request: httpx.Response(503, headers=headers, json={"detail": detail}))
+
+    events = asyncio.run(collect(neuroapi.neuroapi_client.stream_transcription(b"ogg")))
+
+    assert len(events) == 1 and events[0]["type"] == "error"
+    assert expected in events[0]["error"]
+
+
+def test_transcribe_audio_reports_full_queue_after_deadline(service, monkeypatch):
+    # Очередь заполнена дольше, чем клиент готов ждать: повтора нет, ошибка - про перегрузку
+    monkeypatch.setattr(neuroapi, "JOB_MAX_WAIT", 5)
+    service(lambda request: httpx.Response(
+        503, headers={"Retry-After": "60"}, json={"detail": "Очередь транскрибации заполнена"}
+    ))
+
+    text = asyncio.run(neuroapi.neuroapi_client.transcribe_audio(b"ogg"))
+
+    assert text == "Ошибка: сервис распознавания речи перегружен. Попробуйте через 60 с."
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк Whisper сервиса на локальном наборе аудиофайлов
+
+Запускается локально рядом с main.py (нужны ffmpeg и зависимости сервиса):
+    python benchmark_whisper.py --audio-dir ./benchmark_audio
+
+Каталог содержит аудиофайлы (ogg/mp3/wav/m4a/flac) и, опционально,
+эталонные расшифровки с тем же именем и расширением .txt.
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+import whisper
+
+import main
+
+AUDIO_EXTENSIONS = (".ogg", ".oga", ".opus", ".mp3", ".wav", ".m4a", ".flac")
+SAMPLE_RATE = 16000
+
+
+def load_audio_set(audio_dir: str) -> List[Tuple[str, np.ndarray, Optional[str]]]:
+    """Загрузка аудио (float32, 16 кГц) и эталонных расшифровок из каталога"""
+    items = []
+    for name in sorted(os.listdir(audio_dir)):
+        base, extension = os.path.splitext(name)
+        if extension.lower() not in AUDIO_EXTENSIONS:
+            continue
+        reference_path = os.path.join(audio_dir, base + ".txt")
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as reference_file:
+                reference = reference_file.read().strip()
+        items.append((name, whisper.load_audio(os.path.join(audio_dir, name)), reference))
+    return items
+
+
+def read_audio_files(audio_dir: str) -> List[Tuple[str, bytes]]:
+    """Исходные байты аудиофайлов (как их присылает бот)"""
+    files = []
+    for name in sorted(os.listdir(audio_dir)):
+        if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+            with open(os.path.join(audio_dir, name), "rb") as audio_file:
+                files.append((name, audio_file.read()))
+    return files
+
+
+def decode_via_temp_file(audio_data: bytes) -> np.ndarray:
+    """Прежний путь: запись во временный файл и чтение ffmpeg по пути"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as temp_file:
+        temp_file.write(audio_data)
+        temp_file_path = temp_file.name
+    try:
+        return whisper.load_audio(temp_file_path)
+    finally:
+        os.unlink(temp_file_path)
+
+
+def normalize_words(text: str) -> List[str]:
+    """Слова без регистра и пунктуации для подсчета WER"""
+    return re.sub(r"[^\w\s]", " ", text.lower().replace("ё", "е")).split()
+
+
+def word_edit_distance(reference: List[str], hypothesis: List[str]) -> int:
+    """Расстояние Левенштейна по словам"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, reference_word in enumerate(reference, 1):
+        current = [i]
+        for j, hypothesis_word in enumerate(hypothesis, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (reference_word != hypothesis_word),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def benchmark_engines(args, audio_set):
+    """Real-time factor (время обработки / длительность аудио) для каждого движка"""
+    print("🎙️  Сравнение движков распознавания")
+    print("-" * 50)
+    total_duration = sum(len(audio) for _, audio, _ in audio_set) / SAMPLE_RATE
+    print(f"   Файлов: {len(audio_set)}, общая длительность: {total_duration:.1f} с")
+
+    for name in args.engines:
+        engine = main.create_engine(name, args.model)
+        start = time.perf_counter()
+        try:
+            engine.load(args.device)
+        except ImportError as e:
+            print(f"   {name:12s} пропущен: {e}")
+            continue
+        load_time = time.perf_counter() - start
+
+        rtfs = []
+        elapsed_total = 0.0
+        for _, audio, _ in audio_set:
+            start = time.perf_counter()
+            engine.transcribe(audio, **main.decode_options("accurate"))
+            elapsed = time.perf_counter() - start
+            elapsed_total += elapsed
+            rtfs.append(elapsed / (len(audio) / SAMPLE_RATE))
+        print(f"   {name:12s} загрузка {load_time:5.1f} с, RTF {elapsed_total / total_duration:.3f} "
+              f"(медиана {statistics.median(rtfs):.3f}, макс. {max(rtfs):.3f})")
+        del engine
+
+
+def benchmark_audio_decode(args, audio_set, repeats: int = 20):
+    """Накладные расходы на декодирование одного запроса: временный файл против декодирования в памяти"""
+    print("📥 Декодирование аудио: временный файл / ffmpeg через stdin / PyAV")
+    print("-" * 50)
+    files = read_audio_files(args.audio_dir)
+    durations = [len(audio) / SAMPLE_RATE for _, audio, _ in audio_set]
+    print(f"   Файлов: {len(files)}, средняя длительность: {statistics.mean(durations):.1f} с")
+
+    decoders = {"temp_file": decode_via_temp_file, "ffmpeg": main.decode_audio_ffmpeg}
+    if main.av is not None:
+        decoders["pyav"] = main.decode_audio_pyav
+    baseline = None
+    for name, decoder in decoders.items():
+        timings = []
+        for _ in range(repeats):
+            for _, audio_data in files:
+                start = time.perf_counter()
+                decoder(audio_data)
+                timings.append(time.perf_counter() - start)
+        mean = statistics.mean(timings)
+        baseline = baseline or mean
+        timings.sort()
+        print(f"   {name:10s} {mean * 1000:6.1f} мс/запрос (p95 {timings[int(len(timings) * 0.95)] * 1000:6.1f} мс), "
+              f"ускорение x{baseline / mean:.2f}")
+
+
+async def run_clients(audios: List[np.ndarray], concurrency: int, requests_per_client: int, handler) -> Tuple[float, List[float]]:
+    """concurrency клиентов последовательно отправляют запросы; возвращает общее время и задержки"""
+    latencies = []
+
+    async def client(offset: int):
+        for index in range(requests_per_client):
+            audio = audios[(offset + index) % len(audios)]
+            start = time.perf_counter()
+            result = await handler(audio)
+            latencies.append(time.perf_counter() - start)
+            if not result["success"]:
+                raise RuntimeError(result["error"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+def benchmark_batching(args, audio_set, requests_per_client: int = 4):
+    """Пропускная способность и p95 задержки: пул потоков против динамического батчирования"""
+    print("📦 Динамическое батчирование одновременных запросов")
+    print("-" * 50)
+    audios = [audio for _, audio, _ in audio_set if len(audio) <= main.WINDOW_SAMPLES]
+    if not audios:
+        print("   Нет клипов короче 30 секунд")
+        return
+    main.engine = main.create_engine(args.engines[0], args.model)
+    main.engine.load(args.device)
+    if not main.engine.supports_batching:
+        print(f"   Движок {main.engine.name} не поддерживает батчирование")
+        return
+
+    async def thread_pool(audio):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(main.executor, main.transcribe_sync, audio)
+
+    async def measure(concurrency: int):
+        main.batcher = main.TranscriptionBatcher()
+        rows = {}
+        for mode, handler in (("потоки", thread_pool), ("батчи", main.batcher.submit)):
+            elapsed, latencies = await run_clients(audios, concurrency, requests_per_client, handler)
+            latencies.sort()
+            rows[mode] = (len(latencies) / elapsed * 60, latencies[int(len(latencies) * 0.95)])
+        main.batcher.stop()
+        return rows, main.batcher.average_batch_size
+
+    for concurrency in (1, 2, 4, 8, 16):
+        rows, batch_size = asyncio.run(measure(concurrency))
+        line = ", ".join(f"{mode} {throughput:5.1f} запр./мин p95 {p95:5.2f} с" for mode, (throughput, p95) in rows.items())
+        print(f"   {concurrency:2d} клиентов: {line} (средний батч {batch_size:.1f})")
+
+
+def benchmark_streaming(args, audio_set):
+    """Время до первого сегмента при потоковой транскрибации против ожидания полного результата"""
+    print("⏱️  Потоковая транскрибация: время до первого текста")
+    print("-" * 50)
+    engine = main.create_engine(args.engines[0], args.model)
+    engine.load(args.device)
+    for name, audio, _ in audio_set:
+        start = time.perf_counter()
+        first_segment = None
+        segments = 0
+        for _ in engine.iter_segments(audio, **main.decode_options("accurate")):
+            segments += 1
+            if first_segment is None:
+                first_segment = time.perf_counter() - start
+        total = time.perf_counter() - start
+        first_segment = first_segment if first_segment is not None else total
+        print(f"   {name:24s} {len(audio) / SAMPLE_RATE:6.1f} с аудио: первый текст через {first_segment:5.2f} с, "
+              f"весь текст через {total:5.2f} с ({segments} сегм.)")
+
+
+def build_long_recording(audio_set, pause_seconds: float, seed: int = 0) -> np.ndarray:
+    """Длинная запись: клипы набора, разделенные паузами с фоновым шумом"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for _, audio, _ in audio_set:
+        parts.append(audio)
+        parts.append(rng.normal(0, 0.003, int(pause_seconds * SAMPLE_RATE)).astype(np.float32))
+    return np.concatenate(parts)
+
+
+def benchmark_vad(args, audio_set):
+    """Длинные записи с паузами: вся запись целиком против фрагментов речи после VAD"""
+    print("🔇 VAD: отбрасывание тишины и параллельные фрагменты")
+    print("-" * 50)
+    main.engine = main.create_engine(args.engines[0], args.model)
+    main.engine.load(args.device)
+
+    async def chunked(audio):
+        if main.engine.supports_batching:
+            main.batcher = main.TranscriptionBatcher()
+        try:
+            return await main.transcribe_long_audio(audio, main.engine, "accurate")
+        finally:
+            if main.batcher is not None:
+                main.batcher.stop()
+                main.batcher = None
+
+    for pause in (2.0, 10.0, 30.0):
+        recording = build_long_recording(audio_set, pause)
+        duration = len(recording) / SAMPLE_RATE
+        speech = sum(end - start for start, end in main.detect_speech(recording)) / SAMPLE_RATE
+
+        start = time.perf_counter()
+        main.transcribe_sync(recording)
+        baseline = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = asyncio.run(chunked(recording))
+        elapsed = time.perf_counter() - start
+        if not result["success"]:
+            raise RuntimeError(result["error"])
+        print(f"   паузы {pause:4.0f} с: запись {duration:6.1f} с, речь {speech:6.1f} с; "
+              f"целиком {baseline:6.1f} с, VAD + фрагменты {elapsed:6.1f} с (x{baseline / elapsed:.2f})")
+
+
+def benchmark_decoding_profiles(args, audio_set):
+    """Задержка и WER для каждой пары (модель, профиль декодирования)"""
+    print("🎚️  Профили декодирования и модели")
+    print("-" * 50)
+    references = [item for item in audio_set if item[2]]
+    if not references:
+        print("   ⚠️ Нет эталонных расшифровок (.txt) - WER не считается")
+    models = [args.model] + ([args.small_model] if args.small_model else [])
+
+    for model_name in models:
+        engine = main.create_engine(args.engines[0], model_name)
+        engine.load(args.device)
+        for profile in main.DECODING_PROFILES:
+            options = main.decode_options(profile)
+            latencies = []
+            errors = 0
+            reference_words = 0
+            for _, audio, reference in audio_set:
+                start = time.perf_counter()
+                result = engine.transcribe(audio, **options)
+                latencies.append(time.perf_counter() - start)
+                if reference:
+                    reference_tokens = normalize_words(reference)
+                    errors += word_edit_distance(reference_tokens, normalize_words(result["text"]))
+                    reference_words += len(reference_tokens)
+            wer = f"{errors / reference_words * 100:5.1f}%" if reference_words else "  н/д"
+            print(f"   {model_name:10s} {profile:9s} {statistics.mean(latencies) * 1000:7.0f} мс/клип "
+                  f"(p95 {sorted(latencies)[int(len(latencies) * 0.95)] * 1000:7.0f} мс), WER {wer}")
+        del engine
+
+
+def benchmark_process_workers(args, audio_set, requests_per_worker: int = 4):
+    """Масштабирование пропускной способности и память на воркер в пуле процессов"""
+    print("🧵 Пул процессов с общими весами")
+    print("-" * 50)
+    audios = [audio for _, audio, _ in audio_set if len(audio) <= main.WINDOW_SAMPLES] or [audio_set[0][1]]
+    # Пулы создаются через fork до замера в потоках: torch в родителе однопоточный (см. prepare_fork)
+    default_threads = torch.get_num_threads()
+    main.prepare_fork()
+    main.engine = main.create_engine(args.engines[0], args.model)
+    main.engine.load(args.device)
+    print(f"   Главный процесс после загрузки: {main.read_process_memory(os.getpid()).get('rss_mb')} МБ RSS")
+
+    async def run(workers: int):
+        count = max(workers, 1) * requests_per_worker
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            main.run_inference(audios[index % len(audios)], main.engine, "accurate") for index in range(count)
+        ))
+        return count / (time.perf_counter() - start) * 60
+
+    pools = []
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        if main.start_process_pool(workers) is None:
+            print("   ❌ Пул процессов не запущен (см. лог); запустите набор workers отдельно")
+            break
+        try:
+            throughput = asyncio.run(run(workers))
+            memory = main.worker_memory()
+        finally:
+            main.stop_process_pool()
+        pools.append((workers, throughput, memory))
+
+    torch.set_num_threads(default_threads)
+    baseline = asyncio.run(run(0))
+    print(f"   потоки ({main.TRANSCRIBE_WORKERS}):  {baseline:6.1f} запр./мин")
+    for workers, throughput, memory in pools:
+        rss = statistics.mean(item.get("rss_mb", 0) for item in memory)
+        pss = statistics.mean(item.get("pss_mb", 0) for item in memory)
+        print(f"   {workers:2d} воркеров: {throughput:6.1f} запр./мин (x{throughput / baseline:.2f}), "
+              f"на воркер RSS {rss:.0f} МБ, PSS {pss:.0f} МБ")
+
+
+def benchmark_cpu_mode(args, audio_set):
+    """Холодный и прогретый запрос и RTF: fp32 против int8, потоки torch по умолчанию против настроенных"""
+    print("🔥 Режим производительности CPU: квантизация, потоки, прогрев")
+    print("-" * 50)
+    audios = [audio for _, audio, _ in audio_set]
+    total_duration = sum(len(audio) for audio in audios) / SAMPLE_RATE
+    default_threads = torch.get_num_threads()
+    tuned_threads = main.TORCH_THREADS or max(1, (os.cpu_count() or 1) // main.TRANSCRIBE_WORKERS)
+    options = main.decode_options("accurate")
+
+    for precision in ("fp32", "int8"):
+        torch.set_num_threads(tuned_threads)
+        engine = main.create_engine(args.engines[0], args.model)
+        start = time.perf_counter()
+        engine.load(args.device)
+        if precision == "int8" and not engine.quantize():
+            print(f"   {precision}: квантизация не поддерживается движком {engine.name} на {args.device}")
+            continue
+        load_time = time.perf_counter() - start
+
+        # Первый запрос после загрузки - холодный, следующий на том же клипе - прогретый
+        start = time.perf_counter()
+        engine.transcribe(audios[0], **options)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        engine.transcribe(audios[0], **options)
+        warm = time.perf_counter() - start
+        print(f"   {precision}: загрузка {load_time:5.1f} с, холодный запрос {cold:6.2f} с, прогретый {warm:6.2f} с")
+
+        # Параллельные транскрибации, как в пуле потоков сервиса
+        for label, threads in (("по умолчанию", default_threads), ("настроенные", tuned_threads)):
+            torch.set_num_threads(threads)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=main.TRANSCRIBE_WORKERS) as pool:
+                list(pool.map(lambda audio: engine.transcribe(audio, **options), audios))
+            rtf = (time.perf_counter() - start) / total_duration
+            print(f"      потоки torch {label} ({threads:2d}) x {main.TRANSCRIBE_WORKERS} транскрибации: RTF {rtf:.3f}")
+        del engine
+    torch.set_num_threads(default_threads)
+
+
+BENCHMARKS = {
+    "engines": benchmark_engines,
+    "decode": benchmark_audio_decode,
+    "batching": benchmark_batching,
+    "streaming": benchmark_streaming,
+    "vad": benchmark_vad,
+    "profiles": benchmark_decoding_profiles,
+    "workers": benchmark_process_workers,
+    "cpu": benchmark_cpu_mode,
+}
+
+
+def main_cli():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description="Бенчмарк Whisper сервиса")
+    parser.add_argument("suites", nargs="*", default=list(BENCHMARKS), help=f"Набор тестов: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--audio-dir", default="benchmark_audio", help="Каталог с тестовыми аудиофайлами")
+    parser.add_argument("--engines", nargs="+", default=list(main.ENGINES), help="Движки для сравнения")
+    parser.add_argument("--model", default=main.WHISPER_MODEL, help="Размер модели Whisper")
+    parser.add_argument("--small-model", default=main.WHISPER_SMALL_MODEL or "small",
+                        help="Малая модель для сравнения профилей (пусто - не сравнивать)")
+    parser.add_argument("--device", default=main.device, help="Устройство: cpu или cuda")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.audio_dir):
+        print(f"❌ Каталог с аудио не найден: {args.audio_dir}")
+        return 1
+    audio_set = load_audio_set(args.audio_dir)
+    if not audio_set:
+        print(f"❌ В каталоге {args.audio_dir} нет аудиофайлов")
+        return 1
+
+    for suite in args.suites:
+        if suite not in BENCHMARKS:
+            print(f"❌ Неизвестный набор: {suite}")
+            return 1
+        BENCHMARKS[suite](args, audio_set)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
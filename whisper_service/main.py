@@ -1,14 +1,29 @@
 import os
-import tempfile
+import sys
+import io
+import json
+import hashlib
+import time
+from collections import OrderedDict
+import subprocess
+import threading
 import logging
+import numpy as np
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import whisper
 import torch
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import uvicorn
 
+# Общая очередь задач лежит в корне репозитория (service_common), сервис запускается из своего каталога
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service_common import JobQueue, QueueFullError  # noqa: E402
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,59 +50,564 @@ except Exception as e:
 
 logger.info(f"Финальное устройство: {device}")
 
-# Глобальная переменная для модели
-model = None
-executor = ThreadPoolExecutor(max_workers=2)
+# Настройки движка распознавания
+WHISPER_ENGINE = os.getenv("WHISPER_ENGINE", "openai")  # openai | ctranslate2
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "medium")
+# Тип вычислений CTranslate2: по умолчанию int8 на CPU и float16 на CUDA
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "")
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))  # 0 - по числу ядер
+TRANSCRIBE_WORKERS = 2
+
+# Режим производительности CPU (движок openai): динамическая int8 квантизация линейных слоев
+WHISPER_QUANTIZE = os.getenv("WHISPER_QUANTIZE", "false").lower() == "true"
+# Потоки torch: intra-op на процесс (0 - ядра делятся между потоками транскрибации) и inter-op
+TORCH_THREADS = int(os.getenv("WHISPER_TORCH_THREADS", "0"))
+TORCH_INTEROP_THREADS = int(os.getenv("WHISPER_TORCH_INTEROP_THREADS", "1"))
+# Прогревочная транскрибация при старте: /health сообщает о готовности только после нее
+WARMUP_ENABLED = os.getenv("WHISPER_WARMUP", "true").lower() == "true"
+WARMUP_SECONDS = 2
+WARMUP_TIMEOUT = 600  # Ожидание прогрева воркеров пула процессов, секунды
+
+# Кэш результатов по хэшу содержимого: LRU в памяти и (опционально) каталог на диске
+CACHE_ENABLED = os.getenv("WHISPER_CACHE", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("WHISPER_CACHE_SIZE", "1000"))
+CACHE_DIR = os.getenv("WHISPER_CACHE_DIR", "")  # Пусто - только память
+CACHE_DISK_MAX_ENTRIES = int(os.getenv("WHISPER_CACHE_DISK_SIZE", "50000"))
+
+# Асинхронные задачи: ограниченная очередь с опросом результата
+JOB_QUEUE_SIZE = int(os.getenv("WHISPER_JOB_QUEUE_SIZE", "32"))
+JOB_WORKERS = int(os.getenv("WHISPER_JOB_WORKERS", "4"))  # Задач в работе одновременно
+JOB_RESULT_TTL = int(os.getenv("WHISPER_JOB_RESULT_TTL", "600"))  # Хранение результата, секунды
+JOB_MAX_WAIT = 30.0  # Максимальное время long-poll одного запроса статуса, секунды
+
+# Пул процессов для инференса на CPU: веса загружаются один раз в главном процессе
+# и достаются воркерам через fork (copy-on-write). 0 - инференс в потоках главного процесса
+PROCESS_WORKERS = int(os.getenv("WHISPER_PROCESS_WORKERS", "0"))
+# Потоки torch на воркер (0 - ядра делятся поровну между воркерами)
+THREADS_PER_WORKER = int(os.getenv("WHISPER_THREADS_PER_WORKER", "0"))
+WHISPER_LANGUAGE = "ru"
+
+# Декодирование аудио в памяти: pyav (без запуска процесса), ffmpeg (через stdin) или auto
+AUDIO_DECODER = os.getenv("WHISPER_AUDIO_DECODER", "auto")
+SAMPLE_RATE = 16000  # Частота дискретизации, с которой работает Whisper
+WINDOW_SAMPLES = 30 * SAMPLE_RATE  # Одно окно энкодера Whisper - 30 секунд
+
+# Детектор речи (VAD): отбрасывание тишины и разбиение длинных записей по паузам
+VAD_ENABLED = os.getenv("WHISPER_VAD", "true").lower() == "true"
+VAD_FRAME_MS = 30
+VAD_THRESHOLD_DB = float(os.getenv("WHISPER_VAD_THRESHOLD_DB", "12"))  # Превышение над уровнем шума
+VAD_MIN_SILENCE_MS = int(os.getenv("WHISPER_VAD_MIN_SILENCE_MS", "700"))  # Более короткие паузы не режем
+VAD_MIN_SPEECH_MS = 150
+VAD_PADDING_MS = 200
+VAD_CHUNK_SECONDS = int(os.getenv("WHISPER_VAD_CHUNK_SECONDS", "30"))  # Максимальная длина фрагмента
+
+# Динамическое батчирование коротких запросов
+BATCHING_ENABLED = os.getenv("WHISPER_BATCHING", "true").lower() == "true"
+BATCH_WINDOW = float(os.getenv("WHISPER_BATCH_WINDOW_MS", "50")) / 1000
+MAX_BATCH_SIZE = int(os.getenv("WHISPER_MAX_BATCH_SIZE", "8"))
+
+# Профили декодирования, общие для всех движков
+DECODING_PROFILES = {
+    # Жадное декодирование: короткие реплики вроде "да, давай"
+    "fast": {
+        "temperature": 0.0,  # Детерминистичный результат
+        "beam_size": 1,
+        "best_of": 1,
+    },
+    # Beam search для лучшего качества на длинных и сложных записях
+    "accurate": {
+        "temperature": 0.0,
+        "beam_size": 5,
+        "best_of": 5,  # Выбираем лучший из 5 вариантов
+    },
+}
+DEFAULT_DECODING_PROFILE = os.getenv("WHISPER_DECODING_PROFILE", "auto")  # auto | fast | accurate
+# В режиме auto клипы не длиннее порога декодируются профилем fast
+FAST_PROFILE_MAX_SECONDS = float(os.getenv("WHISPER_FAST_PROFILE_MAX_SECONDS", "10"))
+# Дополнительная малая модель для самых коротких клипов (пусто - не загружать)
+WHISPER_SMALL_MODEL = os.getenv("WHISPER_SMALL_MODEL", "")
+SMALL_MODEL_MAX_SECONDS = float(os.getenv("WHISPER_SMALL_MODEL_MAX_SECONDS", "5"))
+
+
+class TranscriptionEngine:
+    """Базовый интерфейс движка распознавания речи
+
+    transcribe принимает путь к файлу или массив float32 16 кГц и возвращает
+    словарь с ключами text, language и segments (список start/end/text).
+    """
+
+    name = "base"
+    supports_batching = False
+    supports_process_pool = False
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.device = "cpu"
+        self.model = None
+        self.quantized = False
+
+    def load(self, device: str):
+        raise NotImplementedError
+
+    def transcribe(self, audio, **options) -> dict:
+        raise NotImplementedError
+
+    def share_memory(self):
+        """Подготовка весов к совместному использованию процессами-воркерами"""
+
+    def quantize(self) -> bool:
+        """Квантизация весов для CPU; False, если движок ее не поддерживает"""
+        return False
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        """Транскрибация нескольких клипов (не длиннее одного окна) за один проход"""
+        return [self.transcribe(audio, **options) for audio in audios]
+
+    def iter_segments(self, audio, **options):
+        """Генератор сегментов по мере декодирования (по умолчанию - после всей записи)"""
+        yield from self.transcribe(audio, **options)["segments"]
+
+
+class OpenAIWhisperEngine(TranscriptionEngine):
+    """Эталонная реализация openai-whisper на PyTorch"""
+
+    name = "openai"
+    supports_batching = True
+    supports_process_pool = True
+
+    def load(self, device: str):
+        self.model = whisper.load_model(self.model_name, device=device)
+        self.device = device
+
+    def share_memory(self):
+        # Веса в разделяемой памяти не копируются воркерами даже при записи в соседние страницы
+        self.model.share_memory()
+
+    def quantize(self) -> bool:
+        if self.device != "cpu":
+            return False
+        # quantize_dynamic заменяет только точный тип nn.Linear, а whisper использует подкласс,
+        # который на CPU в fp32 ведет себя так же - возвращаем слоям базовый класс
+        for module in self.model.modules():
+            if type(module) is whisper.model.Linear:
+                module.__class__ = torch.nn.Linear
+        self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.quantized = True
+        return True
+
+    @staticmethod
+    def _normalize_options(options: dict) -> dict:
+        # beam_size=1 в openai-whisper - это beam search с одним лучом; жадный поиск задается None
+        if options.get("beam_size") == 1:
+            options = {**options, "beam_size": None}
+        return options
+
+    def _transcribe(self, audio, **options) -> dict:
+        options = self._normalize_options(options)
+        return self.model.transcribe(
+            audio,
+            task="transcribe",
+            fp16=(self.device == "cuda" and torch.cuda.is_available()),  # fp16 только для CUDA
+            word_timestamps=False,  # Не нужны временные метки для каждого слова
+            **options
+        )
+
+    def transcribe(self, audio, **options) -> dict:
+        result = self._transcribe(audio, **options)
+        return {
+            "text": result["text"].strip(),
+            "language": result.get("language", WHISPER_LANGUAGE),
+            "segments": [
+                {"start": segment["start"], "end": segment["end"], "text": segment["text"].strip()}
+                for segment in result.get("segments", [])
+            ],
+        }
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        options = self._normalize_options(options)
+        # Один проход энкодера по сложенным мел-спектрограммам и батчевый beam search
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), self.model.dims.n_mels)
+            for audio in audios
+        ]).to(self.model.device)
+        decoding_options = whisper.DecodingOptions(
+            task="transcribe",
+            language=options.get("language"),
+            temperature=options.get("temperature", 0.0),
+            beam_size=options.get("beam_size"),  # best_of не совместим с beam_size в DecodingOptions
+            fp16=(self.device == "cuda" and torch.cuda.is_available()),
+            without_timestamps=True,
+        )
+        with torch.no_grad():
+            results = whisper.decode(self.model, mels, decoding_options)
+
+        transcriptions = []
+        for audio, result in zip(audios, results):
+            # Тот же фильтр тишины, что и в whisper.transcribe
+            silent = result.no_speech_prob > 0.6 and result.avg_logprob < -1.0
+            text = "" if silent else result.text.strip()
+            transcriptions.append({
+                "text": text,
+                "language": result.language or WHISPER_LANGUAGE,
+                "segments": [{"start": 0.0, "end": len(audio) / SAMPLE_RATE, "text": text}] if text else [],
+            })
+        return transcriptions
+
+    def iter_segments(self, audio, **options):
+        # whisper.transcribe отдает результат только целиком, поэтому идем окнами по 30 секунд
+        if isinstance(audio, str):
+            audio = whisper.load_audio(audio)
+        position = 0
+        previous_text = ""
+        while position < len(audio):
+            window = audio[position:position + WINDOW_SAMPLES]
+            last_window = position + WINDOW_SAMPLES >= len(audio)
+            result = self._transcribe(window, initial_prompt=previous_text[-200:] or None, **options)
+            segments = result.get("segments", [])
+            advance = len(window)
+            if not last_window and len(segments) > 1:
+                # Последний сегмент окна может быть обрезан границей - распознаем его заново в следующем окне
+                segments = segments[:-1]
+                advance = int(segments[-1]["end"] * SAMPLE_RATE) or advance
+
+            offset = position / SAMPLE_RATE
+            for segment in segments:
+                text = segment["text"].strip()
+                if text:
+                    yield {"start": offset + segment["start"], "end": offset + segment["end"], "text": text}
+            previous_text = " ".join(segment["text"].strip() for segment in segments) or previous_text
+            position += advance
+
+
+class CTranslate2Engine(TranscriptionEngine):
+    """faster-whisper (CTranslate2) с int8 квантизацией весов"""
+
+    name = "ctranslate2"
+
+    def load(self, device: str):
+        # Импортируем лениво: пакет нужен только при выборе этого движка
+        from faster_whisper import WhisperModel
+
+        compute_type = WHISPER_COMPUTE_TYPE or ("float16" if device == "cuda" else "int8")
+        self.model = WhisperModel(
+            self.model_name,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=WHISPER_CPU_THREADS,
+            num_workers=TRANSCRIBE_WORKERS,  # Параллельные транскрибации из пула потоков
+        )
+        self.device = device
+        logger.info(f"CTranslate2: тип вычислений {compute_type}")
+
+    def _transcribe(self, audio, **options):
+        segments, info = self.model.transcribe(audio, task="transcribe", word_timestamps=False, **options)
+        # Сегменты генерируются лениво - декодирование происходит при итерации
+        segments = (
+            {"start": segment.start, "end": segment.end, "text": segment.text.strip()}
+            for segment in segments
+        )
+        return segments, info
+
+    def transcribe(self, audio, **options) -> dict:
+        segments, info = self._transcribe(audio, **options)
+        segments = list(segments)
+        return {
+            "text": " ".join(segment["text"] for segment in segments).strip(),
+            "language": info.language or WHISPER_LANGUAGE,
+            "segments": segments,
+        }
+
+    def iter_segments(self, audio, **options):
+        segments, _ = self._transcribe(audio, **options)
+        yield from segments
+
+
+ENGINES = {
+    OpenAIWhisperEngine.name: OpenAIWhisperEngine,
+    CTranslate2Engine.name: CTranslate2Engine,
+}
+
+class AudioDecodeError(ValueError):
+    """Аудиофайл не удалось декодировать"""
+
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+def decode_audio_pyav(audio_data: bytes) -> np.ndarray:
+    """Декодирование в процессе через PyAV (libavcodec) в моно float32 16 кГц"""
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+    chunks = []
+    try:
+        with av.open(io.BytesIO(audio_data), mode="r") as container:
+            for frame in container.decode(audio=0):
+                for resampled in resampler.resample(frame):
+                    chunks.append(resampled.to_ndarray().reshape(-1))
+            # Сбрасываем остаток из буфера ресемплера
+            for resampled in resampler.resample(None):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+    except (av.error.FFmpegError, IndexError) as e:
+        raise AudioDecodeError(f"Не удалось декодировать аудио: {e}") from e
+    if not chunks:
+        raise AudioDecodeError("Аудиофайл не содержит звуковых данных")
+    return np.concatenate(chunks).astype(np.float32, copy=False)
+
+
+def decode_audio_ffmpeg(audio_data: bytes) -> np.ndarray:
+    """Декодирование через ffmpeg: байты в stdin, PCM s16le 16 кГц из stdout"""
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+    process = subprocess.run(command, input=audio_data, capture_output=True)
+    if process.returncode != 0 or not process.stdout:
+        raise AudioDecodeError(f"Не удалось декодировать аудио: {process.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(process.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+AUDIO_DECODERS = {
+    "pyav": decode_audio_pyav,
+    "ffmpeg": decode_audio_ffmpeg,
+}
+
+
+def decode_audio(audio_data: bytes, decoder: str = AUDIO_DECODER) -> np.ndarray:
+    """Декодирование загруженного аудио в массив float32 16 кГц без временных файлов"""
+    if decoder == "auto":
+        decoder = "pyav" if av is not None else "ffmpeg"
+    return AUDIO_DECODERS[decoder](audio_data)
+
+
+def detect_speech(audio: np.ndarray) -> list:
+    """
+    Энергетический детектор речи
+    
+    Порог считается от уровня шума записи (10-й перцентиль энергии кадров), поэтому
+    работает и на тихих, и на зашумленных записях. Возвращает список интервалов
+    (start, end) в отсчетах; паузы короче VAD_MIN_SILENCE_MS не разрывают интервал.
+    """
+    frame = SAMPLE_RATE * VAD_FRAME_MS // 1000
+    frames_count = len(audio) // frame
+    if frames_count == 0:
+        return [(0, len(audio))] if len(audio) else []
+    
+    frames = audio[:frames_count * frame].reshape(frames_count, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    noise_floor = np.percentile(energy_db, 10)
+    if np.percentile(energy_db, 90) - noise_floor < VAD_THRESHOLD_DB:
+        # Пауз нет (сплошная речь или сплошной шум) - уровень шума оценить нельзя
+        noise_floor = -55.0 - VAD_THRESHOLD_DB
+    threshold = max(noise_floor + VAD_THRESHOLD_DB, -55.0)  # Цифровая тишина не должна считаться речью
+    voiced = energy_db > threshold
+    
+    # Границы участков речи по кадрам
+    changes = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(changes == 1)
+    ends = np.flatnonzero(changes == -1)
+    
+    min_silence = VAD_MIN_SILENCE_MS // VAD_FRAME_MS
+    min_speech = VAD_MIN_SPEECH_MS // VAD_FRAME_MS
+    padding = VAD_PADDING_MS * SAMPLE_RATE // 1000
+    regions = []
+    for start, end in zip(starts, ends):
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    
+    return [
+        (max(0, int(start) * frame - padding), min(len(audio), int(end) * frame + padding))
+        for start, end in regions
+        if end - start >= min_speech
+    ]
+
+def split_into_chunks(audio: np.ndarray, speech: list) -> list:
+    """
+    Сборка фрагментов не длиннее VAD_CHUNK_SECONDS из участков речи
+    
+    Соседние участки объединяются, пока фрагмент помещается в лимит; длинные паузы
+    между фрагментами отбрасываются. Возвращает список (смещение в отсчетах, фрагмент).
+    """
+    max_samples = min(VAD_CHUNK_SECONDS * SAMPLE_RATE, WINDOW_SAMPLES)
+    spans = []
+    for start, end in speech:
+        # Непрерывная речь длиннее лимита режется на равные части
+        while end - start > max_samples:
+            spans.append((start, start + max_samples))
+            start += max_samples
+        if spans and end - spans[-1][0] <= max_samples:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+    return [(start, audio[start:end]) for start, end in spans]
+
+# Глобальные переменные для движков: основная модель и малая модель для коротких клипов
+engine = None
+small_engine = None
+model_ready = False  # Модели загружены и прогреты
+executor = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS)
+
+def create_engine(name: str = WHISPER_ENGINE, model_name: str = WHISPER_MODEL) -> TranscriptionEngine:
+    """Создание движка по имени из WHISPER_ENGINE"""
+    if name not in ENGINES:
+        raise ValueError(f"Неизвестный движок Whisper: {name}. Доступны: {', '.join(ENGINES)}")
+    return ENGINES[name](model_name)
+
+def decode_options(profile: str) -> dict:
+    """Параметры декодирования профиля"""
+    return {"language": WHISPER_LANGUAGE, **DECODING_PROFILES[profile]}
+
+def select_route(duration: float, profile: str = DEFAULT_DECODING_PROFILE):
+    """
+    Выбор модели и профиля декодирования по длительности записи
+    
+    В режиме auto короткие клипы декодируются жадно, а самые короткие - малой
+    моделью (если она загружена). Явно заданный профиль всегда идет на основную модель.
+    Возвращает пару (движок, профиль).
+    """
+    if profile != "auto":
+        return engine, profile
+    target = engine
+    if small_engine is not None and duration <= SMALL_MODEL_MAX_SECONDS:
+        target = small_engine
+    return target, "fast" if duration <= FAST_PROFILE_MAX_SECONDS else "accurate"
+
+def validate_decoding_profile(profile: str):
+    """Проверка имени профиля декодирования"""
+    if profile != "auto" and profile not in DECODING_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестный профиль декодирования: {profile}. Доступны: auto, {', '.join(DECODING_PROFILES)}"
+        )
+
+def configure_torch_threads():
+    """
+    Явная настройка потоков torch в главном процессе
+    
+    По умолчанию каждая транскрибация занимает все ядра, и TRANSCRIBE_WORKERS параллельных
+    транскрибаций конкурируют за них; ядра делятся поровну, inter-op параллелизм не нужен.
+    """
+    threads = TORCH_THREADS or max(1, (os.cpu_count() or 1) // TRANSCRIBE_WORKERS)
+    torch.set_num_threads(threads)
+    try:
+        # Число inter-op потоков задается только до первой параллельной работы
+        torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+    except RuntimeError as e:
+        logger.warning(f"Не удалось задать число inter-op потоков torch: {e}")
+    logger.info(f"Потоки torch: intra-op {threads}, inter-op {torch.get_num_interop_threads()}")
+
+def quantize_engine(target: TranscriptionEngine):
+    """Динамическая int8 квантизация модели при WHISPER_QUANTIZE"""
+    if not WHISPER_QUANTIZE:
+        return
+    if target.quantize():
+        logger.info(f"Модель {target.model_name}: линейные слои квантизованы в int8")
+    else:
+        logger.info(f"Модель {target.model_name}: квантизация не применяется (движок {target.name}, {target.device})")
+
+def warm_up_engines():
+    """
+    Прогревочная транскрибация каждой загруженной модели каждым профилем
+    
+    Первый запрос не платит за ленивую инициализацию: выделение памяти, выбор ядер
+    и подготовку квантизованных весов.
+    """
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(WARMUP_SECONDS * SAMPLE_RATE) * 0.01).astype(np.float32)
+    for loaded in (engine, small_engine):
+        if loaded is None:
+            continue
+        for profile in DECODING_PROFILES:
+            start = time.perf_counter()
+            try:
+                loaded.transcribe(audio, **decode_options(profile))
+            except Exception as e:
+                logger.warning(f"Прогрев модели {loaded.model_name} ({profile}) не удался: {e}")
+                continue
+            logger.info(f"Прогрев модели {loaded.model_name} ({profile}): {time.perf_counter() - start:.2f} с")
 
 def load_whisper_model():
-    """Загрузка модели Whisper Medium с fallback на CPU"""
-    global model, device
+    """Загрузка модели Whisper выбранным движком с fallback на CPU"""
+    global engine, small_engine, device
     try:
-        logger.info("Загрузка модели Whisper Medium...")
+        candidate = create_engine()
+        logger.info(f"Загрузка модели Whisper {WHISPER_MODEL} (движок {candidate.name})...")
         
         # Попытка загрузки на выбранном устройстве
         try:
-            model = whisper.load_model("medium", device=device)
-            logger.info(f"Модель Whisper Medium успешно загружена на {device}")
-            return True
+            candidate.load(device)
         except Exception as e:
             if device == "cuda":
                 logger.warning(f"Ошибка загрузки на CUDA: {e}")
                 logger.info("Переключение на CPU режим...")
                 device = "cpu"
-                model = whisper.load_model("medium", device=device)
-                logger.info(f"Модель Whisper Medium успешно загружена на {device}")
-                return True
+                candidate.load(device)
             else:
                 raise e
+
+        quantize_engine(candidate)
+        engine = candidate
+        logger.info(f"Модель Whisper {WHISPER_MODEL} успешно загружена на {device} (движок {engine.name})")
+        
+        if WHISPER_SMALL_MODEL:
+            # Малая модель остается в памяти рядом с основной
+            try:
+                candidate = create_engine(model_name=WHISPER_SMALL_MODEL)
+                candidate.load(device)
+                quantize_engine(candidate)
+                small_engine = candidate
+                logger.info(f"Малая модель Whisper {WHISPER_SMALL_MODEL} загружена для клипов до {SMALL_MODEL_MAX_SECONDS:.0f} с")
+            except Exception as e:
+                logger.warning(f"Не удалось загрузить малую модель {WHISPER_SMALL_MODEL}: {e}")
+        return True
                 
     except Exception as e:
         logger.error(f"Критическая ошибка при загрузке модели Whisper: {e}")
         return False
 
-def transcribe_sync(audio_path: str) -> dict:
-    """Синхронная транскрибация аудио"""
+def transcribe_batch_sync(audios: list, target: TranscriptionEngine, profile: str) -> list:
+    """Синхронная транскрибация батча коротких клипов"""
+    try:
+        if target is None:
+            raise Exception("Модель Whisper не загружена")
+        results = target.transcribe_batch(audios, **decode_options(profile))
+        return [
+            {
+                "success": True,
+                "text": result["text"],
+                "language": result["language"],
+                "segments": result["segments"],
+                "profile": profile,
+                "model": target.model_name
+            }
+            for result in results
+        ]
+    except Exception as e:
+        logger.error(f"Ошибка при батчевой транскрибации: {e}")
+        return [{"success": False, "text": "", "error": str(e)} for _ in audios]
+
+def transcribe_sync(audio, target: TranscriptionEngine = None, profile: str = "accurate") -> dict:
+    """Синхронная транскрибация аудио (массив float32 16 кГц или путь к файлу)"""
     try:
-        if model is None:
+        target = target or engine
+        if target is None:
             raise Exception("Модель Whisper не загружена")
         
-        # Транскрибация с базовыми настройками для русского языка
-        result = model.transcribe(
-            audio_path,
-            language="ru",  # Русский язык
-            task="transcribe",
-            fp16=(device == "cuda" and torch.cuda.is_available()),  # fp16 только для CUDA
-            temperature=0.0,  # Детерминистичный результат
-            beam_size=5,  # Beam search для лучшего качества
-            best_of=5,  # Выбираем лучший из 5 вариантов
-            word_timestamps=False  # Не нужны временные метки для каждого слова
-        )
+        # Транскрибация с настройками профиля для русского языка
+        result = target.transcribe(audio, **decode_options(profile))
         
         return {
             "success": True,
-            "text": result["text"].strip(),
-            "language": result.get("language", "ru"),
-            "segments": len(result.get("segments", []))
+            "text": result["text"],
+            "language": result["language"],
+            "segments": result["segments"],
+            "profile": profile,
+            "model": target.model_name
         }
     except Exception as e:
         logger.error(f"Ошибка при транскрибации: {e}")
@@ -97,45 +617,619 @@ def transcribe_sync(audio_path: str) -> dict:
             "error": str(e)
         }
 
+class TranscriptionCache:
+    """
+    Кэш результатов транскрибации по SHA-256 содержимого файла
+    
+    Ключ включает движок, модели и запрошенный профиль декодирования, поэтому смена
+    конфигурации не отдает устаревшие результаты. Горячие записи хранятся в LRU в памяти,
+    все записи - в JSON-файлах каталога CACHE_DIR (переживают перезапуск сервиса).
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, directory: str = CACHE_DIR,
+                 disk_max_entries: int = CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.disk_max_entries = disk_max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stored": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(audio_data: bytes, profile: str) -> str:
+        digest = hashlib.sha256(audio_data).hexdigest()
+        precision = "int8" if WHISPER_QUANTIZE else "default"
+        return f"{digest}-{WHISPER_ENGINE}-{WHISPER_MODEL}-{WHISPER_SMALL_MODEL or 'none'}-{precision}-{profile}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def lookup(self, audio_data: bytes, profile: str):
+        """Поиск результата; возвращает (ключ, результат или None)"""
+        key = self.make_key(audio_data, profile)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return key, self.entries[key]
+        
+        if self.directory:
+            try:
+                with open(self._path(key), encoding="utf-8") as cache_file:
+                    result = json.load(cache_file)
+                with self.lock:
+                    self.stats["disk_hits"] += 1
+                    self._remember(key, result)
+                return key, result
+            except (OSError, ValueError):
+                pass
+        
+        with self.lock:
+            self.stats["misses"] += 1
+        return key, None
+
+    def store(self, key: str, result: dict):
+        """Сохранение успешного результата в память и на диск"""
+        with self.lock:
+            self._remember(key, result)
+            self.stats["stored"] += 1
+            prune = self.directory and self.stats["stored"] % 100 == 0
+        
+        if self.directory:
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Запись через временный файл: параллельное чтение не увидит половину JSON
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as cache_file:
+                    json.dump(result, cache_file, ensure_ascii=False)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logger.warning(f"Не удалось записать кэш транскрибации: {e}")
+            if prune:
+                self._prune_disk()
+
+    def _remember(self, key: str, result: dict):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _prune_disk(self):
+        """Удаление самых старых файлов сверх CACHE_DISK_MAX_ENTRIES"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            files.extend(os.path.join(root, name) for name in names if name.endswith(".json"))
+        if len(files) <= self.disk_max_entries:
+            return
+        files.sort(key=lambda path: os.path.getmtime(path))
+        for path in files[:len(files) - self.disk_max_entries]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def metrics(self) -> dict:
+        with self.lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self.entries),
+                "disk_enabled": bool(self.directory)
+            }
+
+
+transcription_cache = TranscriptionCache() if CACHE_ENABLED else None
+
+process_pool = None
+
+def init_process_worker(threads: int, warmup_barrier=None):
+    """Инициализация воркера: своя доля ядер для intra-op потоков torch и прогрев"""
+    torch.set_num_threads(threads)
+    logger.info(f"Воркер Whisper {os.getpid()}: потоков torch {threads}")
+    if warmup_barrier is not None:
+        # Прогрев в каждом воркере: до fork родитель не запускает инференс
+        warm_up_engines()
+        try:
+            warmup_barrier.wait(timeout=WARMUP_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+
+def prepare_fork():
+    """
+    Подготовка главного процесса к fork пула процессов: вызывается до загрузки моделей
+    
+    Torch работает в одном потоке, пока воркеры не созданы: иначе загрузка и квантизация
+    запустили бы пул потоков OpenMP, который в потомках после fork может зависнуть.
+    Потоки для инференса в главном процессе настраивает configure_torch_threads после fork.
+    """
+    torch.set_num_threads(1)
+
+def start_process_pool(workers: int = PROCESS_WORKERS):
+    """
+    Запуск пула процессов инференса поверх уже загруженных моделей
+    
+    Воркеры создаются через fork сразу, до первой транскрибации: веса моделей
+    остаются общими страницами памяти. Предусловие fork: в процессе нет других потоков
+    (их блокировки остались бы захваченными в потомках), а torch в родителе работал
+    в одном потоке и не запускал пул OpenMP (см. prepare_fork). При нарушении
+    предусловия пул не запускается, и инференс идет в потоках главного процесса.
+    """
+    global process_pool
+    if device != "cpu" or not engine.supports_process_pool:
+        logger.warning("Пул процессов доступен только для движка openai на CPU, используются потоки")
+        return None
+    other_threads = [thread.name for thread in threading.enumerate() if thread is not threading.current_thread()]
+    if other_threads or torch.get_num_threads() != 1:
+        logger.warning(
+            f"Пул процессов не запущен: fork небезопасен (потоки: {', '.join(other_threads) or 'нет'}, "
+            f"потоков torch: {torch.get_num_threads()}), используются потоки"
+        )
+        return None
+    
+    threads = THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // workers)
+    for loaded in (engine, small_engine):
+        if loaded is not None:
+            loaded.share_memory()
+    context = multiprocessing.get_context("fork")
+    warmup_barrier = context.Barrier(workers + 1) if WARMUP_ENABLED else None
+    process_pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=init_process_worker,
+        initargs=(threads, warmup_barrier)
+    )
+    # С fork пул запускает все процессы при первой задаче - делаем это сейчас
+    future = process_pool.submit(os.getpid)
+    if warmup_barrier is not None:
+        try:
+            warmup_barrier.wait(timeout=WARMUP_TIMEOUT)
+        except threading.BrokenBarrierError:
+            logger.warning("Не все воркеры завершили прогрев вовремя")
+    future.result()
+    logger.info(f"Пул процессов Whisper: {workers} воркеров по {threads} потоков torch")
+    return process_pool
+
+def stop_process_pool():
+    """Остановка пула процессов"""
+    global process_pool
+    if process_pool is not None:
+        process_pool.shutdown(wait=True, cancel_futures=True)
+        process_pool = None
+
+def read_process_memory(pid: int) -> dict:
+    """RSS и PSS процесса в МБ (PSS делит общие страницы между процессами)"""
+    memory = {"pid": pid}
+    for path, field, key in ((f"/proc/{pid}/status", "VmRSS:", "rss_mb"),
+                             (f"/proc/{pid}/smaps_rollup", "Pss:", "pss_mb")):
+        try:
+            with open(path) as proc_file:
+                for line in proc_file:
+                    if line.startswith(field):
+                        memory[key] = round(int(line.split()[1]) / 1024, 1)
+                        break
+        except OSError:
+            pass
+    return memory
+
+def worker_memory() -> list:
+    """Память процессов-воркеров пула"""
+    if process_pool is None:
+        return []
+    return [read_process_memory(child.pid) for child in multiprocessing.active_children()]
+
+def resolve_engine(model_name: str) -> TranscriptionEngine:
+    """Движок по имени модели (в воркере - унаследованный от родителя через fork)"""
+    if small_engine is not None and small_engine.model_name == model_name:
+        return small_engine
+    return engine
+
+def process_transcribe(audio: np.ndarray, model_name: str, profile: str) -> dict:
+    """Транскрибация в процессе-воркере"""
+    return transcribe_sync(audio, resolve_engine(model_name), profile)
+
+def process_transcribe_batch(audios: list, model_name: str, profile: str) -> list:
+    """Транскрибация батча в процессе-воркере"""
+    return transcribe_batch_sync(audios, resolve_engine(model_name), profile)
+
+async def run_in_process_pool(function, *args):
+    """
+    Вызов в пуле процессов
+    
+    Если воркер аварийно завершился (BrokenProcessPool), пул больше не принимает задачи:
+    он отключается, и следующие запросы обрабатываются потоками главного процесса.
+    """
+    global process_pool
+    pool = process_pool
+    try:
+        return await asyncio.get_event_loop().run_in_executor(pool, function, *args)
+    except BrokenProcessPool:
+        if process_pool is pool:
+            logger.error("Воркер пула процессов аварийно завершился: пул отключен, инференс переключен на потоки")
+            process_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+async def run_inference(audio: np.ndarray, target: TranscriptionEngine, profile: str) -> dict:
+    """Транскрибация в пуле процессов, если он запущен, иначе в пуле потоков"""
+    if process_pool is not None:
+        return await run_in_process_pool(process_transcribe, audio, target.model_name, profile)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, transcribe_sync, audio, target, profile)
+
+async def run_batch_inference(audios: list, target: TranscriptionEngine, profile: str) -> list:
+    """Батчевая транскрибация в пуле процессов, если он запущен, иначе в пуле потоков"""
+    if process_pool is not None:
+        return await run_in_process_pool(process_transcribe_batch, audios, target.model_name, profile)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, transcribe_batch_sync, audios, target, profile)
+
+class TranscriptionBatcher:
+    """Собирает одновременные короткие запросы в батчи
+
+    Первый запрос открывает окно BATCH_WINDOW; все запросы, пришедшие за это время
+    (но не больше MAX_BATCH_SIZE), транскрибируются одним вызовом. Пока батч
+    считается, новые запросы копятся в очереди и образуют следующий батч.
+    У каждой пары (модель, профиль декодирования) своя очередь; одновременно
+    считается не больше concurrency батчей (по числу процессов-воркеров).
+    """
+
+    def __init__(self, window: float = BATCH_WINDOW, max_batch_size: int = MAX_BATCH_SIZE, concurrency: int = 1):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.slots = asyncio.Semaphore(concurrency)
+        self.queues = {}
+        self.tasks = []
+        self.batches = 0
+        self.requests = 0
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+    async def submit(self, audio: np.ndarray, target: TranscriptionEngine = None, profile: str = "accurate") -> dict:
+        target = target or engine
+        key = (target.model_name, profile)
+        if key not in self.queues:
+            self.queues[key] = asyncio.Queue()
+            self.tasks.append(asyncio.create_task(self._run(self.queues[key], target, profile)))
+        future = asyncio.get_running_loop().create_future()
+        await self.queues[key].put((audio, future))
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue, first) -> list:
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, queue: asyncio.Queue, target: TranscriptionEngine, profile: str):
+        while True:
+            # Пока все воркеры заняты, запросы копятся в очереди и попадут в следующий батч.
+            # Слот занимается только при наличии запроса, чтобы пустая очередь не блокировала остальные
+            first = await queue.get()
+            await self.slots.acquire()
+            batch = await self._collect(queue, first)
+            self.tasks.append(asyncio.create_task(self._execute(batch, target, profile)))
+            self.tasks = [task for task in self.tasks if not task.done()]
+
+    async def _execute(self, batch: list, target: TranscriptionEngine, profile: str):
+        try:
+            audios = [audio for audio, _ in batch]
+            results = await run_batch_inference(audios, target, profile)
+        except Exception as e:
+            # Ошибка пула (например, BrokenProcessPool) получают все ожидающие батча
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.slots.release()
+        self.batches += 1
+        self.requests += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.requests / self.batches if self.batches else 0.0
+
+
+batcher = None
+
+async def run_transcription(audio: np.ndarray, target: TranscriptionEngine = None, profile: str = "accurate") -> dict:
+    """Короткие клипы идут через батчер, длинные - по фрагментам речи или напрямую в пул потоков"""
+    target = target or engine
+    if batcher is not None and target.supports_batching and len(audio) <= WINDOW_SAMPLES:
+        return await batcher.submit(audio, target, profile)
+    if VAD_ENABLED and len(audio) > WINDOW_SAMPLES:
+        return await transcribe_long_audio(audio, target, profile)
+    return await run_inference(audio, target, profile)
+
+async def iter_chunk_results(audio: np.ndarray, target: TranscriptionEngine, profile: str, batched: bool = True):
+    """
+    Параллельная транскрибация фрагментов речи с выдачей результатов по порядку
+    
+    При batched фрагменты идут через батчер (один проход энкодера на несколько
+    фрагментов); иначе - напрямую воркерам, чтобы первый фрагмент был готов раньше.
+    Выдает пары (смещение фрагмента в секундах, результат transcribe_sync).
+    """
+    chunks = split_into_chunks(audio, detect_speech(audio))
+    logger.info(
+        f"VAD: {len(audio) / SAMPLE_RATE:.1f} с аудио -> {len(chunks)} фрагм., "
+        f"{sum(len(chunk) for _, chunk in chunks) / SAMPLE_RATE:.1f} с речи"
+    )
+    if batched:
+        tasks = [asyncio.ensure_future(run_transcription(chunk, target, profile)) for _, chunk in chunks]
+    else:
+        tasks = [asyncio.ensure_future(run_inference(chunk, target, profile)) for _, chunk in chunks]
+    try:
+        for (offset, _), task in zip(chunks, tasks):
+            yield offset / SAMPLE_RATE, await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def transcribe_long_audio(audio: np.ndarray, target: TranscriptionEngine, profile: str) -> dict:
+    """Транскрибация длинной записи по фрагментам речи со склейкой результата"""
+    segments = []
+    async for offset, result in iter_chunk_results(audio, target, profile):
+        if not result["success"]:
+            return result
+        segments.extend(
+            {"start": offset + segment["start"], "end": offset + segment["end"], "text": segment["text"]}
+            for segment in result["segments"]
+        )
+    return {
+        "success": True,
+        "text": " ".join(segment["text"] for segment in segments if segment["text"]).strip(),
+        "language": WHISPER_LANGUAGE,
+        "segments": segments,
+        "profile": profile,
+        "model": target.model_name
+    }
+
+async def iter_engine_segments(audio: np.ndarray, target: TranscriptionEngine, profile: str):
+    """Сегменты движка из пула потоков по мере декодирования"""
+    loop = asyncio.get_event_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    
+    def produce():
+        try:
+            for segment in target.iter_segments(audio, **decode_options(profile)):
+                if cancelled.is_set():
+                    return
+                loop.call_soon_threadsafe(events.put_nowait, ("segment", segment))
+            loop.call_soon_threadsafe(events.put_nowait, ("done", None))
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, ("error", str(e)))
+    
+    loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            kind, payload = await events.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise Exception(payload)
+            yield payload
+    finally:
+        # Клиент мог отключиться: прекращаем декодирование после текущего сегмента
+        cancelled.set()
+
+async def iter_chunked_segments(audio: np.ndarray, target: TranscriptionEngine, profile: str):
+    """Сегменты фрагментов речи по порядку, по мере готовности фрагментов"""
+    async for offset, result in iter_chunk_results(audio, target, profile, batched=False):
+        if not result["success"]:
+            raise Exception(result["error"])
+        for segment in result["segments"]:
+            if segment["text"]:
+                yield {"start": offset + segment["start"], "end": offset + segment["end"], "text": segment["text"]}
+
+async def iter_transcription_events(audio: np.ndarray, target: TranscriptionEngine, profile: str):
+    """
+    Асинхронный генератор событий потоковой транскрибации
+    
+    События "segment" (start, end, text) по мере готовности, затем "done" или "error".
+    Длинные записи при включенном VAD распознаются фрагментами речи параллельно.
+    """
+    if VAD_ENABLED and len(audio) > WINDOW_SAMPLES:
+        segments = iter_chunked_segments(audio, target, profile)
+    else:
+        segments = iter_engine_segments(audio, target, profile)
+    
+    texts = []
+    try:
+        async for segment in segments:
+            texts.append(segment["text"])
+            yield {"type": "segment", **segment}
+    except Exception as e:
+        logger.error(f"Ошибка при потоковой транскрибации: {e}")
+        yield {"type": "error", "success": False, "error": str(e)}
+        return
+    
+    yield {
+        "type": "done",
+        "success": True,
+        "text": " ".join(texts).strip(),
+        "language": WHISPER_LANGUAGE,
+        "segments_count": len(texts),
+        "profile": profile,
+        "model": target.model_name
+    }
+
 @app.on_event("startup")
 async def startup_event():
     """Инициализация при запуске сервиса"""
     logger.info("Запуск сервиса Whisper...")
     
-    # Загружаем модель в отдельном потоке
     loop = asyncio.get_event_loop()
-    success = await loop.run_in_executor(executor, load_whisper_model)
+    if PROCESS_WORKERS > 0:
+        # Пул создается через fork из однопоточного процесса: модель загружается в главном
+        # потоке до первого обращения к executor (сервер до конца startup запросы не принимает)
+        prepare_fork()
+        success = load_whisper_model()
+        if success:
+            start_process_pool(PROCESS_WORKERS)
+        configure_torch_threads()
+    else:
+        configure_torch_threads()
+        # Загружаем модель в отдельном потоке
+        success = await loop.run_in_executor(executor, load_whisper_model)
     
     if not success:
         logger.error("Не удалось загрузить модель Whisper. Сервис не готов к работе.")
     else:
+        global batcher
+        global model_ready
+        if WARMUP_ENABLED:
+            # Главный процесс прогревается после fork: потоковая транскрибация идет в нем
+            await loop.run_in_executor(executor, warm_up_engines)
+        model_ready = True
+        transcription_jobs.start()
+        if BATCHING_ENABLED and engine.supports_batching:
+            batcher = TranscriptionBatcher(concurrency=PROCESS_WORKERS if process_pool else 1)
+            logger.info(f"Батчирование включено: окно {BATCH_WINDOW * 1000:.0f} мс, до {MAX_BATCH_SIZE} запросов")
         logger.info("Сервис Whisper готов к работе!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Остановка очереди задач и пула процессов при завершении сервиса"""
+    transcription_jobs.stop()
+    stop_process_pool()
+
 @app.get("/")
 async def root():
     """Корневой эндпоинт для проверки состояния сервиса"""
     return {
         "service": "Whisper Speech Recognition",
         "version": "1.0.0",
-        "model": "medium",
+        "model": WHISPER_MODEL,
+        "small_model": small_engine.model_name if small_engine else None,
+        "decoding_profiles": ["auto", *DECODING_PROFILES],
+        "engine": WHISPER_ENGINE,
         "device": device,
-        "status": "ready" if model is not None else "loading"
+        "status": "ready" if engine is not None else "loading"
     }
 
 @app.get("/health")
 async def health_check():
     """Проверка работоспособности сервиса"""
     return {
-        "status": "healthy" if model is not None else "loading",
+        "status": "healthy" if model_ready else "loading",
         "device": device,
-        "model_loaded": model is not None
+        "engine": WHISPER_ENGINE,
+        "model_loaded": engine is not None,
+        "quantized": engine is not None and engine.quantized,
+        "process_workers": worker_memory(),
+        "jobs": {"queue_depth": transcription_jobs.depth, "running": transcription_jobs.running},
+        "batching": {
+            "enabled": batcher is not None,
+            "batches": batcher.batches if batcher else 0,
+            "average_batch_size": round(batcher.average_batch_size, 2) if batcher else 0.0
+        }
+    }
+
+def cacheable_result(result: dict) -> dict:
+    """Поля результата, сохраняемые в кэше"""
+    return {key: result[key] for key in ("text", "language", "segments", "profile", "model")}
+
+def build_transcription_response(result: dict, cached: bool = False) -> dict:
+    """Ответ /transcribe из результата транскрибации или записи кэша"""
+    return {
+        "success": True,
+        "text": result["text"],
+        "language": result["language"],
+        "segments_count": len(result["segments"]),
+        "profile": result["profile"],
+        "model": result["model"],
+        "cached": cached
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики сервиса: кэш результатов, очередь задач и батчирование"""
+    return {
+        "jobs": {
+            "queue_depth": transcription_jobs.depth,
+            "queue_size": transcription_jobs.max_queued,
+            "running": transcription_jobs.running,
+            "streams": transcription_jobs.reserved
+        },
+        "cache": transcription_cache.metrics() if transcription_cache else {"enabled": False},
+        "batching": {
+            "batches": batcher.batches if batcher else 0,
+            "requests": batcher.requests if batcher else 0,
+            "average_batch_size": round(batcher.average_batch_size, 2) if batcher else 0.0
+        }
     }
 
+async def transcribe_upload(file_content: bytes, profile: str) -> dict:
+    """
+    Транскрибация загруженного файла: кэш, декодирование, выбор модели и профиля
+    
+    Возвращает ответ /transcribe; ошибки выбрасываются как HTTPException.
+    """
+    logger.info(f"Обработка аудиофайла размером {len(file_content)} байт")
+    
+    cache_key = None
+    if transcription_cache is not None:
+        cache_key, cached = await asyncio.to_thread(transcription_cache.lookup, file_content, profile)
+        if cached is not None:
+            logger.info(f"Результат из кэша: '{cached['text'][:100]}...'")
+            return build_transcription_response(cached, cached=True)
+    
+    # Декодируем в памяти и выполняем транскрибацию в отдельном потоке
+    loop = asyncio.get_event_loop()
+    try:
+        audio = await loop.run_in_executor(executor, decode_audio, file_content)
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    target, profile = select_route(len(audio) / SAMPLE_RATE, profile)
+    result = await run_transcription(audio, target, profile)
+    
+    if not result["success"]:
+        logger.error(f"Ошибка транскрибации: {result['error']}")
+        raise HTTPException(status_code=500, detail=f"Ошибка транскрибации: {result['error']}")
+    
+    logger.info(f"Транскрибация завершена ({result['model']}, {result['profile']}): '{result['text'][:100]}...'")
+    if cache_key is not None:
+        await asyncio.to_thread(transcription_cache.store, cache_key, cacheable_result(result))
+    return build_transcription_response(result)
+
+async def run_transcription_job(payload: dict, report_progress) -> dict:
+    """Исполнитель задачи из очереди (прогресс транскрибации не сообщается)"""
+    return await transcribe_upload(payload["audio_data"], payload["profile"])
+
+transcription_jobs = JobQueue(run_transcription_job, JOB_QUEUE_SIZE, JOB_WORKERS, JOB_RESULT_TTL,
+                              default_duration=30.0)
+
 @app.post("/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
-    """Транскрибация аудиофайла"""
-    if model is None:
+async def transcribe_audio(file: UploadFile = File(...), profile: str = DEFAULT_DECODING_PROFILE):
+    """
+    Транскрибация аудиофайла
+    
+    Args:
+        file: Загруженный аудиофайл
+        profile: Профиль декодирования ("auto", "fast", "accurate")
+    """
+    if engine is None:
         raise HTTPException(status_code=503, detail="Модель Whisper еще не загружена. Попробуйте позже.")
+    validate_decoding_profile(profile)
     
     # Проверяем тип файла
     if not file.content_type or not file.content_type.startswith("audio/"):
@@ -144,7 +1238,6 @@ async def transcribe_audio(file: UploadFile = File(...)):
         if file.content_type not in allowed_types:
             logger.warning(f"Неподдерживаемый тип файла: {file.content_type}")
     
-    temp_file_path = None
     try:
         # Читаем содержимое файла
         file_content = await file.read()
@@ -152,51 +1245,145 @@ async def transcribe_audio(file: UploadFile = File(...)):
         if len(file_content) == 0:
             raise HTTPException(status_code=400, detail="Пустой аудиофайл")
         
-        # Создаем временный файл
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as temp_file:
-            temp_file.write(file_content)
-            temp_file_path = temp_file.name
-        
-        logger.info(f"Обработка аудиофайла размером {len(file_content)} байт")
-        
-        # Выполняем транскрибацию в отдельном потоке
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(executor, transcribe_sync, temp_file_path)
-        
-        if result["success"]:
-            logger.info(f"Транскрибация завершена: '{result['text'][:100]}...'")
-            return JSONResponse(content={
-                "success": True,
-                "text": result["text"],
-                "language": result["language"],
-                "segments_count": result["segments"]
-            })
-        else:
-            logger.error(f"Ошибка транскрибации: {result['error']}")
-            raise HTTPException(status_code=500, detail=f"Ошибка транскрибации: {result['error']}")
+        return JSONResponse(content=await transcribe_upload(file_content, profile))
     
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Неожиданная ошибка при обработке аудио: {e}")
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
+
+@app.post("/jobs/transcribe", status_code=202)
+async def submit_transcription_job(file: UploadFile = File(...), profile: str = DEFAULT_DECODING_PROFILE):
+    """
+    Постановка транскрибации в очередь
     
-    finally:
-        # Удаляем временный файл
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-            except Exception as e:
-                logger.warning(f"Не удалось удалить временный файл {temp_file_path}: {e}")
+    Сразу возвращает job_id; результат - через GET /jobs/{job_id}. При заполненной
+    очереди отвечает 503 с заголовком Retry-After.
+    """
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Модель Whisper еще не загружена. Попробуйте позже.")
+    validate_decoding_profile(profile)
+    
+    file_content = await file.read()
+    if len(file_content) == 0:
+        raise HTTPException(status_code=400, detail="Пустой аудиофайл")
+    
+    try:
+        job = transcription_jobs.submit({"audio_data": file_content, "profile": profile})
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Очередь транскрибации заполнена ({transcription_jobs.depth} задач). Повторите позже.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    logger.info(f"Задача {job['id']} поставлена в очередь ({len(file_content)} байт)")
+    return transcription_jobs.describe(job)
+
+@app.get("/jobs/{job_id}")
+async def get_transcription_job(job_id: str, wait: float = 0):
+    """
+    Статус задачи транскрибации
+    
+    Args:
+        job_id: Идентификатор задачи
+        wait: Long-poll - сколько секунд ждать завершения (не больше 30)
+    """
+    job = await transcription_jobs.wait(job_id, min(max(wait, 0.0), JOB_MAX_WAIT))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена или ее результат уже удален")
+    
+    response = transcription_jobs.describe(job)
+    if job["status"] == "done":
+        response["result"] = job["result"]
+    return response
+
+@app.post("/transcribe_stream")
+async def transcribe_audio_stream(file: UploadFile = File(...), profile: str = DEFAULT_DECODING_PROFILE):
+    """
+    Потоковая транскрибация: сегменты в формате NDJSON по мере декодирования
+    
+    Каждая строка - JSON-объект с полем type: "segment" (start, end, text),
+    "done" (полный текст, как в /transcribe) или "error". Пока идет выдача, запрос
+    занимает место в очереди задач; при заполненной очереди - 503 с Retry-After.
+    """
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Модель Whisper еще не загружена. Попробуйте позже.")
+    validate_decoding_profile(profile)
+    
+    file_content = await file.read()
+    if len(file_content) == 0:
+        raise HTTPException(status_code=400, detail="Пустой аудиофайл")
+    
+    cache_key = None
+    if transcription_cache is not None:
+        cache_key, cached = await asyncio.to_thread(transcription_cache.lookup, file_content, profile)
+        if cached is not None:
+            async def stream_cached():
+                for segment in cached["segments"]:
+                    yield json.dumps({"type": "segment", **segment}, ensure_ascii=False) + "\n"
+                done = {"type": "done", **build_transcription_response(cached, cached=True)}
+                yield json.dumps(done, ensure_ascii=False) + "\n"
+            return StreamingResponse(stream_cached(), media_type="application/x-ndjson")
+    
+    # Длинные записи идут мимо исполнителей очереди, но занимают в ней место до конца выдачи
+    try:
+        transcription_jobs.reserve()
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Очередь транскрибации заполнена ({transcription_jobs.depth} задач). Повторите позже.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    released = False
+    
+    def release():
+        # Вызывается и из генератора, и после ответа: генератор мог не запуститься при обрыве соединения
+        nonlocal released
+        if not released:
+            released = True
+            transcription_jobs.release()
+    
+    loop = asyncio.get_event_loop()
+    try:
+        audio = await loop.run_in_executor(executor, decode_audio, file_content)
+    except AudioDecodeError as e:
+        release()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        release()
+        raise
+    
+    logger.info(f"Потоковая обработка аудио длительностью {len(audio) / SAMPLE_RATE:.1f} с")
+    target, profile = select_route(len(audio) / SAMPLE_RATE, profile)
+    
+    async def stream_segments():
+        segments = []
+        try:
+            async for event in iter_transcription_events(audio, target, profile):
+                if event["type"] == "segment":
+                    segments.append({key: event[key] for key in ("start", "end", "text")})
+                elif event["type"] == "done" and cache_key is not None:
+                    await asyncio.to_thread(transcription_cache.store, cache_key, {
+                        "text": event["text"],
+                        "language": event["language"],
+                        "segments": segments,
+                        "profile": event["profile"],
+                        "model": event["model"]
+                    })
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            release()
+    
+    return StreamingResponse(stream_segments(), media_type="application/x-ndjson", background=BackgroundTask(release))
 
 @app.post("/transcribe_simple")
-async def transcribe_simple(file: UploadFile = File(...)):
+async def transcribe_simple(file: UploadFile = File(...), profile: str = DEFAULT_DECODING_PROFILE):
     """Упрощенный эндпоинт транскрибации - возвращает только текст"""
-    result = await transcribe_audio(file)
+    result = await transcribe_audio(file, profile)
     response_data = result.body.decode() if hasattr(result, 'body') else result
     
     if isinstance(response_data, str):
-        import json
         response_data = json.loads(response_data)
     
     return {"text": response_data.get("text", "")}
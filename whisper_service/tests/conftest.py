@@ -0,0 +1,127 @@
+"""
+Общие настройки тестов Whisper сервиса
+
+Запуск из каталога сервиса (нужны зависимости из requirements.txt и pytest):
+    python -m pytest tests
+
+Модели Whisper не загружаются: вместо движка используется FakeEngine, а для
+проверок настоящего движка - крошечная модель Whisper со случайными весами.
+"""
+
+import asyncio
+import io
+import os
+import sys
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("whisper")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+class FakeEngine(main.TranscriptionEngine):
+    """Движок без модели: текст результата - длительность клипа в секундах"""
+
+    name = "fake"
+    supports_batching = True
+
+    def __init__(self, model_name: str = "fake"):
+        super().__init__(model_name)
+        self.calls = []
+
+    def load(self, device: str):
+        self.model = object()
+        self.device = device
+
+    def transcribe(self, audio, **options) -> dict:
+        self.calls.append(("transcribe", len(audio), options))
+        seconds = len(audio) / main.SAMPLE_RATE
+        text = f"{seconds:.1f} с"
+        return {"text": text, "language": "ru", "segments": [{"start": 0.0, "end": seconds, "text": text}]}
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        self.calls.append(("transcribe_batch", len(audios), options))
+        return [self.transcribe(audio, **options) for audio in audios]
+
+
+def build_tiny_whisper():
+    """Модель Whisper с архитектурой multilingual, но минимальных размеров и со случайными весами"""
+    from whisper.model import ModelDimensions, Whisper
+
+    torch.manual_seed(0)
+    dims = ModelDimensions(
+        n_mels=80, n_audio_ctx=1500, n_audio_state=16, n_audio_head=2, n_audio_layer=1,
+        n_vocab=51865, n_text_ctx=16, n_text_state=16, n_text_head=2, n_text_layer=1
+    )
+    model = Whisper(dims)
+    # Позиционные эмбеддинги декодера создаются через torch.empty и заполняются только из чекпойнта
+    torch.nn.init.normal_(model.decoder.positional_embedding, std=0.02)
+    return model.eval()
+
+
+def clip(seconds: float, amplitude: float = 0.1) -> np.ndarray:
+    """Синусоида 440 Гц заданной длительности (16 кГц, float32)"""
+    t = np.arange(int(seconds * main.SAMPLE_RATE)) / main.SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+
+def wav_bytes(audio: np.ndarray, sample_rate: int = None) -> bytes:
+    """WAV PCM 16 бит моно из массива float32"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate or main.SAMPLE_RATE)
+        wav.writeframes((audio * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def post_transcribe(data: bytes, profile: str = "accurate") -> httpx.Response:
+    """POST /transcribe через ASGI без запуска сервера (startup не выполняется)"""
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return await client.post("/transcribe", params={"profile": profile},
+                                     files={"file": ("voice.ogg", data, "audio/ogg")})
+    return asyncio.run(scenario())
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+    """FakeEngine в роли основной модели сервиса"""
+    loaded = FakeEngine()
+    loaded.load("cpu")
+    monkeypatch.setattr(main, "engine", loaded)
+    monkeypatch.setattr(main, "small_engine", None)
+    return loaded
+
+
+@pytest.fixture
+def tiny_whisper(monkeypatch):
+    """whisper.load_model отдает крошечную модель вместо скачивания весов"""
+    from tqdm import tqdm
+
+    monkeypatch.setattr(main.whisper, "load_model", lambda name, device=None: build_tiny_whisper().to(device))
+    # Без фонового потока-монитора tqdm: иначе последующие тесты пула процессов не смогут сделать fork
+    monkeypatch.setattr(tqdm, "monitor_interval", 0)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """Сервис без кэша и батчера: запрос идет прямо в движок через свой пул потоков"""
+    pool = ThreadPoolExecutor(max_workers=main.TRANSCRIBE_WORKERS)
+    monkeypatch.setattr(main, "executor", pool)
+    monkeypatch.setattr(main, "transcription_cache", None)
+    monkeypatch.setattr(main, "batcher", None)
+    monkeypatch.setattr(main, "small_engine", None)
+    monkeypatch.setattr(main, "device", "cpu")
+    yield
+    # Потоки пула не переживают тест: пулу процессов нужен однопоточный родитель
+    pool.shutdown(wait=True)
@@ -0,0 +1,78 @@
+"""Сборка одновременных коротких запросов в батчи"""
+
+import asyncio
+
+from conftest import FakeEngine, clip
+import main
+
+
+class FailingEngine(FakeEngine):
+    """Движок, у которого батчевое декодирование падает"""
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        raise RuntimeError("нехватка памяти")
+
+
+def run_batched(requests: list, **batcher_options) -> tuple:
+    """Одновременная отправка запросов (клип, движок, профиль) в батчер"""
+    async def scenario():
+        batcher = main.TranscriptionBatcher(**batcher_options)
+        try:
+            results = await asyncio.wait_for(asyncio.gather(
+                *(batcher.submit(audio, target, profile) for audio, target, profile in requests)
+            ), timeout=10)
+            return results, batcher
+        finally:
+            batcher.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_concurrent_requests_share_one_batch(service, fake_engine):
+    results, batcher = run_batched([(clip(seconds), fake_engine, "fast") for seconds in (1, 2, 3)], window=0.1)
+
+    assert [result["text"] for result in results] == ["1.0 с", "2.0 с", "3.0 с"]
+    assert all(result["success"] and result["profile"] == "fast" for result in results)
+    assert [call[:2] for call in fake_engine.calls if call[0] == "transcribe_batch"] == [("transcribe_batch", 3)]
+    assert batcher.batches == 1 and batcher.average_batch_size == 3
+
+
+def test_batches_are_split_by_profile_and_size(service, fake_engine):
+    requests = [(clip(1), fake_engine, "fast")] * 3 + [(clip(1), fake_engine, "accurate")]
+
+    results, batcher = run_batched(requests, window=0.1, max_batch_size=2)
+
+    assert all(result["success"] for result in results)
+    assert [result["profile"] for result in results] == ["fast", "fast", "fast", "accurate"]
+    sizes = sorted(call[1] for call in fake_engine.calls if call[0] == "transcribe_batch")
+    assert sizes == [1, 1, 2]
+    assert batcher.requests == 4
+
+
+def test_long_audio_bypasses_batcher(monkeypatch, service, fake_engine):
+    monkeypatch.setattr(main, "VAD_ENABLED", False)
+
+    async def scenario():
+        monkeypatch.setattr(main, "batcher", main.TranscriptionBatcher(window=0.05))
+        try:
+            short = await main.run_transcription(clip(2), fake_engine, "fast")
+            long = await main.run_transcription(clip(31), fake_engine, "fast")
+            return short, long, main.batcher.batches
+        finally:
+            main.batcher.stop()
+
+    short, long, batches = asyncio.run(scenario())
+    assert short["text"] == "2.0 с" and long["text"] == "31.0 с"
+    assert batches == 1
+    assert [call[0] for call in fake_engine.calls] == ["transcribe_batch", "transcribe", "transcribe"]
+
+
+def test_failed_batch_reports_error_to_every_request(monkeypatch, service):
+    failing = FailingEngine()
+    failing.load("cpu")
+    monkeypatch.setattr(main, "engine", failing)
+
+    results, _ = run_batched([(clip(1), failing, "fast")] * 2, window=0.1)
+
+    assert [result["success"] for result in results] == [False, False]
+    assert all("нехватка памяти" in result["error"] for result in results)
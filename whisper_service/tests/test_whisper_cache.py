@@ -0,0 +1,89 @@
+"""Кэш результатов транскрибации по хэшу содержимого"""
+
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from conftest import FakeEngine, clip, post_transcribe, wav_bytes
+import main
+
+RESULT = {"text": "привет", "language": "ru", "segments": [], "profile": "fast", "model": "fake"}
+
+
+class FailingEngine(FakeEngine):
+    def transcribe(self, audio, **options) -> dict:
+        raise RuntimeError("сбой декодера")
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path, service):
+    """Кэш с дисковым уровнем во временном каталоге"""
+    cache = main.TranscriptionCache(max_entries=2, directory=str(tmp_path))
+    monkeypatch.setattr(main, "transcription_cache", cache)
+    return cache
+
+
+def get_metrics() -> dict:
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return (await client.get("/metrics")).json()
+    return asyncio.run(scenario())
+
+
+def test_repeated_upload_is_served_from_cache(cache, fake_engine):
+    data = wav_bytes(clip(1))
+
+    first = post_transcribe(data, profile="fast")
+    second = post_transcribe(data, profile="fast")
+    other_profile = post_transcribe(data, profile="accurate")
+
+    assert first.json()["cached"] is False and second.json()["cached"] is True
+    assert second.json()["text"] == first.json()["text"]
+    # Профиль входит в ключ: другой профиль распознается заново
+    assert other_profile.json()["cached"] is False
+    assert len(fake_engine.calls) == 2
+    metrics = get_metrics()["cache"]
+    assert (metrics["memory_hits"], metrics["misses"], metrics["stored"]) == (1, 2, 2)
+    assert metrics["hit_rate"] == pytest.approx(1 / 3, abs=1e-3)
+
+
+def test_disk_tier_survives_restart_and_lru_eviction(tmp_path, cache):
+    keys = []
+    for index in range(3):
+        key, missing = cache.lookup(f"аудио {index}".encode(), "fast")
+        assert missing is None
+        cache.store(key, {**RESULT, "text": f"текст {index}"})
+        keys.append(key)
+
+    # В памяти остались две последние записи, первая - только на диске
+    assert list(cache.entries) == keys[1:]
+    assert cache.lookup("аудио 0".encode(), "fast") == (keys[0], {**RESULT, "text": "текст 0"})
+    assert cache.stats["disk_hits"] == 1
+
+    restarted = main.TranscriptionCache(max_entries=2, directory=str(tmp_path))
+    assert restarted.lookup("аудио 2".encode(), "fast")[1]["text"] == "текст 2"
+
+
+def test_corrupted_disk_entry_is_a_miss(tmp_path, cache):
+    key, _ = cache.lookup(b"audio", "fast")
+    path = os.path.join(str(tmp_path), key[:2], f"{key}.json")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w", encoding="utf-8") as cache_file:
+        cache_file.write('{"text": "обрыв')
+
+    assert cache.lookup(b"audio", "fast") == (key, None)
+    assert cache.stats["disk_hits"] == 0
+
+
+def test_failed_transcription_is_not_cached(monkeypatch, cache):
+    failing = FailingEngine()
+    failing.load("cpu")
+    monkeypatch.setattr(main, "engine", failing)
+
+    response = post_transcribe(wav_bytes(clip(1)), profile="fast")
+
+    assert response.status_code == 500
+    assert cache.stats["stored"] == 0 and not cache.entries
+    assert not any(files for _, _, files in os.walk(cache.directory))
@@ -0,0 +1,127 @@
+"""Режим CPU: int8 квантизация, потоки torch и прогрев перед готовностью"""
+
+import asyncio
+
+import httpx
+import pytest
+import torch
+
+from conftest import FakeEngine, clip
+import main
+
+
+class FailingEngine(FakeEngine):
+    def transcribe(self, audio, **options) -> dict:
+        raise RuntimeError("нехватка памяти")
+
+
+@pytest.fixture
+def torch_threads():
+    """Число потоков torch восстанавливается после теста"""
+    threads = torch.get_num_threads()
+    yield
+    torch.set_num_threads(threads)
+
+
+@pytest.fixture
+def startup(monkeypatch, service, torch_threads):
+    """Запуск startup_event с подменой загрузки модели; возвращает (результат /health, движок)"""
+    monkeypatch.setattr(main, "PROCESS_WORKERS", 0)
+    monkeypatch.setattr(main, "model_ready", False)
+    monkeypatch.setattr(main, "engine", None)
+    monkeypatch.setattr(main, "transcription_jobs", main.JobQueue(main.run_transcription_job, 1, 1, 60))
+
+    def run(loaded, loads: bool = True):
+        def load_whisper_model():
+            if loads:
+                main.engine = loaded
+            return loads
+
+        monkeypatch.setattr(main, "load_whisper_model", load_whisper_model)
+
+        async def scenario():
+            await main.startup_event()
+            try:
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                    return (await client.get("/health")).json()
+            finally:
+                await main.shutdown_event()
+                if main.batcher is not None:
+                    main.batcher.stop()
+
+        return asyncio.run(scenario())
+
+    return run
+
+
+def test_quantized_engine_keeps_transcribing(monkeypatch, service, tiny_whisper):
+    monkeypatch.setattr(main, "WHISPER_QUANTIZE", True)
+    loaded = main.create_engine("openai", "tiny")
+    loaded.load("cpu")
+
+    main.quantize_engine(loaded)
+    result = loaded.transcribe(clip(1), **main.decode_options("fast"))
+
+    assert loaded.quantized
+    dynamic = [module for module in loaded.model.modules() if isinstance(module, torch.ao.nn.quantized.dynamic.Linear)]
+    assert dynamic and not any(type(module) is torch.nn.Linear for module in loaded.model.modules())
+    assert set(result) == {"text", "language", "segments"}
+
+
+def test_quantization_is_skipped_where_unsupported(monkeypatch, service, tiny_whisper):
+    monkeypatch.setattr(main, "WHISPER_QUANTIZE", True)
+    gpu = main.create_engine("openai", "tiny")
+    gpu.load("cpu")
+    gpu.device = "cuda"
+    ctranslate2 = main.create_engine("ctranslate2", "tiny")
+
+    main.quantize_engine(gpu)
+    main.quantize_engine(ctranslate2)
+
+    assert not gpu.quantized and not ctranslate2.quantized
+    assert not any(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in gpu.model.modules())
+
+
+def test_torch_threads_split_cores_between_workers(monkeypatch, torch_threads):
+    monkeypatch.setattr(main, "TORCH_THREADS", 0)
+    monkeypatch.setattr(main.os, "cpu_count", lambda: 8)
+
+    main.configure_torch_threads()
+    assert torch.get_num_threads() == 8 // main.TRANSCRIBE_WORKERS
+
+    # Повторная настройка после начала параллельной работы не падает
+    monkeypatch.setattr(main, "TORCH_THREADS", 1)
+    main.configure_torch_threads()
+    assert torch.get_num_threads() == 1
+
+
+def test_service_is_ready_only_after_warm_up(monkeypatch, startup):
+    monkeypatch.setattr(main, "WARMUP_ENABLED", True)
+    loaded = FakeEngine()
+    loaded.load("cpu")
+
+    health = startup(loaded)
+
+    assert health["status"] == "healthy" and health["model_loaded"]
+    warm_up = [call for call in loaded.calls if call[0] == "transcribe"]
+    assert [call[1] for call in warm_up] == [main.WARMUP_SECONDS * main.SAMPLE_RATE] * len(main.DECODING_PROFILES)
+    assert [call[2]["beam_size"] for call in warm_up] == [
+        profile["beam_size"] for profile in main.DECODING_PROFILES.values()
+    ]
+
+
+def test_failed_warm_up_does_not_block_startup(monkeypatch, startup):
+    monkeypatch.setattr(main, "WARMUP_ENABLED", True)
+    failing = FailingEngine()
+    failing.load("cpu")
+
+    assert startup(failing)["status"] == "healthy"
+
+
+def test_failed_model_load_keeps_service_loading(monkeypatch, startup):
+    monkeypatch.setattr(main, "WARMUP_ENABLED", True)
+
+    health = startup(None, loads=False)
+
+    assert health["status"] == "loading" and not health["model_loaded"]
+    assert main.model_ready is False
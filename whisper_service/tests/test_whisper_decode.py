@@ -0,0 +1,88 @@
+"""Декодирование загруженного аудио в памяти, без временных файлов"""
+
+import io
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+from conftest import clip, post_transcribe, wav_bytes
+import main
+
+av = pytest.importorskip("av")
+
+
+def ogg_opus_bytes(seconds: float, sample_rate: int = 48000) -> bytes:
+    """Голосовое сообщение как в Telegram: OGG/Opus, 48 кГц, моно"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    audio = (0.1 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format="ogg") as container:
+        stream = container.add_stream("libopus", rate=sample_rate)
+        stream.layout = "mono"
+        frame = av.AudioFrame.from_ndarray(audio.reshape(1, -1), format="flt", layout="mono")
+        frame.sample_rate = sample_rate
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def no_temp_files(monkeypatch):
+    """Любая попытка создать временный файл проваливает тест"""
+    def forbidden(*args, **kwargs):
+        raise AssertionError("декодирование не должно создавать временные файлы")
+
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", forbidden)
+    monkeypatch.setattr(tempfile, "mkstemp", forbidden)
+
+
+def test_pyav_decodes_ogg_opus_to_16khz_float32(no_temp_files):
+    audio = main.decode_audio(ogg_opus_bytes(2.0), "pyav")
+
+    assert audio.dtype == np.float32 and audio.ndim == 1
+    assert abs(len(audio) - 2 * main.SAMPLE_RATE) < main.SAMPLE_RATE * 0.05
+    # Синусоида с амплитудой 0.1 пережила кодек и ресемплинг
+    assert 0.05 < np.abs(audio).max() < 0.2
+
+
+def test_pyav_resamples_wav_with_other_rate(no_temp_files):
+    audio = main.decode_audio(wav_bytes(clip(1.0), sample_rate=main.SAMPLE_RATE), "pyav")
+    resampled = main.decode_audio(wav_bytes(np.zeros(44100, np.float32), sample_rate=44100), "pyav")
+
+    assert len(audio) == main.SAMPLE_RATE
+    np.testing.assert_allclose(audio, clip(1.0), atol=1e-3)
+    assert abs(len(resampled) - main.SAMPLE_RATE) < 200
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="нужен ffmpeg")
+def test_ffmpeg_pipe_matches_pyav(no_temp_files):
+    data = ogg_opus_bytes(1.0)
+
+    piped = main.decode_audio(data, "ffmpeg")
+    native = main.decode_audio(data, "pyav")
+
+    assert abs(len(piped) - len(native)) < main.SAMPLE_RATE * 0.05
+
+
+def test_corrupted_upload_is_rejected_with_400(monkeypatch, service, fake_engine, no_temp_files):
+    with pytest.raises(main.AudioDecodeError):
+        main.decode_audio(b"not an audio file", "pyav")
+
+    response = post_transcribe(b"not an audio file")
+
+    assert response.status_code == 400
+    assert "Не удалось декодировать аудио" in response.json()["detail"]
+    assert fake_engine.calls == []
+
+
+def test_voice_note_goes_to_engine_as_array(service, fake_engine, no_temp_files):
+    response = post_transcribe(ogg_opus_bytes(1.0), profile="fast")
+
+    assert response.status_code == 200
+    assert response.json()["text"] == "1.0 с"
+    kind, samples, _ = fake_engine.calls[0]
+    assert kind == "transcribe" and abs(samples - main.SAMPLE_RATE) < main.SAMPLE_RATE * 0.05
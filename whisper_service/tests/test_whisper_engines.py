@@ -0,0 +1,86 @@
+"""Движки распознавания: openai-whisper и CTranslate2 за общим интерфейсом"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import clip, post_transcribe, wav_bytes
+import main
+
+
+class FakeWhisperModel:
+    """Вместо faster_whisper.WhisperModel: сегменты по секунде аудио, генерируются лениво"""
+
+    def __init__(self):
+        self.options = None
+
+    def transcribe(self, audio, **options):
+        self.options = options
+        seconds = int(len(audio) / main.SAMPLE_RATE)
+        segments = (
+            SimpleNamespace(start=float(second), end=float(second + 1), text=f" слово {second} ")
+            for second in range(seconds)
+        )
+        return segments, SimpleNamespace(language="ru")
+
+
+def test_openai_engine_transcribes_with_tiny_model(tiny_whisper):
+    loaded = main.create_engine("openai", "tiny")
+    loaded.load("cpu")
+
+    result = loaded.transcribe(clip(2), **main.decode_options("fast"))
+    batch = loaded.transcribe_batch([clip(1), clip(2)], **main.decode_options("fast"))
+
+    assert isinstance(loaded, main.OpenAIWhisperEngine)
+    assert set(result) == {"text", "language", "segments"}
+    assert result["language"] == "ru"
+    assert result["text"] == result["text"].strip()
+    assert len(batch) == 2
+    assert all(set(item) == {"text", "language", "segments"} for item in batch)
+
+
+def test_ctranslate2_engine_collects_lazy_segments():
+    loaded = main.create_engine("ctranslate2", "tiny")
+    loaded.model = FakeWhisperModel()
+
+    result = loaded.transcribe(clip(2), **main.decode_options("accurate"))
+
+    assert result == {
+        "text": "слово 0 слово 1",
+        "language": "ru",
+        "segments": [{"start": 0.0, "end": 1.0, "text": "слово 0"}, {"start": 1.0, "end": 2.0, "text": "слово 1"}],
+    }
+    assert loaded.model.options["task"] == "transcribe"
+    assert list(loaded.iter_segments(clip(1))) == [{"start": 0.0, "end": 1.0, "text": "слово 0"}]
+
+
+def test_transcribe_response_schema_is_the_same_for_both_engines(monkeypatch, service, tiny_whisper):
+    openai_engine = main.create_engine("openai", "tiny")
+    openai_engine.load("cpu")
+    ctranslate2_engine = main.create_engine("ctranslate2", "tiny")
+    ctranslate2_engine.model = FakeWhisperModel()
+
+    responses = []
+    for loaded in (openai_engine, ctranslate2_engine):
+        monkeypatch.setattr(main, "engine", loaded)
+        responses.append(post_transcribe(wav_bytes(clip(2))))
+
+    assert [response.status_code for response in responses] == [200, 200]
+    openai_body, ctranslate2_body = (response.json() for response in responses)
+    assert set(openai_body) == set(ctranslate2_body)
+    assert ctranslate2_body["text"] == "слово 0 слово 1"
+    assert ctranslate2_body["segments_count"] == 2
+    assert ctranslate2_body["model"] == "tiny" and ctranslate2_body["cached"] is False
+
+
+def test_unknown_engine_is_rejected(monkeypatch, service):
+    with pytest.raises(ValueError, match="Неизвестный движок Whisper"):
+        main.create_engine("onnx", "tiny")
+
+    monkeypatch.setattr(main, "engine", None)
+    monkeypatch.setattr(main, "ENGINES", {})  # Движок из WHISPER_ENGINE не зарегистрирован
+    assert main.load_whisper_model() is False
+    assert main.engine is None
+
+    response = post_transcribe(wav_bytes(clip(1)))
+    assert response.status_code == 503
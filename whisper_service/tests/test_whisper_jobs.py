@@ -0,0 +1,136 @@
+"""Очередь задач транскрибации: POST /jobs/transcribe и GET /jobs/{job_id}"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from conftest import clip, wav_bytes
+import main
+
+
+@pytest.fixture
+def jobs(monkeypatch, fake_engine):
+    """Очередь на одну задачу с одним исполнителем; транскрибация ждет события state["release"]"""
+    state = {"release": None}
+
+    async def transcribe_upload(audio_data: bytes, profile: str) -> dict:
+        await state["release"].wait()
+        return {"text": audio_data.decode(), "profile": profile}
+
+    monkeypatch.setattr(main, "transcribe_upload", transcribe_upload)
+    queue = main.JobQueue(main.run_transcription_job, max_queued=1, workers=1, ttl=60, default_duration=30.0)
+    monkeypatch.setattr(main, "transcription_jobs", queue)
+    return queue, state
+
+
+async def submit(client: httpx.AsyncClient, text: str) -> httpx.Response:
+    return await client.post("/jobs/transcribe", files={"file": ("voice.ogg", text.encode(), "audio/ogg")})
+
+
+def test_job_completes_through_long_poll(jobs):
+    queue, state = jobs
+
+    async def scenario():
+        state["release"] = asyncio.Event()
+        queue.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                accepted = await submit(client, "привет")
+                asyncio.get_running_loop().call_later(0.1, state["release"].set)
+                finished = await client.get(f"/jobs/{accepted.json()['job_id']}", params={"wait": 5})
+                missing = await client.get("/jobs/unknown")
+                return accepted, finished, missing
+        finally:
+            queue.stop()
+
+    accepted, finished, missing = asyncio.run(scenario())
+    assert accepted.status_code == 202
+    assert finished.json()["status"] == "done"
+    assert finished.json()["result"] == {"text": "привет", "profile": main.DEFAULT_DECODING_PROFILE}
+    assert missing.status_code == 404
+
+
+def test_full_job_queue_returns_503_with_retry_after(jobs):
+    queue, state = jobs
+
+    async def scenario():
+        state["release"] = asyncio.Event()
+        queue.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                running = await submit(client, "первая")
+                await asyncio.sleep(0.05)  # Первая задача у исполнителя
+                queued = await submit(client, "вторая")
+                rejected = await submit(client, "третья")
+                state["release"].set()
+                return running, queued, rejected
+        finally:
+            queue.stop()
+
+    running, queued, rejected = asyncio.run(scenario())
+    assert running.status_code == 202 and queued.status_code == 202
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "30"
+    assert "Очередь транскрибации заполнена" in rejected.json()["detail"]
+
+
+async def stream(client: httpx.AsyncClient, data: bytes) -> httpx.Response:
+    return await client.post("/transcribe_stream", files={"file": ("voice.ogg", data, "audio/ogg")})
+
+
+def test_full_job_queue_refuses_streaming(jobs, service):
+    queue, state = jobs
+
+    async def scenario():
+        state["release"] = asyncio.Event()
+        queue.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                await submit(client, "первая")
+                await asyncio.sleep(0.05)  # Первая задача у исполнителя
+                await submit(client, "вторая")
+                rejected = await stream(client, wav_bytes(clip(1)))
+                state["release"].set()
+                return rejected
+        finally:
+            queue.stop()
+
+    rejected = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "30"
+    assert "Очередь транскрибации заполнена" in rejected.json()["detail"]
+
+
+def test_stream_holds_a_queue_place_until_finished(monkeypatch, jobs, service, fake_engine):
+    queue, _ = jobs
+    depths = []
+    transcribe = fake_engine.transcribe
+
+    def recording_transcribe(audio, **options):
+        depths.append(queue.depth)
+        return transcribe(audio, **options)
+
+    monkeypatch.setattr(fake_engine, "transcribe", recording_transcribe)
+
+    async def scenario():
+        queue.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                streamed = await stream(client, wav_bytes(clip(1)))
+                corrupted = await stream(client, b"not an audio file")
+                accepted = await submit(client, "задача")
+                return streamed, corrupted, accepted
+        finally:
+            queue.stop()
+
+    streamed, corrupted, accepted = asyncio.run(scenario())
+    # Во время распознавания поток занимает единственное место в очереди
+    assert depths == [1]
+    lines = [json.loads(line) for line in streamed.text.splitlines() if line]
+    assert lines[-1]["type"] == "done" and lines[-1]["text"] == "1.0 с"
+    # После выдачи и после ошибки декодирования место освобождено
+    assert corrupted.status_code == 400
+    assert accepted.status_code == 202
+    assert queue.reserved == 0
@@ -0,0 +1,120 @@
+"""Пул процессов Whisper и батчер поверх него"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+import torch
+
+from conftest import FakeEngine, clip
+import main
+
+WEIGHTS_MB = 64
+
+
+class CrashingEngine(FakeEngine):
+    """Движок, процесс которого аварийно завершается при транскрибации"""
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        os._exit(1)
+
+
+class WeightedEngine(FakeEngine):
+    """Движок с "весами" - массивом, который воркеры только читают"""
+
+    supports_process_pool = True
+
+    def load(self, device: str):
+        super().load(device)
+        self.weights = np.ones(WEIGHTS_MB * 1024 * 1024 // 8)
+
+    def transcribe(self, audio, **options) -> dict:
+        self.weights.sum()
+        return super().transcribe(audio, **options)
+
+
+@pytest.fixture
+def fork_ready(monkeypatch):
+    """Однопоточный torch и свой пул потоков: после теста в процессе не остается потоков"""
+    threads = torch.get_num_threads()
+    pool = ThreadPoolExecutor(max_workers=main.TRANSCRIBE_WORKERS)
+    monkeypatch.setattr(main, "executor", pool)
+    monkeypatch.setattr(main, "WARMUP_ENABLED", False)
+    monkeypatch.setattr(main, "device", "cpu")
+    main.prepare_fork()
+    yield
+    main.stop_process_pool()
+    pool.shutdown(wait=True)
+    torch.set_num_threads(threads)
+
+
+def test_batch_waiters_fail_when_worker_process_dies(monkeypatch, fork_ready):
+    crashing = CrashingEngine()
+    monkeypatch.setattr(main, "engine", crashing)
+    pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork"))
+    monkeypatch.setattr(main, "process_pool", pool)
+
+    async def scenario():
+        batcher = main.TranscriptionBatcher(window=0.05, concurrency=1)
+        try:
+            failed = await asyncio.wait_for(asyncio.gather(
+                *(batcher.submit(clip(1), crashing, "fast") for _ in range(3)),
+                return_exceptions=True
+            ), timeout=30)
+            # Сломанный пул отключен, общий слот батчера освобожден: следующий батч - в потоках
+            healthy = FakeEngine("healthy")
+            recovered = await asyncio.wait_for(batcher.submit(clip(1), healthy, "fast"), timeout=10)
+            return failed, recovered
+        finally:
+            batcher.stop()
+
+    failed, recovered = asyncio.run(scenario())
+
+    assert len(failed) == 3
+    assert all(isinstance(result, BrokenProcessPool) for result in failed)
+    assert main.process_pool is None
+    assert recovered["success"] and recovered["text"] == "1.0 с"
+
+
+def test_process_pool_not_started_when_other_threads_run(monkeypatch, fork_ready):
+    loaded = WeightedEngine()
+    loaded.load("cpu")
+    monkeypatch.setattr(main, "engine", loaded)
+    monkeypatch.setattr(main, "small_engine", None)
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait, name="чужой поток")
+    thread.start()
+    try:
+        assert main.start_process_pool(2) is None
+    finally:
+        stop.set()
+        thread.join()
+    assert main.process_pool is None
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="нужен Linux с /proc/<pid>/smaps_rollup")
+def test_process_pool_workers_share_model_weights(monkeypatch, fork_ready):
+    loaded = WeightedEngine()
+    loaded.load("cpu")
+    monkeypatch.setattr(main, "engine", loaded)
+    monkeypatch.setattr(main, "small_engine", None)
+
+    assert main.start_process_pool(2) is not None
+
+    async def transcribe_all():
+        return await asyncio.gather(*(main.run_inference(clip(1), loaded, "fast") for _ in range(4)))
+
+    results = asyncio.run(transcribe_all())
+    assert all(result["success"] for result in results)
+
+    memory = main.worker_memory()
+    assert len(memory) == 2
+    for worker in memory:
+        # Веса учтены в RSS каждого воркера, но в PSS - только долей на три процесса
+        assert worker["rss_mb"] >= WEIGHTS_MB
+        assert worker["rss_mb"] - worker["pss_mb"] >= WEIGHTS_MB / 2
@@ -0,0 +1,78 @@
+"""Профили декодирования и маршрутизация коротких клипов на малую модель"""
+
+import pytest
+
+from conftest import FakeEngine, build_tiny_whisper, clip, post_transcribe, wav_bytes
+import main
+
+
+@pytest.fixture
+def small_engine(monkeypatch, fake_engine):
+    """Малая модель рядом с основной"""
+    loaded = FakeEngine("small")
+    loaded.load("cpu")
+    monkeypatch.setattr(main, "small_engine", loaded)
+    return loaded
+
+
+def test_auto_route_depends_on_duration(small_engine, fake_engine):
+    assert main.select_route(2, "auto") == (small_engine, "fast")
+    assert main.select_route(main.SMALL_MODEL_MAX_SECONDS + 1, "auto") == (fake_engine, "fast")
+    assert main.select_route(main.FAST_PROFILE_MAX_SECONDS + 1, "auto") == (fake_engine, "accurate")
+    # Явный профиль всегда идет на основную модель
+    assert main.select_route(2, "accurate") == (fake_engine, "accurate")
+
+
+def test_profiles_set_beam_search(service, tiny_whisper):
+    loaded = main.create_engine("openai", "tiny")
+    assert main.decode_options("fast")["beam_size"] == 1
+    assert main.decode_options("accurate")["beam_size"] == 5
+    # Жадный поиск в openai-whisper задается beam_size=None
+    assert loaded._normalize_options(main.decode_options("fast"))["beam_size"] is None
+    assert loaded._normalize_options(main.decode_options("accurate"))["beam_size"] == 5
+
+
+def test_response_reports_profile_and_model(service, small_engine, fake_engine):
+    short = post_transcribe(wav_bytes(clip(2)), profile="auto")
+    long = post_transcribe(wav_bytes(clip(12)), profile="auto")
+    forced = post_transcribe(wav_bytes(clip(2)), profile="accurate")
+
+    assert (short.json()["model"], short.json()["profile"]) == ("small", "fast")
+    assert (long.json()["model"], long.json()["profile"]) == ("fake", "accurate")
+    assert (forced.json()["model"], forced.json()["profile"]) == ("fake", "accurate")
+    assert [call[2]["beam_size"] for call in small_engine.calls] == [1]
+    assert [call[2]["beam_size"] for call in fake_engine.calls] == [5, 5]
+
+
+def test_unknown_profile_is_rejected(service, fake_engine):
+    response = post_transcribe(wav_bytes(clip(1)), profile="turbo")
+
+    assert response.status_code == 400
+    assert "Неизвестный профиль декодирования" in response.json()["detail"]
+    assert fake_engine.calls == []
+
+
+def test_both_models_stay_loaded(monkeypatch, service, tiny_whisper):
+    monkeypatch.setattr(main, "engine", None)
+    monkeypatch.setattr(main, "WHISPER_SMALL_MODEL", "base")
+    monkeypatch.setattr(main, "WHISPER_QUANTIZE", False)
+
+    assert main.load_whisper_model() is True
+    assert main.engine.model is not None and main.small_engine.model is not None
+    assert main.small_engine.model_name == "base"
+
+
+def test_main_model_serves_when_small_model_fails(monkeypatch, service, tiny_whisper):
+    def load_model(name, device=None):
+        if name == "base":
+            raise RuntimeError("нет весов малой модели")
+        return build_tiny_whisper()
+
+    monkeypatch.setattr(main.whisper, "load_model", load_model)
+    monkeypatch.setattr(main, "engine", None)
+    monkeypatch.setattr(main, "WHISPER_SMALL_MODEL", "base")
+    monkeypatch.setattr(main, "WHISPER_QUANTIZE", False)
+
+    assert main.load_whisper_model() is True
+    assert main.engine is not None and main.small_engine is None
+    assert main.select_route(2, "auto") == (main.engine, "fast")
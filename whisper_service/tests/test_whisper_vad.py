@@ -0,0 +1,109 @@
+"""Детектор речи и параллельная транскрибация длинных записей по фрагментам"""
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from conftest import FakeEngine, clip
+import main
+
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * main.SAMPLE_RATE), np.float32)
+
+
+def seconds(samples: int) -> float:
+    return samples / main.SAMPLE_RATE
+
+
+class SlowEngine(FakeEngine):
+    """Движок, считающий число одновременных транскрибаций"""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def transcribe(self, audio, **options) -> dict:
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.2)
+        with self.lock:
+            self.active -= 1
+        return super().transcribe(audio, **options)
+
+
+class FailingEngine(FakeEngine):
+    """Движок, падающий на фрагментах длиннее двух секунд"""
+
+    def transcribe(self, audio, **options) -> dict:
+        if len(audio) > 2 * main.SAMPLE_RATE:
+            raise RuntimeError("сбой декодера")
+        return super().transcribe(audio, **options)
+
+
+def test_speech_regions_skip_long_pauses():
+    audio = np.concatenate([silence(1), clip(2), silence(3), clip(1), silence(0.3), clip(1), silence(1)])
+
+    regions = [(round(seconds(start), 1), round(seconds(end), 1)) for start, end in main.detect_speech(audio)]
+
+    # Пауза 0.3 с короче VAD_MIN_SILENCE_MS и не разрывает речь; края расширены на VAD_PADDING_MS
+    assert regions == [(0.8, 3.2), (5.8, 8.5)]
+    assert main.detect_speech(silence(5)) == []
+
+
+def test_long_speech_is_split_into_window_sized_chunks():
+    audio = clip(70)
+    chunks = main.split_into_chunks(audio, [(0, len(audio))])
+
+    assert [round(seconds(offset)) for offset, _ in chunks] == [0, 30, 60]
+    assert [round(seconds(len(chunk))) for _, chunk in chunks] == [30, 30, 10]
+
+    # Короткие соседние участки объединяются, пока помещаются в лимит
+    merged = main.split_into_chunks(audio, [(0, 16000), (32000, 48000), (40 * 16000, 41 * 16000)])
+    assert [(offset, len(chunk)) for offset, chunk in merged] == [(0, 48000), (640000, 16000)]
+
+
+def test_long_recording_is_stitched_in_order(service, fake_engine):
+    audio = np.concatenate([clip(2), silence(40), clip(3), silence(5)])
+
+    result = asyncio.run(main.transcribe_long_audio(audio, fake_engine, "accurate"))
+
+    assert result["success"]
+    assert result["text"] == "2.2 с 3.4 с"
+    assert [(round(segment["start"], 1), round(segment["end"], 1)) for segment in result["segments"]] == [
+        (0.0, 2.2), (41.8, 45.2)
+    ]
+    # Тишина не попала в движок
+    assert sum(samples for _, samples, _ in fake_engine.calls) < 6 * main.SAMPLE_RATE
+
+
+def test_chunks_are_transcribed_in_parallel(monkeypatch, service):
+    slow = SlowEngine()
+    slow.load("cpu")
+    monkeypatch.setattr(main, "engine", slow)
+    # Паузы длиннее окна: каждый участок речи - отдельный фрагмент
+    audio = np.concatenate([clip(1), silence(31), clip(1), silence(31), clip(1)])
+
+    result = asyncio.run(main.transcribe_long_audio(audio, slow, "fast"))
+
+    assert result["success"] and len(result["segments"]) == 3
+    starts = [segment["start"] for segment in result["segments"]]
+    assert starts == sorted(starts)
+    assert slow.max_active == main.TRANSCRIBE_WORKERS
+
+
+def test_failed_chunk_fails_the_recording(monkeypatch, service):
+    failing = FailingEngine()
+    failing.load("cpu")
+    monkeypatch.setattr(main, "engine", failing)
+    audio = np.concatenate([clip(1), silence(40), clip(3)])
+
+    result = asyncio.run(main.transcribe_long_audio(audio, failing, "fast"))
+
+    assert result["success"] is False
+    assert "сбой декодера" in result["error"]